@@ -0,0 +1,307 @@
+"""
+Admission control for fal.ai edits
+A per-user token bucket and a global concurrency limit, both kept in a local
+SQLite file so every gunicorn worker on the instance sees the same state
+"""
+
+import math
+import os
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from sqlite_cache import CACHE_DIR, open_sqlite
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+# Per-user token bucket: sustained edits per minute and burst size
+ADMISSION_USER_RATE = float(os.getenv('ADMISSION_USER_RATE', 10))
+ADMISSION_USER_BURST = float(os.getenv('ADMISSION_USER_BURST', 5))
+
+# Edits running against fal at once, across all workers
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', 8))
+
+# Longest a request may queue for admission (seconds); background jobs may wait longer
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', 10))
+ADMISSION_JOB_MAX_WAIT = float(os.getenv('ADMISSION_JOB_MAX_WAIT', 300))
+
+# A slot not renewed for this long is assumed to belong to a dead worker
+# (live workers renew the slots they hold every third of the lease)
+ADMISSION_SLOT_LEASE = float(os.getenv('ADMISSION_SLOT_LEASE', 300))
+
+# Retry-After sent when the global limit is saturated
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 5))
+
+_POLL_INTERVAL = 0.1
+
+
+class AdmissionRejected(Exception):
+    """Raised when an edit cannot be admitted within the allowed wait"""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Rate limiting and concurrency limiting for fal.ai edits
+
+    Users get a token bucket refilled at rate_per_minute up to burst; one
+    token is spent per edit. Independently, at most max_concurrent edits hold
+    a slot at any time. Both wait up to max_wait for capacity, then reject
+    with 429 (rate limit) or 503 (saturated) and a Retry-After hint.
+
+    Slots are leases: a background thread renews the ones this worker holds,
+    so a long edit keeps its slot while one from a dead worker expires.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float = ADMISSION_USER_RATE,
+        burst: float = ADMISSION_USER_BURST,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        max_wait: float = ADMISSION_MAX_WAIT,
+        slot_lease: float = ADMISSION_SLOT_LEASE,
+        path: Optional[str] = None
+    ):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.slot_lease = slot_lease
+        self.path = path or os.path.join(CACHE_DIR, 'admission.sqlite3')
+        self._local = threading.local()
+        self._counters_lock = threading.Lock()
+        self._counters = {'admitted': 0, 'rate_limited': 0, 'saturated': 0, 'waited': 0}
+        self._held = set()
+        self._held_lock = threading.Lock()
+        self._renewer = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS token_buckets (
+                user_id TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS concurrency_slots (
+                slot_id TEXT PRIMARY KEY,
+                pid INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = open_sqlite(self.path)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, counter: str):
+        with self._counters_lock:
+            self._counters[counter] += 1
+
+    def _take_token(self, user_id: str) -> float:
+        """Spend one token; return 0 on success or the seconds until one is available"""
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM token_buckets WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            tokens = self.burst if row is None else min(
+                self.burst, row[0] + (now - row[1]) * self.rate_per_second
+            )
+
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate_per_second
+
+            conn.execute("""
+                INSERT INTO token_buckets (user_id, tokens, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+            """, (user_id, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def _take_slot(self) -> Optional[str]:
+        """Claim a concurrency slot; return its id, or None if all are taken"""
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM concurrency_slots WHERE expires_at < ?", (now,))
+            in_use = conn.execute("SELECT COUNT(*) FROM concurrency_slots").fetchone()[0]
+            slot_id = None
+            if in_use < self.max_concurrent:
+                slot_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO concurrency_slots (slot_id, pid, expires_at) VALUES (?, ?, ?)",
+                    (slot_id, os.getpid(), now + self.slot_lease)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return slot_id
+
+    def _renew_slots(self):
+        """Extend the leases of the slots this worker holds"""
+        with self._held_lock:
+            held = list(self._held)
+        if held:
+            placeholders = ', '.join('?' * len(held))
+            self._connection().execute(
+                f"UPDATE concurrency_slots SET expires_at = ? WHERE slot_id IN ({placeholders})",
+                [time.time() + self.slot_lease] + held
+            )
+
+    def _renew_loop(self):
+        while True:
+            time.sleep(self.slot_lease / 3)
+            try:
+                self._renew_slots()
+            except Exception as e:
+                logger.error(f"Failed to renew concurrency slots: {str(e)}")
+
+    def _start_renewer(self):
+        if self._renewer is not None:
+            return
+        with self._held_lock:
+            if self._renewer is not None:
+                return
+            self._renewer = threading.Thread(target=self._renew_loop, name='admission-renew', daemon=True)
+            self._renewer.start()
+
+    def _release_slot(self, slot_id: str):
+        with self._held_lock:
+            self._held.discard(slot_id)
+        try:
+            self._connection().execute("DELETE FROM concurrency_slots WHERE slot_id = ?", (slot_id,))
+        except Exception as e:
+            # The lease expiry reclaims it eventually
+            logger.error(f"Failed to release concurrency slot {slot_id}: {str(e)}")
+
+    def check_rate(self, user_id: str, max_wait: Optional[float] = None):
+        """
+        Spend one of the user's tokens, waiting up to max_wait for a refill
+
+        Raises:
+            AdmissionRejected: 429 when the bucket will not refill in time
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        wait = self._take_token(user_id)
+        if wait == 0:
+            return
+
+        if wait > max_wait:
+            self._count('rate_limited')
+            raise AdmissionRejected(
+                f'Rate limit exceeded for user {user_id}',
+                status_code=429,
+                retry_after=math.ceil(wait)
+            )
+
+        self._count('waited')
+        time.sleep(wait)
+        wait = self._take_token(user_id)
+        if wait:
+            # Another worker took the refilled token first
+            self._count('rate_limited')
+            raise AdmissionRejected(
+                f'Rate limit exceeded for user {user_id}',
+                status_code=429,
+                retry_after=math.ceil(wait)
+            )
+
+    @contextmanager
+    def slot(self, max_wait: Optional[float] = None):
+        """
+        Hold one of the global concurrency slots for the duration of the block
+
+        Raises:
+            AdmissionRejected: 503 when no slot frees up within max_wait
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+
+        slot_id = self._take_slot()
+        if slot_id is None:
+            self._count('waited')
+        while slot_id is None:
+            if time.monotonic() >= deadline:
+                self._count('saturated')
+                raise AdmissionRejected(
+                    'Too many image edits in progress, please retry shortly',
+                    status_code=503,
+                    retry_after=ADMISSION_RETRY_AFTER
+                )
+            time.sleep(_POLL_INTERVAL)
+            slot_id = self._take_slot()
+
+        self._count('admitted')
+        with self._held_lock:
+            self._held.add(slot_id)
+        self._start_renewer()
+        try:
+            yield
+        finally:
+            self._release_slot(slot_id)
+
+    @contextmanager
+    def admit(self, user_id: Optional[str] = None, max_wait: Optional[float] = None):
+        """Rate-limit user_id (when given), then hold a concurrency slot"""
+        if user_id:
+            self.check_rate(user_id, max_wait)
+        with self.slot(max_wait):
+            yield
+
+    def stats(self) -> Dict:
+        """Slots in use across workers and this worker's admission counters"""
+        try:
+            in_use = self._connection().execute(
+                "SELECT COUNT(*) FROM concurrency_slots WHERE expires_at >= ?", (time.time(),)
+            ).fetchone()[0]
+        except Exception as e:
+            in_use = f'error: {str(e)}'
+
+        with self._counters_lock:
+            counters = dict(self._counters)
+
+        return {
+            'slots_in_use': in_use,
+            'max_concurrent': self.max_concurrent,
+            'user_rate_per_minute': self.rate_per_second * 60,
+            'user_burst': self.burst,
+            'max_wait_seconds': self.max_wait,
+            'worker_counters': counters
+        }
+
+
+# Singleton instance
+_admission_controller = None
+
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    """Get or create the admission controller singleton (None when disabled)"""
+    global _admission_controller
+    if _admission_controller is None and ADMISSION_ENABLED:
+        _admission_controller = AdmissionController()
+    return _admission_controller
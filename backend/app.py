@@ -1,19 +1,68 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+from werkzeug.middleware.proxy_fix import ProxyFix
+from contextlib import closing
 from datetime import datetime
 import logging
 import json
-import base64
 import os
+import queue
+import threading
+from pathlib import Path
 from dotenv import load_dotenv
 from fal_service import get_fal_service
-from db import save_pinterest_credentials, get_pinterest_credentials
-from pinterest_service import PinterestService, get_pinterest_status
+from admission import AdmissionRejected, ADMISSION_JOB_MAX_WAIT, get_admission_controller
+from resilience import CircuitOpenError
+from edit_jobs import submit_edit_job, get_job, job_stats
+from image_preprocess import normalize_image
+from blob_store import get_blob_store
+from event_buffer import get_event_buffer
+from webhook_log import get_webhook_log
+from chat_service import get_chat_service
+from data_stream import ITEM_HANDLERS, StreamFormatError, detect_format, process_stream
+from request_logging import log_request
+from response_shaping import FastJSONProvider, record_response_size, response_metrics
+from upload_ingest import (
+    UploadError,
+    save_base64_image,
+    upload_mode,
+    upload_params,
+    has_image,
+    resolve_filename,
+    save_upload,
+    coerce_bool,
+    coerce_int
+)
+from db import save_pinterest_credentials, get_pinterest_credentials, clear_pinterest_mirror, db_pool_stats
+from credential_cache import get_credential_cache
+from login_status import get_login_status_writer
+from pinterest_service import get_service_pool
+from status_cache import get_status_cache
+from board_sync import MirrorNotReady, get_board_sync
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 
+# Proxies (e.g. the App Platform load balancer) in front of the app whose
+# X-Forwarded-For/-Proto are trusted, so request.remote_addr is the client
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 1))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+
+# orjson-backed jsonify that leaves out captured_data unless asked for and honours ?fields=
+app.json = FastJSONProvider(app)
+
+# Upper bounds for /api/upload/batch
+BATCH_MAX_EDITS = int(os.getenv('BATCH_MAX_EDITS', 20))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', 4))
+
+# Upper bound on events in one /api/events/batch request
+EVENTS_BATCH_MAX = int(os.getenv('EVENTS_BATCH_MAX', 1000))
+
+# Seconds between keep-alive comments on idle progress streams
+STREAM_HEARTBEAT_SECONDS = float(os.getenv('STREAM_HEARTBEAT_SECONDS', 15))
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -22,24 +71,162 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def log_request(endpoint_name):
-    """Helper function to log request details and payload"""
-    request_data = {
-        'timestamp': datetime.utcnow().isoformat(),
-        'endpoint': endpoint_name,
-        'method': request.method,
-        'url': request.url,
-        'headers': dict(request.headers),
-        'args': request.args.to_dict(),
-        'json': request.get_json(silent=True),
-        'form': request.form.to_dict(),
-        'remote_addr': request.remote_addr
-    }
+@app.after_request
+def track_response_size(response):
+    """Record per-endpoint response sizes for /api/metrics"""
+    return record_response_size(response)
 
-    logger.info(f"Request captured at {endpoint_name}:")
-    logger.info(json.dumps(request_data, indent=2))
 
-    return request_data
+def request_user_id(data):
+    """
+    Who an edit is rate-limited as: user_id parameter, X-User-Id header or client address
+
+    user_id and X-User-Id are not authenticated: they only separate honest
+    clients, and a caller rotating them gets a fresh bucket each time. Only
+    anonymous callers are limited by their (forwarded) IP address.
+    """
+    return data.get('user_id') or request.headers.get('X-User-Id') or f'ip:{request.remote_addr}'
+
+
+def retry_later_response(error, **extra):
+    """429/503 response with a Retry-After header for a rejected or short-circuited edit"""
+    response = jsonify({
+        'status': 'error',
+        'message': str(error),
+        'retry_after': error.retry_after,
+        **extra
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, error.status_code
+
+
+def mirror_syncing_response(error, **extra):
+    """202 response with a Retry-After header while a user's first board sync runs elsewhere"""
+    response = jsonify({
+        'status': 'syncing',
+        'message': str(error),
+        'retry_after': error.retry_after,
+        **extra
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, error.status_code
+
+
+def format_sse(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def format_ndjson(event, data):
+    """Format one event as a newline-delimited JSON line"""
+    return json.dumps({'event': event, **data}) + '\n'
+
+
+def stream_edit_progress(edit_kwargs, upload, as_ndjson=False):
+    """
+    Run an image edit on a helper thread and stream its progress
+
+    Emits "queued" (queue position), "progress" (model log lines),
+    "completed" and finally "result" or "error" events, as SSE by default
+    or as NDJSON lines.
+    """
+    events = queue.Queue()
+    formatter = format_ndjson if as_ndjson else format_sse
+    # Keep the images from being evicted until the edit has finished
+    blob_hold = get_blob_store().hold({upload.sha256, edit_kwargs['image_digest']})
+
+    def run():
+        try:
+            ai_result = get_fal_service().edit_image(
+                **edit_kwargs,
+                on_progress=lambda event, data: events.put((event, data))
+            )
+            edited_images = ai_result.get('images', [])
+            events.put(('result', {
+                'status': 'success',
+                'message': 'Image uploaded and edited successfully',
+                'upload_id': upload.upload_id,
+                'original_filepath': upload.filepath,
+                'edited_image_url': edited_images[0]['url'] if edited_images else None,
+                'edited_images': edited_images,
+                'seed': ai_result.get('seed'),
+                'prompt': edit_kwargs['prompt']
+            }))
+        except Exception as ai_error:
+            logger.error(f"AI editing failed: {str(ai_error)}")
+            error = {
+                'status': 'partial_success',
+                'message': 'Image uploaded but AI editing failed',
+                'upload_id': upload.upload_id,
+                'original_filepath': upload.filepath,
+                'error': str(ai_error)
+            }
+            if isinstance(ai_error, (AdmissionRejected, CircuitOpenError)):
+                error['retry_after'] = ai_error.retry_after
+            events.put(('error', error))
+        finally:
+            get_blob_store().release(blob_hold)
+
+    def generate():
+        yield formatter('uploaded', {'upload_id': upload.upload_id, 'original_filepath': upload.filepath})
+        while True:
+            try:
+                event, data = events.get(timeout=STREAM_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                # Keep proxies and mobile clients from timing out the idle connection
+                yield '\n' if as_ndjson else ': keep-alive\n\n'
+                continue
+
+            yield formatter(event, data)
+            if event in ('result', 'error'):
+                return
+
+    threading.Thread(target=run, name='edit-stream', daemon=True).start()
+
+    response = Response(generate(), mimetype='application/x-ndjson' if as_ndjson else 'text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def normalize_upload(upload, image_size, options):
+    """
+    Run the pre-upload normalization stage for an edit
+
+    Args:
+        upload: IngestedUpload of the original image
+        image_size: image_size preset of the edit
+        options: Request parameters; honours normalize, normalize_format,
+            normalize_quality and max_dimension
+
+    Returns:
+        dict: image_data / filename / image_digest keyword arguments for edit_image
+    """
+    store = get_blob_store()
+    normalized = normalize_image(
+        upload.filepath,
+        image_size=image_size,
+        enabled=coerce_bool(options['normalize']) if 'normalize' in options else None,
+        output_format=options.get('normalize_format'),
+        quality=coerce_int(options.get('normalize_quality')),
+        max_dimension=coerce_int(options.get('max_dimension')),
+        output_path=store.temp_path()
+    )
+
+    if not normalized.changed:
+        return {
+            'image_data': Path(upload.filepath),
+            'filename': upload.filename,
+            'image_digest': upload.sha256
+        }
+
+    # The normalized variant is content-addressed like any other upload
+    stored = store.put(normalized.filepath, normalized.sha256, normalized.size, f'normalized:{upload.upload_id}')
+    return {
+        'image_data': Path(stored.filepath),
+        'filename': upload.filename,
+        'image_digest': stored.sha256
+    }
 
 
 def process_image(image_data, filename):
@@ -59,20 +246,58 @@ def process_image(image_data, filename):
 
 @app.route('/api/upload', methods=['POST'])
 def upload_base64():
-    """Endpoint 5: Upload and process base64 encoded images with AI editing"""
+    """
+    Endpoint 5: Upload and process images with AI editing
+
+    The image can be sent as:
+    - application/json: {"image": "<base64>", "prompt": "...", ...} (legacy)
+    - multipart/form-data: "image" file field, other parameters as form fields
+    - application/octet-stream or image/*: raw bytes, parameters in the query string
+    - text/plain: base64 text (chunked transfer allowed), parameters in the query string
+
+    Bodies are decoded incrementally straight into the content-addressed
+    upload store (blob_store.py), so memory per upload stays bounded by
+    UPLOAD_CHUNK_SIZE. Pass "upload_id" from an earlier response instead of
+    an image to edit the same original again. Before uploading to fal the image is
+    downscaled to what the image_size preset needs, rotated upright and
+    stripped of EXIF (see image_preprocess.py); send normalize=false,
+    normalize_format, normalize_quality or max_dimension to tune this.
+
+    With ?mode=async the edit runs in the background and the response (202)
+    carries a job id to poll at /api/jobs/<job_id>.
+
+    With ?mode=stream the response is a Server-Sent Events stream of queue
+    position, model logs and the final result (NDJSON lines instead when the
+    client sends Accept: application/x-ndjson).
+
+    Edits are admission-controlled per user ("user_id" parameter or
+    X-User-Id header, falling back to the client address) and globally (see
+    admission.py). Over the limits the response is 429 or 503 with a
+    Retry-After header (503 as well while fal is failing and the circuit
+    breaker is open); the upload_id in it can be used to retry without
+    re-sending the image.
+    """
     request_data = log_request('/api/upload')
 
     try:
-        data = request.get_json()
+        try:
+            mode = upload_mode(request)
+            data = upload_params(request, mode)
+            # Validated before the image is stored, so a bad value costs no upload
+            seed = coerce_int(data.get('seed'))
+        except UploadError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), e.status_code
 
-        if not data or 'image' not in data:
+        if not data.get('upload_id') and not has_image(request, mode, data):
             return jsonify({
                 'status': 'error',
-                'message': 'No image data provided. Please include "image" field with base64 encoded data.'
+                'message': 'No image data provided. Please include "image" field with base64 encoded data, '
+                           'send the image as the request body or pass the "upload_id" of a previous upload.'
             }), 400
 
-        base64_image = data.get('image')
-        filename = data.get('filename', f'image_{datetime.utcnow().timestamp()}.jpg')
         prompt = data.get('prompt')  # Get the prompt for AI editing
 
         if not prompt:
@@ -81,49 +306,107 @@ def upload_base64():
                 'message': 'No prompt provided. Please include "prompt" field for AI image editing.'
             }), 400
 
-        # Remove data URL prefix if present (e.g., "data:image/jpeg;base64,")
-        if ',' in base64_image:
-            base64_image = base64_image.split(',')[1]
+        store = get_blob_store()
+
+        if data.get('upload_id'):
+            # Re-edit an image uploaded earlier without sending it again
+            upload = store.get(data['upload_id'])
+            if upload is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Upload {data["upload_id"]} not found (it may have been evicted)'
+                }), 404
+            filename = upload.filename
+        else:
+            filename = resolve_filename(request, mode, data, f'image_{datetime.utcnow().timestamp()}.jpg')
+
+            # Stream the image into the content-addressed upload store
+            try:
+                upload = save_upload(request, mode, data, store, filename)
+            except UploadError as e:
+                logger.error(f"Failed to ingest image: {str(e)}")
+                return jsonify({
+                    'status': 'error',
+                    'message': str(e)
+                }), e.status_code
+
+        filepath = upload.filepath
+        logger.info(f"Image {upload.upload_id} saved to: {filepath}")
+
+        # Get optional parameters for AI editing
+        image_size = data.get('image_size', 'auto')
+        output_format = data.get('output_format', 'png')
+        enable_prompt_expansion = coerce_bool(data.get('enable_prompt_expansion', False))
 
-        # Decode base64 image
+        # Downscale / re-encode to what the image_size preset needs before uploading
         try:
-            image_data = base64.b64decode(base64_image)
-        except Exception as e:
-            logger.error(f"Failed to decode base64 image: {str(e)}")
+            image_kwargs = normalize_upload(upload, image_size, data)
+        except (UploadError, ValueError) as e:
             return jsonify({
                 'status': 'error',
-                'message': 'Invalid base64 image data'
+                'message': str(e)
             }), 400
 
-        # Create uploads directory if it doesn't exist
-        uploads_dir = 'uploads'
-        os.makedirs(uploads_dir, exist_ok=True)
-
-        # Save the original image
-        filepath = os.path.join(uploads_dir, filename)
-        with open(filepath, 'wb') as f:
-            f.write(image_data)
+        edit_kwargs = {
+            **image_kwargs,
+            'prompt': prompt,
+            'image_size': image_size,
+            'output_format': output_format,
+            'enable_prompt_expansion': enable_prompt_expansion,
+            'seed': seed
+        }
+        user_id = request_user_id(data)
+
+        if request.args.get('mode') in ('async', 'stream'):
+            # Charge the user's rate limit now so an over-limit client gets a real 429;
+            # the edit itself then only waits for a global concurrency slot
+            admission = get_admission_controller()
+            if admission is not None:
+                try:
+                    admission.check_rate(user_id, max_wait=0)
+                except AdmissionRejected as e:
+                    return retry_later_response(e, upload_id=upload.upload_id)
+        else:
+            edit_kwargs['user_id'] = user_id
+
+        # Asynchronous mode: return a job id immediately and edit in the background
+        if request.args.get('mode') == 'async':
+            edit_kwargs['admission_wait'] = ADMISSION_JOB_MAX_WAIT
+            try:
+                job_id = submit_edit_job(edit_kwargs, {
+                    'prompt': prompt,
+                    'filename': filename,
+                    'image_size': image_size,
+                    'output_format': output_format,
+                    'enable_prompt_expansion': enable_prompt_expansion,
+                    'seed': seed,
+                    'upload_id': upload.upload_id,
+                    'image_sha256': upload.sha256
+                }, filepath, blob_hold=store.hold({upload.sha256, image_kwargs['image_digest']}))
+            except AdmissionRejected as e:
+                return retry_later_response(e, upload_id=upload.upload_id, original_filepath=filepath)
 
-        logger.info(f"Image saved to: {filepath}")
+            return jsonify({
+                'status': 'accepted',
+                'message': 'Image uploaded, AI editing queued',
+                'job_id': job_id,
+                'job_url': f'/api/jobs/{job_id}',
+                'upload_id': upload.upload_id,
+                'original_filepath': filepath,
+                'captured_data': request_data
+            }), 202
 
-        # Get optional parameters for AI editing
-        image_size = data.get('image_size', 'auto')
-        output_format = data.get('output_format', 'png')
-        enable_prompt_expansion = data.get('enable_prompt_expansion', False)
-        seed = data.get('seed')
+        # Streaming mode: report queue position and model logs as they happen
+        if request.args.get('mode') == 'stream':
+            as_ndjson = request.accept_mimetypes.best_match(
+                ['text/event-stream', 'application/x-ndjson']
+            ) == 'application/x-ndjson'
+            return stream_edit_progress(edit_kwargs, upload, as_ndjson)
 
         # Process the image with AI editing using fal.ai
         try:
             fal_service = get_fal_service()
-            ai_result = fal_service.edit_image(
-                prompt=prompt,
-                image_data=image_data,
-                filename=filename,
-                image_size=image_size,
-                output_format=output_format,
-                enable_prompt_expansion=enable_prompt_expansion,
-                seed=seed
-            )
+            ai_result = fal_service.edit_image(**edit_kwargs)
 
             # Extract the edited image URL
             edited_images = ai_result.get('images', [])
@@ -132,6 +415,7 @@ def upload_base64():
             response = {
                 'status': 'success',
                 'message': 'Image uploaded and edited successfully',
+                'upload_id': upload.upload_id,
                 'original_filepath': filepath,
                 'edited_image_url': edited_image_url,
                 'edited_images': edited_images,
@@ -142,12 +426,17 @@ def upload_base64():
 
             return jsonify(response), 200
 
+        except (AdmissionRejected, CircuitOpenError) as e:
+            logger.warning(f"Edit for {user_id} not admitted: {str(e)}")
+            return retry_later_response(e, upload_id=upload.upload_id, original_filepath=filepath)
+
         except Exception as ai_error:
             logger.error(f"AI editing failed: {str(ai_error)}")
             # Still return success for upload, but indicate AI editing failed
             return jsonify({
                 'status': 'partial_success',
                 'message': 'Image uploaded but AI editing failed',
+                'upload_id': upload.upload_id,
                 'original_filepath': filepath,
                 'error': str(ai_error),
                 'captured_data': request_data
@@ -161,9 +450,215 @@ def upload_base64():
         }), 500
 
 
+@app.route('/api/upload/batch', methods=['POST'])
+def upload_batch():
+    """
+    Apply several AI edits in one request, e.g. N prompts to one image or one
+    prompt to N images
+
+    Request body:
+    {
+        "images": ["<base64>", ...],
+        "edits": [
+            {"image": 0, "prompt": "...", "seed": 1, "image_size": "auto", ...},
+            ...
+        ],
+        "max_concurrency": 4
+    }
+
+    Each edit references an entry of "images" by index (or passes an image
+    URL); the edit defaults to image 0. Every distinct image is uploaded to
+    fal once and edits run concurrently up to max_concurrency
+    (capped by BATCH_MAX_CONCURRENCY). With ?stream=1 results are streamed
+    back as NDJSON lines as they finish; otherwise they are returned together.
+
+    Every edit counts against the caller's rate limit ("user_id" or
+    X-User-Id); edits that are not admitted come back as errors with a
+    retry_after.
+    """
+    request_data = log_request('/api/upload/batch')
+
+    try:
+        data = request.get_json(silent=True) or {}
+        images = data.get('images') or []
+        edits = data.get('edits') or []
+
+        if not edits:
+            return jsonify({
+                'status': 'error',
+                'message': 'No edits provided. Please include an "edits" list.'
+            }), 400
+
+        if len(edits) > BATCH_MAX_EDITS:
+            return jsonify({
+                'status': 'error',
+                'message': f'Too many edits in one batch (maximum {BATCH_MAX_EDITS})'
+            }), 400
+
+        try:
+            max_concurrency = coerce_int(data.get('max_concurrency')) or BATCH_MAX_CONCURRENCY
+        except UploadError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), e.status_code
+        max_concurrency = max(1, min(max_concurrency, BATCH_MAX_CONCURRENCY))
+
+        # Decode each image once, straight into the upload store
+        store = get_blob_store()
+        uploads = []
+        try:
+            for i, image in enumerate(images):
+                uploads.append(save_base64_image(image, store, f'batch_image_{i}.jpg'))
+        except UploadError as e:
+            return jsonify({
+                'status': 'error',
+                'message': f'Image {len(uploads)}: {str(e)}'
+            }), e.status_code
+
+        user_id = request_user_id(data)
+        edit_kwargs = []
+        normalized = {}
+        for i, edit in enumerate(edits):
+            if not isinstance(edit, dict) or not edit.get('prompt'):
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Edit {i} has no prompt'
+                }), 400
+
+            image_ref = edit.get('image', 0)
+            if isinstance(image_ref, str) and image_ref.startswith(('http://', 'https://')):
+                image_kwargs = {'image_data': image_ref}
+            elif isinstance(image_ref, int) and not isinstance(image_ref, bool) \
+                    and 0 <= image_ref < len(uploads):
+                # Normalize each (image, preset) pair once
+                image_size = edit.get('image_size', 'auto')
+                key = (image_ref, json.dumps(image_size, sort_keys=True))
+                if key not in normalized:
+                    try:
+                        normalized[key] = normalize_upload(uploads[image_ref], image_size, {**data, **edit})
+                    except (UploadError, ValueError) as e:
+                        return jsonify({
+                            'status': 'error',
+                            'message': f'Edit {i}: {str(e)}'
+                        }), 400
+                image_kwargs = normalized[key]
+            else:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Edit {i} references unknown image {image_ref!r}'
+                }), 400
+
+            try:
+                edit_kwargs.append({
+                    **image_kwargs,
+                    'prompt': edit['prompt'],
+                    'image_size': edit.get('image_size', 'auto'),
+                    'output_format': edit.get('output_format', 'png'),
+                    'enable_prompt_expansion': coerce_bool(edit.get('enable_prompt_expansion', False)),
+                    'seed': coerce_int(edit.get('seed')),
+                    'user_id': user_id
+                })
+            except UploadError as e:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Edit {i}: {str(e)}'
+                }), e.status_code
+
+        fal_service = get_fal_service()
+
+        def edit_results():
+            # Closing the batch (e.g. when a streaming client disconnects) cancels edits not yet started
+            with closing(fal_service.edit_batch(edit_kwargs, max_concurrency)) as batch:
+                for index, ai_result, error in batch:
+                    if error is not None:
+                        result = {
+                            'index': index,
+                            'status': 'error',
+                            'prompt': edit_kwargs[index]['prompt'],
+                            'error': str(error)
+                        }
+                        if isinstance(error, (AdmissionRejected, CircuitOpenError)):
+                            result['retry_after'] = error.retry_after
+                        yield result
+                        continue
+
+                    edited_images = ai_result.get('images', [])
+                    yield {
+                        'index': index,
+                        'status': 'success',
+                        'prompt': edit_kwargs[index]['prompt'],
+                        'edited_image_url': edited_images[0]['url'] if edited_images else None,
+                        'edited_images': edited_images,
+                        'seed': ai_result.get('seed')
+                    }
+
+        if coerce_bool(request.args.get('stream', False)):
+            def ndjson():
+                with closing(edit_results()) as results:
+                    for result in results:
+                        yield json.dumps(result) + '\n'
+
+            return Response(stream_with_context(ndjson()), mimetype='application/x-ndjson')
+
+        results = sorted(edit_results(), key=lambda result: result['index'])
+        failed = sum(1 for result in results if result['status'] == 'error')
+
+        return jsonify({
+            'status': 'success' if not failed else ('partial_success' if failed < len(results) else 'error'),
+            'message': f'{len(results) - failed} of {len(results)} edit(s) succeeded',
+            'upload_ids': [upload.upload_id for upload in uploads],
+            'original_filepaths': [upload.filepath for upload in uploads],
+            'results': results,
+            'captured_data': request_data
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error processing batch upload: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def edit_job_status(job_id):
+    """
+    Poll an asynchronous image edit job
+
+    Returns job_status (queued, running, succeeded, failed) and, once the
+    job has finished, the edited images or the error.
+    """
+    try:
+        job = get_job(job_id)
+
+        if not job:
+            return jsonify({
+                'status': 'error',
+                'message': f'Job {job_id} not found'
+            }), 404
+
+        return jsonify({
+            'status': 'success',
+            **job
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error fetching edit job {job_id}: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
 @app.route('/api/webhook', methods=['POST', 'GET'])
 def webhook():
-    """Endpoint 1: Generic webhook that accepts any data"""
+    """
+    Endpoint 1: Generic webhook that accepts any data
+
+    Every capture is stored in the webhook log (see webhook_log.py) and can
+    be read back through /api/webhook/recent.
+    """
     request_data = log_request('/api/webhook')
 
     response = {
@@ -172,23 +667,92 @@ def webhook():
         'captured_data': request_data
     }
 
+    try:
+        response['seq'] = get_webhook_log().append(request_data)
+    except Exception as e:
+        # Losing the capture record must not fail the delivery
+        logger.error(f"Failed to record webhook capture: {str(e)}")
+
     return jsonify(response), 200
 
 
+@app.route('/api/webhook/recent', methods=['GET'])
+def webhook_recent():
+    """
+    Page through recent webhook captures
+
+    Query parameters:
+    - since: Return captures with a sequence number above this (omit for the newest)
+    - limit: Maximum number of captures (default 50, at most 500)
+
+    Pass next_since from a response as since to fetch the following page.
+    """
+    try:
+        since = coerce_int(request.args.get('since'))
+        limit = coerce_int(request.args.get('limit')) or 50
+    except UploadError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), e.status_code
+
+    try:
+        page = get_webhook_log().recent(since=max(since, 0) if since is not None else None,
+                                        limit=max(1, min(limit, 500)))
+        return jsonify({
+            'status': 'success',
+            **page
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error reading webhook captures: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
-    """Endpoint 2: Chat endpoint simulating a conversational interface"""
+    """
+    Endpoint 2: Chat endpoint backed by a LangGraph conversation graph
+
+    The conversation is kept per user_id between turns. With ?stream=1 (or
+    Accept: text/event-stream) the reply is streamed as Server-Sent Events:
+    one "token" event per generated fragment, then "done" with the full
+    reply (or "error").
+    """
     request_data = log_request('/api/chat')
 
     payload = request.get_json(silent=True) or {}
     message = payload.get('message', '')
-    user_id = payload.get('user_id', 'anonymous')
+    user_id = str(payload.get('user_id') or 'anonymous')
+
+    if not isinstance(message, str) or not message.strip():
+        return jsonify({
+            'status': 'error',
+            'message': 'message is required'
+        }), 400
+
+    wants_stream = coerce_bool(request.args.get('stream')) or \
+        request.accept_mimetypes.best == 'text/event-stream'
+    if wants_stream:
+        return stream_chat_reply(user_id, message)
+
+    try:
+        reply = get_chat_service().reply(user_id, message)
+    except Exception as e:
+        logger.error(f"Chat turn failed for {user_id}: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
 
     response = {
         'status': 'success',
         'user_id': user_id,
         'received_message': message,
-        'response': f'Echo: {message}',
+        'response': reply,
         'timestamp': datetime.utcnow().isoformat(),
         'captured_data': request_data
     }
@@ -196,9 +760,47 @@ def chat():
     return jsonify(response), 200
 
 
+def stream_chat_reply(user_id, message):
+    """Stream one chat turn as Server-Sent Events ("token" events, then "done" or "error")"""
+    def generate():
+        tokens = []
+        try:
+            for token in get_chat_service().stream(user_id, message):
+                tokens.append(token)
+                yield format_sse('token', {'content': token})
+        except Exception as e:
+            logger.error(f"Chat stream failed for {user_id}: {str(e)}")
+            yield format_sse('error', {'status': 'error', 'message': str(e)})
+            return
+
+        yield format_sse('done', {
+            'status': 'success',
+            'user_id': user_id,
+            'received_message': message,
+            'response': ''.join(tokens),
+            'timestamp': datetime.utcnow().isoformat()
+        })
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @app.route('/api/data', methods=['POST', 'PUT'])
 def data():
-    """Endpoint 3: Data processing endpoint"""
+    """
+    Endpoint 3: Data processing endpoint
+
+    With ?stream=1 the body (NDJSON, or a JSON array) is parsed item by item
+    straight from the request stream and each item is passed to the handler
+    named by ?handler= (default "count", see data_stream.ITEM_HANDLERS), so
+    memory use does not grow with the payload. The response reports item
+    counts and throughput.
+    """
+    if coerce_bool(request.args.get('stream', False)):
+        return data_streaming()
+
     request_data = log_request('/api/data')
 
     payload = request.get_json(silent=True) or {}
@@ -213,13 +815,124 @@ def data():
     return jsonify(response), 200
 
 
+def data_streaming():
+    """Streaming variant of /api/data"""
+    request_data = log_request('/api/data', include_body=False)
+
+    data_format = detect_format(request.mimetype)
+    if data_format is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Unsupported Content-Type "{request.mimetype}" for streaming. '
+                       'Use application/x-ndjson or application/json (top-level array).'
+        }), 415
+
+    handler_name = request.args.get('handler', 'count')
+    if handler_name not in ITEM_HANDLERS:
+        return jsonify({
+            'status': 'error',
+            'message': f'Unknown handler "{handler_name}". Available: {", ".join(sorted(ITEM_HANDLERS))}'
+        }), 400
+
+    try:
+        stats = process_stream(request.stream, data_format, handler_name, loads=app.json.loads)
+    except StreamFormatError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error streaming data: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+    return jsonify({
+        'status': 'success',
+        'message': 'Data processed successfully',
+        **stats,
+        'captured_data': request_data
+    }), 200
+
+
+@app.route('/api/events/batch', methods=['POST'])
+def events_batch():
+    """
+    Track many events in one request
+
+    The body is NDJSON, one event per line:
+    {"event_type": "user_signup", "data": {...}}
+    Without "data" the remaining fields of the line are the payload. Lines
+    are parsed as they are read; valid events are buffered together and
+    written to Postgres in bulk (see event_buffer.py). Invalid lines are
+    reported and skipped. The body is read as a raw stream whatever the
+    Content-Type, so it is not parsed into the request capture.
+    """
+    request_data = log_request('/api/events/batch', include_body=False)
+
+    try:
+        accepted = []
+        errors = []
+        for line_number, line in enumerate(request.stream, start=1):
+            if not line.strip():
+                continue
+
+            if len(accepted) + len(errors) >= EVENTS_BATCH_MAX:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Too many events in one batch (maximum {EVENTS_BATCH_MAX})'
+                }), 413
+
+            try:
+                event = app.json.loads(line)
+            except ValueError as e:
+                errors.append({'line': line_number, 'error': f'Invalid JSON: {str(e)}'})
+                continue
+
+            if not isinstance(event, dict) or not event.get('event_type'):
+                errors.append({'line': line_number, 'error': 'Missing "event_type"'})
+                continue
+
+            event_type = str(event.pop('event_type'))
+            payload = event['data'] if 'data' in event else event
+            accepted.append((event_type, payload if isinstance(payload, dict) else {'value': payload}))
+
+        get_event_buffer().add_many(accepted)
+
+        return jsonify({
+            'status': 'success' if not errors else ('partial_success' if accepted else 'error'),
+            'message': f'{len(accepted)} event(s) accepted, {len(errors)} rejected',
+            'accepted': len(accepted),
+            'rejected': len(errors),
+            'errors': errors[:20],
+            'captured_data': request_data
+        }), 200 if accepted or not errors else 400
+
+    except Exception as e:
+        logger.error(f"Error processing event batch: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
 @app.route('/api/events/<event_type>', methods=['POST'])
 def events(event_type):
-    """Endpoint 4: Event tracking endpoint with dynamic event types"""
+    """
+    Endpoint 4: Event tracking endpoint with dynamic event types
+
+    Events are buffered per worker and written to the client_events table
+    in bulk; use /api/events/batch to send many at once. "batch" is
+    therefore not usable as an event type here: send such events through
+    /api/events/batch with "event_type": "batch".
+    """
     request_data = log_request(f'/api/events/{event_type}')
 
     payload = request.get_json(silent=True) or {}
 
+    get_event_buffer().add(event_type, payload if isinstance(payload, dict) else {'value': payload})
+
     response = {
         'status': 'success',
         'event_type': event_type,
@@ -264,6 +977,8 @@ def pinterest_login():
         pinterest_email = data['pinterest_email']
         pinterest_password = data['pinterest_password']
 
+        previous = get_pinterest_credentials(user_id)
+
         # Save credentials to database
         result = save_pinterest_credentials(
             user_id=user_id,
@@ -274,6 +989,13 @@ def pinterest_login():
 
         logger.info(f"Pinterest credentials saved for user {user_id}")
 
+        # The old session and status belong to the old credentials
+        get_status_cache().invalidate(user_id)
+        get_service_pool().discard(user_id)
+        # A different Pinterest account has different boards
+        if previous and previous['pinterest_username'] != pinterest_username:
+            clear_pinterest_mirror(user_id)
+
         return jsonify({
             'status': 'success',
             'message': 'Pinterest credentials saved successfully',
@@ -302,6 +1024,9 @@ def pinterest_status():
     - connected: User has valid Pinterest session
     - expired: User has credentials but session expired
     - disconnected: User has no Pinterest credentials
+
+    The status comes from a short-lived cache; status_checked_at and
+    status_stale tell how old it is (stale ones are being re-checked).
     """
     request_data = log_request('/api/pinterest/status')
 
@@ -315,12 +1040,15 @@ def pinterest_status():
             }), 400
 
         # Get Pinterest connection status
-        connection_status = get_pinterest_status(user_id)
+        connection_status = get_status_cache().get(user_id)
 
         return jsonify({
             'status': 'success',
             'user_id': user_id,
-            'pinterest_status': connection_status,
+            'pinterest_status': connection_status['status'],
+            'status_checked_at': connection_status['checked_at'],
+            'status_age_seconds': connection_status['age_seconds'],
+            'status_stale': connection_status['stale'],
             'captured_data': request_data
         }), 200
 
@@ -348,6 +1076,12 @@ def pinterest_boards():
     - url: Pinterest URL to the board
     - image_thumbnail_url: Thumbnail image
     - privacy: Board privacy setting
+
+    Boards are served from the local mirror (board_sync.py); mirror tells
+    when it was last synced, and a stale mirror is re-synced in the
+    background. The first request for a user mirrors the board list (pins
+    follow in the background), or answers 202 with status 'syncing' and a
+    Retry-After header while another worker is doing so.
     """
     request_data = log_request('/api/pinterest/boards')
 
@@ -368,17 +1102,19 @@ def pinterest_boards():
                 'message': 'No Pinterest account linked. Please login first.'
             }), 404
 
-        # Initialize Pinterest service
-        pinterest_service = PinterestService(user_id)
-
-        # Get all boards
-        boards = pinterest_service.get_boards()
+        # Get all boards from the mirror
+        try:
+            mirrored = get_board_sync().boards(user_id)
+        except MirrorNotReady as e:
+            return mirror_syncing_response(e, user_id=user_id)
+        boards = mirrored['boards']
 
         return jsonify({
             'status': 'success',
             'user_id': user_id,
             'board_count': len(boards),
             'boards': boards,
+            'mirror': mirrored['mirror'],
             'captured_data': request_data
         }), 200
 
@@ -391,6 +1127,136 @@ def pinterest_boards():
         }), 500
 
 
+@app.route('/api/pinterest/boards/<board_id>/pins', methods=['GET'])
+def pinterest_board_pins(board_id):
+    """
+    Page through a board's pins, newest first, from the local mirror
+
+    Query parameters:
+    - user_id: Your app's user ID
+    - limit: Maximum number of pins (default 100, at most 500)
+    - offset: Pins to skip (default 0)
+
+    complete is False while the sync is still paging through the board.
+    """
+    try:
+        limit = coerce_int(request.args.get('limit')) or 100
+        offset = coerce_int(request.args.get('offset')) or 0
+    except UploadError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), e.status_code
+
+    try:
+        user_id = request.args.get('user_id')
+
+        if not user_id:
+            return jsonify({
+                'status': 'error',
+                'message': 'user_id query parameter is required'
+            }), 400
+
+        if not get_pinterest_credentials(user_id):
+            return jsonify({
+                'status': 'error',
+                'message': 'No Pinterest account linked. Please login first.'
+            }), 404
+
+        try:
+            page = get_board_sync().pins(user_id, board_id, limit=max(1, min(limit, 500)), offset=max(offset, 0))
+        except MirrorNotReady as e:
+            return mirror_syncing_response(e, user_id=user_id, board_id=board_id)
+        if page is None:
+            return jsonify({
+                'status': 'error',
+                'message': f'Board {board_id} not found'
+            }), 404
+
+        return jsonify({
+            'status': 'success',
+            'user_id': user_id,
+            'board_id': board_id,
+            'pin_count': len(page['pins']),
+            **page
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error fetching pins for board {board_id}: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e),
+            'hint': 'You may need to re-authenticate with Pinterest. Check /api/pinterest/status'
+        }), 500
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Runtime metrics (response sizes, cache hit/miss counters, circuit breakers, database pool, admission state) for monitoring"""
+    try:
+        fal_metrics = get_fal_service().cache_stats()
+    except Exception as e:
+        logger.error(f"Error collecting FAL metrics: {str(e)}")
+        fal_metrics = {'error': str(e)}
+
+    try:
+        upload_metrics = get_blob_store().stats()
+    except Exception as e:
+        logger.error(f"Error collecting upload store metrics: {str(e)}")
+        upload_metrics = {'error': str(e)}
+
+    try:
+        resilience_metrics = get_fal_service().resilience_stats()
+    except Exception as e:
+        logger.error(f"Error collecting FAL resilience metrics: {str(e)}")
+        resilience_metrics = {'error': str(e)}
+
+    try:
+        event_metrics = get_event_buffer().stats()
+    except Exception as e:
+        logger.error(f"Error collecting event buffer metrics: {str(e)}")
+        event_metrics = {'error': str(e)}
+
+    try:
+        webhook_metrics = get_webhook_log().stats()
+    except Exception as e:
+        logger.error(f"Error collecting webhook log metrics: {str(e)}")
+        webhook_metrics = {'error': str(e)}
+
+    try:
+        chat_metrics = get_chat_service().stats()
+    except Exception as e:
+        logger.error(f"Error collecting chat metrics: {str(e)}")
+        chat_metrics = {'error': str(e)}
+
+    try:
+        admission = get_admission_controller()
+        admission_metrics = admission.stats() if admission else {'enabled': False}
+    except Exception as e:
+        logger.error(f"Error collecting admission metrics: {str(e)}")
+        admission_metrics = {'error': str(e)}
+
+    return jsonify({
+        'status': 'success',
+        'timestamp': datetime.utcnow().isoformat(),
+        'responses': response_metrics.stats(),
+        'fal': fal_metrics,
+        'fal_resilience': resilience_metrics,
+        'uploads': upload_metrics,
+        'edit_jobs': job_stats(),
+        'events': event_metrics,
+        'webhook_log': webhook_metrics,
+        'chat': chat_metrics,
+        'db_pool': db_pool_stats(),
+        'credential_cache': get_credential_cache().stats(),
+        'login_status_writes': get_login_status_writer().stats(),
+        'pinterest_sessions': get_service_pool().stats(),
+        'pinterest_status_cache': get_status_cache().stats(),
+        'board_sync': get_board_sync().stats(),
+        'admission': admission_metrics
+    }), 200
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
@@ -405,41 +1271,95 @@ def index():
     """Root endpoint with API documentation"""
     return jsonify({
         'message': 'Flask Request Capture API',
+        'response_options': {
+            'fields': 'Comma-separated (dotted) fields to return, e.g. ?fields=edited_images.url,seed '
+                      '(error responses are always returned whole)',
+            'debug': '1 (or X-Debug-Capture: 1 header) - include the captured_data request echo'
+        },
         'endpoints': {
             '/api/webhook': {
                 'methods': ['GET', 'POST'],
                 'description': 'Generic webhook that accepts any data'
             },
+            '/api/webhook/recent': {
+                'methods': ['GET'],
+                'description': 'Page through recent webhook captures by sequence number',
+                'example': '/api/webhook/recent?since=120&limit=50'
+            },
             '/api/chat': {
                 'methods': ['POST'],
-                'description': 'Chat endpoint for conversational interfaces',
+                'description': 'Chat endpoint for conversational interfaces (conversation kept per user_id)',
                 'payload_example': {
                     'message': 'Hello',
                     'user_id': 'user123'
+                },
+                'query_parameters': {
+                    'stream': '1 (optional, or Accept: text/event-stream) - stream the reply as Server-Sent Events'
                 }
             },
             '/api/data': {
                 'methods': ['POST', 'PUT'],
-                'description': 'Data processing endpoint'
+                'description': 'Data processing endpoint',
+                'query_parameters': {
+                    'stream': '1 (optional) - parse an NDJSON or JSON array body item by item',
+                    'handler': 'count (default) or events - what to do with each streamed item'
+                }
             },
             '/api/events/<event_type>': {
                 'methods': ['POST'],
-                'description': 'Event tracking with dynamic event types',
+                'description': 'Event tracking with dynamic event types (buffered and stored in bulk); '
+                               '"batch" is reserved for /api/events/batch',
                 'example': '/api/events/user_signup'
             },
+            '/api/events/batch': {
+                'methods': ['POST'],
+                'description': 'Track many events in one request, NDJSON body with one event per line',
+                'payload_example': '{"event_type": "user_signup", "data": {"plan": "free"}}\n'
+                                   '{"event_type": "page_view", "data": {"path": "/"}}'
+            },
             '/api/upload': {
                 'methods': ['POST'],
-                'description': 'Upload and AI-edit base64 encoded images using fal.ai',
+                'description': 'Upload and AI-edit images using fal.ai (JSON base64, multipart, raw binary or base64 text body)',
                 'payload_example': {
                     'image': 'base64_encoded_image_data',
+                    'upload_id': 'upload_id of a previous upload (optional, instead of image)',
                     'prompt': 'add a sunset background',
+                    'user_id': 'user123 (optional) - rate limit key, or X-User-Id header',
                     'filename': 'optional_filename.jpg',
                     'image_size': 'auto (optional)',
                     'output_format': 'png (optional)',
                     'enable_prompt_expansion': False,
-                    'seed': 12345
+                    'seed': 12345,
+                    'normalize': 'true (optional) - downscale/re-encode before upload',
+                    'normalize_format': 'jpeg (optional) - jpeg, webp or png',
+                    'normalize_quality': '90 (optional)',
+                    'max_dimension': '2048 (optional) - longest side when image_size is auto'
+                },
+                'query_parameters': {
+                    'mode': 'async (optional) - return a job id immediately and poll /api/jobs/<job_id>; '
+                            'stream (optional) - Server-Sent Events with queue position, progress logs and result'
+                }
+            },
+            '/api/upload/batch': {
+                'methods': ['POST'],
+                'description': 'Apply several AI edits concurrently, uploading each distinct image once',
+                'payload_example': {
+                    'images': ['base64_encoded_image_data'],
+                    'edits': [
+                        {'image': 0, 'prompt': 'add a sunset background'},
+                        {'image': 0, 'prompt': 'make it black and white', 'seed': 12345}
+                    ],
+                    'max_concurrency': 4
+                },
+                'query_parameters': {
+                    'stream': '1 (optional) - stream results as NDJSON lines as they finish'
                 }
             },
+            '/api/jobs/<job_id>': {
+                'methods': ['GET'],
+                'description': 'Status and result of an asynchronous image edit job',
+                'example': '/api/jobs/3f2b6c1e-8a4d-4f57-9a61-2f0d8c9b7e10'
+            },
             '/api/pinterest/login': {
                 'methods': ['POST'],
                 'description': 'Save Pinterest credentials for a user',
@@ -452,7 +1372,7 @@ def index():
             },
             '/api/pinterest/status': {
                 'methods': ['GET'],
-                'description': 'Check Pinterest connection status (connected/expired/disconnected)',
+                'description': 'Check Pinterest connection status (connected/expired/disconnected), cached with stale-while-revalidate',
                 'query_parameters': {
                     'user_id': 'Your app user ID'
                 },
@@ -460,12 +1380,26 @@ def index():
             },
             '/api/pinterest/boards': {
                 'methods': ['GET'],
-                'description': 'Get all Pinterest mood boards for a user',
+                'description': 'Get all Pinterest mood boards for a user, served from the local mirror',
                 'query_parameters': {
                     'user_id': 'Your app user ID'
                 },
                 'example': '/api/pinterest/boards?user_id=user123',
-                'returns': 'List of boards with id, name, description, pin_count, url, etc.'
+                'returns': 'List of boards with id, name, description, pin_count, url, etc. and mirror freshness'
+            },
+            '/api/pinterest/boards/<board_id>/pins': {
+                'methods': ['GET'],
+                'description': 'Page through a board\'s pins, newest first, from the local mirror',
+                'query_parameters': {
+                    'user_id': 'Your app user ID',
+                    'limit': '100 (optional, at most 500)',
+                    'offset': '0 (optional)'
+                },
+                'example': '/api/pinterest/boards/123456/pins?user_id=user123&limit=50'
+            },
+            '/api/metrics': {
+                'methods': ['GET'],
+                'description': 'Runtime metrics such as upload and edit result cache hit/miss counters, fal circuit breaker state, chat conversation cache, database pool, credential cache, Pinterest session pool, board mirror sync and admission control state'
             },
             '/health': {
                 'methods': ['GET'],
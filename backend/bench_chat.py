@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark for /api/chat
+Drives the endpoint with the local fake model (a fixed delay per token) and
+compares time to first byte and total time of the buffered JSON response
+with the Server-Sent Events stream, plus turns/s through the conversation
+cache
+
+Runs in-process through Flask's test client, so the numbers reflect the
+graph, checkpointer and model rather than the network.
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+import chat_service
+from chat_service import ChatService, EchoChatModel, LRUCheckpointSaver
+
+
+def time_request(client, path, payload):
+    """Return (seconds to first body chunk, seconds to last) for one request"""
+    start = time.perf_counter()
+    response = client.post(path, json=payload, buffered=False)
+    first = None
+    for _ in response.response:
+        if first is None:
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    response.close()
+    return first if first is not None else total, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=20, help='Requests per mode (default 20)')
+    parser.add_argument('--words', type=int, default=50, help='Words per message, i.e. tokens per reply (default 50)')
+    parser.add_argument('--token-delay', type=float, default=0.01, help='Fake model seconds per token (default 0.01)')
+    parser.add_argument('--users', type=int, default=100, help='Distinct conversations for the cache run (default 100)')
+    args = parser.parse_args()
+
+    service = ChatService(model=EchoChatModel(token_delay=args.token_delay), persist=False)
+    chat_service._chat_service = service
+
+    from app import app
+    client = app.test_client()
+    message = ' '.join(f'word{i}' for i in range(args.words))
+
+    print(f"{args.turns} turns per mode, {args.words + 1} tokens per reply, {args.token_delay * 1000:.0f} ms/token")
+    print(f"{'mode':<10}{'TTFB p50 ms':>14}{'TTFB p95 ms':>14}{'total p50 ms':>14}")
+    for mode, path in (('json', '/api/chat'), ('sse', '/api/chat?stream=1')):
+        samples = [time_request(client, path, {'message': message, 'user_id': f'bench-{mode}'})
+                   for _ in range(args.turns)]
+        ttfb = sorted(first for first, _ in samples)
+        totals = [total for _, total in samples]
+        print(f"{mode:<10}{statistics.median(ttfb) * 1000:>14.1f}"
+              f"{ttfb[int(len(ttfb) * 0.95) - 1] * 1000:>14.1f}{statistics.median(totals) * 1000:>14.1f}")
+
+    # Cache throughput without model latency: skewed (Zipf-like) traffic over
+    # more users than the cache holds
+    service = ChatService(model=EchoChatModel(),
+                          checkpointer=LRUCheckpointSaver(max_threads=max(1, args.users // 4)),
+                          persist=False)
+    rng = random.Random(0)
+    users = rng.choices(range(args.users), weights=[1 / (i + 1) for i in range(args.users)], k=args.users * 5)
+    start = time.perf_counter()
+    for user in users:
+        service.reply(f'user{user}', 'hello')
+    turns = len(users)
+    elapsed = time.perf_counter() - start
+    print(f"\ncache: {turns / elapsed:.0f} turns/s, {service.stats()['cache']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark for /api/data streaming ingestion
+Compares parsing a large NDJSON / JSON array payload in one go (what
+request.get_json does) with the incremental parser in data_stream.py, reporting
+wall time, throughput and peak Python memory (tracemalloc)
+
+The payload is generated into a temporary file and read back from disk, so
+the numbers are dominated by parsing rather than by the network.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from data_stream import FORMAT_JSON_ARRAY, FORMAT_NDJSON, process_stream
+
+
+def write_payload(path, size_mb, data_format):
+    """Write roughly size_mb of event-like items and return the item count"""
+    target = size_mb * 1024 * 1024
+    written = 0
+    count = 0
+    with open(path, 'w') as f:
+        if data_format == FORMAT_JSON_ARRAY:
+            f.write('[')
+        while written < target:
+            item = json.dumps({
+                'event_type': 'page_view',
+                'data': {'user_id': f'user{count % 1000}', 'path': f'/boards/{count}', 'ms': count % 997}
+            })
+            if data_format == FORMAT_JSON_ARRAY:
+                item = (',' if count else '') + item
+            else:
+                item += '\n'
+            f.write(item)
+            written += len(item)
+            count += 1
+        if data_format == FORMAT_JSON_ARRAY:
+            f.write(']')
+    return count
+
+
+def measure(fn):
+    """
+    Run fn twice: once timed, once under tracemalloc (which slows it down)
+
+    Returns:
+        tuple: (result, seconds, peak traced bytes)
+    """
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def parse_whole(path, data_format):
+    """The current path: read the body, parse it completely, count the items"""
+    with open(path, 'rb') as f:
+        body = f.read()
+    if data_format == FORMAT_NDJSON:
+        items = [json.loads(line) for line in body.splitlines() if line.strip()]
+    else:
+        items = json.loads(body)
+    return len(items)
+
+
+def parse_streaming(path, data_format):
+    with open(path, 'rb') as f:
+        return process_stream(f, data_format, 'count')['processed_items']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=100, help='Payload size in MB (default 100)')
+    parser.add_argument('--format', choices=[FORMAT_NDJSON, FORMAT_JSON_ARRAY, 'both'], default='both')
+    args = parser.parse_args()
+
+    formats = [FORMAT_NDJSON, FORMAT_JSON_ARRAY] if args.format == 'both' else [args.format]
+    for data_format in formats:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as tmp:
+            path = tmp.name
+        try:
+            count = write_payload(path, args.size_mb, data_format)
+            size = os.path.getsize(path)
+            print(f"\n{data_format}: {count} items, {size / 1e6:.1f} MB")
+            print(f"{'path':<12}{'seconds':>10}{'MB/s':>10}{'items/s':>12}{'peak MB':>10}")
+
+            for name, fn in (('whole', parse_whole), ('streaming', parse_streaming)):
+                items, elapsed, peak = measure(lambda: fn(path, data_format))
+                assert items == count, f"{name} parsed {items} items, expected {count}"
+                print(f"{name:<12}{elapsed:>10.2f}{size / elapsed / 1e6:>10.1f}"
+                      f"{count / elapsed:>12.0f}{peak / 1e6:>10.1f}")
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
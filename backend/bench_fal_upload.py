@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark for FalImageService.upload_image_from_bytes
+Compares the in-memory upload path against the temp-file fallback under
+concurrent load
+
+By default fal storage is replaced with a local sink that consumes the bytes
+(plus an optional simulated network latency), so the numbers isolate the cost
+of the local write/read path. Pass --live to upload to fal.ai for real
+(requires FAL_API_KEY).
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+import fal_client
+
+from fal_service import FalImageService, UPLOAD_MODE_MEMORY, UPLOAD_MODE_TEMPFILE
+
+load_dotenv()
+
+
+def install_local_sink(latency):
+    """Replace fal storage uploads with a local sink"""
+
+    def upload(data, content_type, file_name=None):
+        checksum = sum(data[::4096])
+        time.sleep(latency)
+        return f"https://local.sink/{file_name}?c={checksum}&t={content_type}"
+
+    def upload_file(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        return upload(data, 'application/octet-stream', os.path.basename(path))
+
+    fal_client.upload = upload
+    fal_client.upload_file = upload_file
+
+
+def run(mode, image_data, concurrency, requests_per_worker, api_key):
+    """Upload image_data concurrently and return per-upload latencies"""
+    service = FalImageService(api_key=api_key, upload_mode=mode)
+
+    def worker(_):
+        latencies = []
+        for _ in range(requests_per_worker):
+            start = time.perf_counter()
+            service.upload_image_from_bytes(image_data, "bench.jpg")
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(l for worker_latencies in results for l in worker_latencies)
+    return elapsed, latencies
+
+
+def report(mode, elapsed, latencies):
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+    print(f"\n{mode}:")
+    print(f"   uploads:    {len(latencies)}")
+    print(f"   throughput: {len(latencies) / elapsed:.1f} uploads/s")
+    print(f"   p50:        {statistics.median(latencies) * 1000:.2f} ms")
+    print(f"   p95:        {p95 * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=10, help='Synthetic image size in MB (default: 10)')
+    parser.add_argument('--image', help='Use this image file instead of synthetic data')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent uploaders (default: 8)')
+    parser.add_argument('--requests', type=int, default=10, help='Uploads per uploader (default: 10)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated network latency in seconds')
+    parser.add_argument('--live', action='store_true', help='Upload to fal.ai instead of the local sink')
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, 'rb') as f:
+            image_data = f.read()
+    else:
+        # JPEG signature followed by random payload
+        image_data = b'\xff\xd8\xff\xe0' + os.urandom(int(args.size_mb * 1024 * 1024))
+
+    api_key = os.getenv('FAL_API_KEY')
+    if args.live:
+        if not api_key:
+            print("FAL_API_KEY is required for --live")
+            sys.exit(1)
+    else:
+        install_local_sink(args.latency)
+        api_key = api_key or 'local-benchmark'
+
+    print("=" * 60)
+    print("FAL upload benchmark")
+    print("=" * 60)
+    print(f"   image:       {len(image_data) / 1024 / 1024:.1f} MB")
+    print(f"   concurrency: {args.concurrency} x {args.requests} uploads")
+    print(f"   target:      {'fal.ai' if args.live else 'local sink'}")
+
+    for mode in (UPLOAD_MODE_TEMPFILE, UPLOAD_MODE_MEMORY):
+        elapsed, latencies = run(mode, image_data, args.concurrency, args.requests, api_key)
+        report(mode, elapsed, latencies)
+
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Content-addressed upload storage
+Stores uploaded originals by SHA-256 digest in hash-prefix sharded directories,
+keeps a small SQLite index of upload ids -> blobs and evicts old blobs in the
+background to keep disk usage bounded
+"""
+
+import fcntl
+import glob
+import os
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+from sqlite_cache import open_sqlite
+
+logger = logging.getLogger(__name__)
+
+# Root of the store: blobs/, tmp/ and index.sqlite3 live underneath
+UPLOADS_DIR = os.getenv('UPLOADS_DIR', 'uploads')
+
+# Eviction policy (0 disables the respective limit)
+UPLOADS_MAX_BYTES = int(os.getenv('UPLOADS_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+UPLOADS_MAX_AGE_SECONDS = float(os.getenv('UPLOADS_MAX_AGE_SECONDS', 7 * 24 * 3600))
+UPLOADS_EVICTION_INTERVAL = float(os.getenv('UPLOADS_EVICTION_INTERVAL', 600))
+# Blobs stored or read this recently are never evicted (covers edits still using them)
+UPLOADS_EVICTION_GRACE_SECONDS = float(os.getenv('UPLOADS_EVICTION_GRACE_SECONDS', 900))
+# Upper bound on how long a hold (e.g. a queued edit job) protects its blobs
+UPLOADS_HOLD_SECONDS = float(os.getenv('UPLOADS_HOLD_SECONDS', 3600))
+
+
+class StoredUpload:
+    """An upload recorded in the index"""
+
+    def __init__(self, upload_id: str, sha256: str, filepath: str, filename: str, size: int):
+        self.upload_id = upload_id
+        self.sha256 = sha256
+        self.filepath = filepath
+        self.filename = filename
+        self.size = size
+
+
+class BlobStore:
+    """
+    Content-addressed, sharded blob store for uploaded images
+
+    Blobs are written to tmp/ first and renamed into
+    blobs/<ab>/<cd>/<sha256> once complete, so readers never see partial
+    files and identical uploads share one blob.
+
+    put() and get() share .index.lock with eviction, which takes it
+    exclusively, so a blob can't be deleted between being found and being
+    recorded or touched. Eviction also spares blobs used within the grace
+    window and blobs under an unexpired hold().
+    """
+
+    def __init__(self, root: str = UPLOADS_DIR,
+                 max_bytes: int = UPLOADS_MAX_BYTES,
+                 max_age_seconds: float = UPLOADS_MAX_AGE_SECONDS,
+                 grace_seconds: float = UPLOADS_EVICTION_GRACE_SECONDS):
+        self.root = root
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.index_path = os.path.join(root, 'index.sqlite3')
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.grace_seconds = grace_seconds
+        self._local = threading.local()
+        self._eviction_thread = None
+
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_last_access ON blobs(last_access)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS uploads (
+                upload_id TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                filename TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_uploads_sha256 ON uploads(sha256)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS holds (
+                hold_id TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_holds_sha256 ON holds(sha256, expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_holds_hold_id ON holds(hold_id)")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = open_sqlite(self.index_path)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _index_lock(self, operation: int = fcntl.LOCK_SH):
+        """Hold .index.lock (shared for put/get, exclusive for eviction) across processes"""
+        with open(os.path.join(self.root, '.index.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, operation)
+            yield
+
+    def blob_path(self, sha256: str) -> str:
+        """Sharded path of a blob"""
+        return os.path.join(self.blob_dir, sha256[:2], sha256[2:4], sha256)
+
+    def temp_path(self) -> str:
+        """A fresh path in tmp/ (same filesystem as the blobs, so rename is atomic)"""
+        return os.path.join(self.tmp_dir, f'{uuid.uuid4().hex}.part')
+
+    def put(self, tmp_path: str, sha256: str, size: int, filename: Optional[str] = None) -> StoredUpload:
+        """
+        Move a fully written temp file into the store and record an upload
+
+        Args:
+            tmp_path: File written under tmp/
+            sha256: Hex digest of its contents
+            size: Size in bytes
+            filename: Client-supplied name, kept as metadata only
+
+        Returns:
+            StoredUpload: New upload id and the blob's path
+        """
+        path = self.blob_path(sha256)
+        upload_id = uuid.uuid4().hex
+        conn = self._connection()
+
+        with self._index_lock():
+            if os.path.exists(path):
+                # Same content already stored
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("""
+                    INSERT INTO blobs (sha256, size, created_at, last_access) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (sha256) DO UPDATE SET last_access = excluded.last_access
+                """, (sha256, size, now, now))
+                conn.execute("""
+                    INSERT INTO uploads (upload_id, sha256, filename, created_at) VALUES (?, ?, ?, ?)
+                """, (upload_id, sha256, filename, now))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        return StoredUpload(upload_id, sha256, path, filename, size)
+
+    def get(self, upload_id: str) -> Optional[StoredUpload]:
+        """Look up an upload by id, or None if unknown or evicted"""
+        with self._index_lock():
+            row = self._connection().execute("""
+                SELECT u.upload_id, u.sha256, u.filename, b.size
+                FROM uploads u JOIN blobs b ON b.sha256 = u.sha256
+                WHERE u.upload_id = ?
+            """, (upload_id,)).fetchone()
+
+            if row is None or not os.path.exists(self.blob_path(row[1])):
+                return None
+
+            # Within the grace window from here on
+            self.touch(row[1])
+        return StoredUpload(row[0], row[1], self.blob_path(row[1]), row[2], row[3])
+
+    def touch(self, sha256: str):
+        """Mark a blob as recently used so eviction keeps it"""
+        self._connection().execute(
+            "UPDATE blobs SET last_access = ? WHERE sha256 = ?", (time.time(), sha256)
+        )
+
+    def hold(self, sha256s: Iterable[str], seconds: float = UPLOADS_HOLD_SECONDS) -> str:
+        """
+        Protect blobs from eviction until release() or for at most seconds
+
+        Returns:
+            str: Hold id to pass to release()
+        """
+        hold_id = uuid.uuid4().hex
+        expires_at = time.time() + seconds
+        self._connection().executemany(
+            "INSERT INTO holds (hold_id, sha256, expires_at) VALUES (?, ?, ?)",
+            [(hold_id, sha256, expires_at) for sha256 in set(sha256s)]
+        )
+        return hold_id
+
+    def release(self, hold_id: str):
+        """End a hold taken with hold()"""
+        self._connection().execute("DELETE FROM holds WHERE hold_id = ?", (hold_id,))
+
+    def evict(self) -> Dict:
+        """
+        Apply the age and size limits
+
+        Blobs not accessed for max_age_seconds are removed, then the least
+        recently accessed blobs until the store is under max_bytes. Blobs
+        accessed within grace_seconds or under a hold are kept even if that
+        leaves the store over its limits. Only one process evicts at a time.
+
+        Returns:
+            dict: Number of blobs and bytes removed
+        """
+        with open(os.path.join(self.root, '.evict.lock'), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return {'skipped': 'eviction running in another worker'}
+
+            conn = self._connection()
+            victims = []
+
+            with self._index_lock(fcntl.LOCK_EX):
+                now = time.time()
+                conn.execute("DELETE FROM holds WHERE expires_at < ?", (now,))
+                evictable = """
+                    last_access < ? AND NOT EXISTS (
+                        SELECT 1 FROM holds h WHERE h.sha256 = blobs.sha256 AND h.expires_at >= ?
+                    )
+                """
+
+                if self.max_age_seconds:
+                    victims += conn.execute(
+                        f"SELECT sha256, size FROM blobs WHERE {evictable}",
+                        (now - max(self.max_age_seconds, self.grace_seconds), now)
+                    ).fetchall()
+
+                if self.max_bytes:
+                    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+                    total -= sum(size for _, size in victims)
+                    if total > self.max_bytes:
+                        aged = {sha256 for sha256, _ in victims}
+                        for sha256, size in conn.execute(
+                            f"SELECT sha256, size FROM blobs WHERE {evictable} ORDER BY last_access",
+                            (now - self.grace_seconds, now)
+                        ).fetchall():
+                            if total <= self.max_bytes:
+                                break
+                            if sha256 not in aged:
+                                victims.append((sha256, size))
+                                total -= size
+
+                for sha256, _ in victims:
+                    try:
+                        os.remove(self.blob_path(sha256))
+                    except FileNotFoundError:
+                        pass
+                    conn.execute("DELETE FROM uploads WHERE sha256 = ?", (sha256,))
+                    conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+
+            # Leftovers of interrupted uploads
+            for path in glob.glob(os.path.join(self.tmp_dir, '*.part')):
+                if os.path.getmtime(path) < time.time() - 3600:
+                    os.remove(path)
+
+        freed = sum(size for _, size in victims)
+        if victims:
+            logger.info(f"Evicted {len(victims)} upload blob(s), {freed} bytes")
+        return {'evicted_blobs': len(victims), 'evicted_bytes': freed}
+
+    def stats(self) -> Dict:
+        """Blob/upload counts and total size"""
+        conn = self._connection()
+        blobs, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        uploads = conn.execute("SELECT COUNT(*) FROM uploads").fetchone()[0]
+        return {
+            'blobs': blobs,
+            'uploads': uploads,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'max_age_seconds': self.max_age_seconds,
+            'grace_seconds': self.grace_seconds
+        }
+
+    def start_eviction(self, interval: float = UPLOADS_EVICTION_INTERVAL):
+        """Run evict() periodically on a daemon thread"""
+        if self._eviction_thread is not None or not interval:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.evict()
+                except Exception as e:
+                    logger.error(f"Upload eviction failed: {str(e)}")
+
+        self._eviction_thread = threading.Thread(target=run, name='upload-eviction', daemon=True)
+        self._eviction_thread.start()
+
+
+# Singleton instance
+_blob_store = None
+
+
+def get_blob_store() -> BlobStore:
+    """Get or create the upload store singleton (and start its eviction thread)"""
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore()
+        _blob_store.start_eviction()
+    return _blob_store
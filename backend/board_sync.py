@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Pinterest board and pin mirror
+Keeps a copy of each user's boards and pins in Postgres so listings are
+served by an indexed query instead of a live scrape. The sync only fetches
+what changed: boards whose pin count moved get their newest pins up to the
+last one already mirrored, and long backfills resume from a stored paging
+bookmark. A periodic full pass also drops pins that were removed upstream
+(and picks up changes the pin count hides, such as one pin added and
+another removed between two runs).
+
+Run it from cron for all users (or the given ones):
+    python board_sync.py [user_id ...]
+"""
+
+import os
+import sys
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from datetime import timezone
+from typing import Dict, List, Optional
+
+from db import (
+    begin_pinterest_full_pass,
+    claim_pinterest_sync,
+    delete_unseen_mirrored_pins,
+    finish_pinterest_sync,
+    get_mirrored_boards,
+    get_mirrored_pins,
+    get_pinterest_sync_state,
+    list_pinterest_user_ids,
+    replace_mirrored_boards,
+    save_pinterest_sync_state,
+    upsert_mirrored_pins
+)
+from pinterest_service import get_service_pool
+
+logger = logging.getLogger(__name__)
+
+# Seconds a mirror counts as fresh; older ones are served while a sync runs
+PINTEREST_MIRROR_TTL = float(os.getenv('PINTEREST_MIRROR_TTL', 900))
+# Feed pages fetched per board per sync run (a larger backfill continues next run)
+PINTEREST_SYNC_MAX_PAGES = int(os.getenv('PINTEREST_SYNC_MAX_PAGES', 20))
+# Seconds between full passes over a board (which also remove deleted pins)
+PINTEREST_SYNC_FULL_INTERVAL = float(os.getenv('PINTEREST_SYNC_FULL_INTERVAL', 86400))
+# A sync holding the per-user lease longer than this is presumed dead
+PINTEREST_SYNC_LEASE = float(os.getenv('PINTEREST_SYNC_LEASE', 600))
+# Background threads running syncs for stale mirrors
+PINTEREST_SYNC_WORKERS = int(os.getenv('PINTEREST_SYNC_WORKERS', 2))
+# Seconds clients are told to wait while another worker runs a user's first sync
+PINTEREST_SYNC_RETRY_AFTER = int(os.getenv('PINTEREST_SYNC_RETRY_AFTER', 5))
+
+
+class MirrorNotReady(Exception):
+    """Raised when nothing is mirrored for a user yet and another worker is running the first sync"""
+
+    def __init__(self, message: str, retry_after: int = PINTEREST_SYNC_RETRY_AFTER):
+        super().__init__(message)
+        self.status_code = 202
+        self.retry_after = retry_after
+
+
+def _pin_row(pin: Dict):
+    """(pin_id, pin, created_at) for upsert_mirrored_pins"""
+    created_at = None
+    if pin.get('created_at'):
+        try:
+            # Pinterest sends RFC 2822 dates ("Tue, 05 Mar 2024 10:00:00 +0000")
+            created_at = parsedate_to_datetime(pin['created_at']).astimezone(timezone.utc).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            pass
+    return str(pin.get('id')), pin, created_at
+
+
+def _board(row: Dict) -> Dict:
+    """Mirror row in the shape PinterestService.get_boards() returns"""
+    return {
+        'id': row['board_id'],
+        'name': row['name'],
+        'description': row['description'],
+        'pin_count': row['pin_count'],
+        'url': row['url'],
+        'image_thumbnail_url': row['image_thumbnail_url'],
+        'privacy': row['privacy']
+    }
+
+
+class BoardSync:
+    """
+    Syncs the mirror and serves reads from it
+
+    One sync per user runs at a time across all workers (a lease row in
+    pinterest_sync_state); within a worker, stale reads share a single
+    background sync per user. Pinterest is called through the user's pooled
+    service one page at a time, so a long sync never holds the instance
+    that status and board requests need.
+    """
+
+    def __init__(self, ttl: float = PINTEREST_MIRROR_TTL, max_pages: int = PINTEREST_SYNC_MAX_PAGES,
+                 full_interval: float = PINTEREST_SYNC_FULL_INTERVAL, lease: float = PINTEREST_SYNC_LEASE,
+                 workers: int = PINTEREST_SYNC_WORKERS):
+        self.ttl = ttl
+        self.max_pages = max(1, max_pages)
+        self.full_interval = full_interval
+        self.lease = lease
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='board-sync')
+        self._counters = {'syncs': 0, 'failed_syncs': 0, 'skipped_in_progress': 0,
+                          'boards_skipped': 0, 'pages': 0, 'pins_written': 0, 'pins_removed': 0}
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._counters[key] += value
+
+    def sync_user(self, user_id: str, boards_only: bool = False) -> Dict:
+        """
+        Bring a user's mirror up to date
+
+        Args:
+            user_id: App user id
+            boards_only: Sync the board list but not the pins (a single
+                Pinterest call, short enough to run inside a request)
+
+        Returns:
+            dict: What the sync did, or {'status': 'in_progress'} when
+            another sync for the user holds the lease
+        """
+        if not claim_pinterest_sync(user_id, self.lease):
+            self._count(skipped_in_progress=1)
+            return {'status': 'in_progress'}
+
+        error = None
+        try:
+            boards = self._call(user_id, lambda service: service.get_boards())
+            boards_removed = replace_mirrored_boards(user_id, boards)
+
+            summary = {'status': 'synced', 'boards': len(boards), 'boards_removed': boards_removed,
+                       'boards_skipped': 0, 'pins_written': 0, 'pins_removed': 0}
+            if not boards_only:
+                states = get_pinterest_sync_state(user_id)
+                for board in boards:
+                    result = self._sync_board(user_id, board, states.get(f"board:{board['id']}"))
+                    summary['boards_skipped'] += result['skipped']
+                    summary['pins_written'] += result['written']
+                    summary['pins_removed'] += result['removed']
+
+            self._count(syncs=1)
+            return summary
+        except Exception as e:
+            error = str(e)
+            self._count(failed_syncs=1)
+            logger.error(f"Pinterest mirror sync failed for user {user_id}: {error}")
+            raise
+        finally:
+            finish_pinterest_sync(user_id, error)
+
+    def _call(self, user_id: str, operation):
+        """Run operation(service) on the user's pooled PinterestService, holding it only for this call"""
+        with get_service_pool().checkout(user_id) as service:
+            return operation(service)
+
+    def _fetch_page(self, user_id: str, board_id: str, bookmark: Optional[str]):
+        self._count(pages=1)
+        return self._call(user_id, lambda service: service.call_authenticated(
+            lambda: service.fetch_board_page(board_id, bookmark)))
+
+    def _sync_board(self, user_id: str, board: Dict, state: Optional[Dict]) -> Dict:
+        board_id = str(board['id'])
+        scope = f'board:{board_id}'
+        result = {'skipped': 0, 'written': 0, 'removed': 0}
+
+        full_due = state is None or state['pass_age_seconds'] is None or \
+            state['pass_age_seconds'] >= self.full_interval
+        if state is not None and state['complete'] and not full_due and state['pin_count'] == board.get('pin_count'):
+            # Nothing was added or removed since the last run, as far as the pin
+            # count tells: an add and a delete in the same window cancel out and
+            # wait for the next full pass (checking the newest pin would cost a
+            # page fetch per board per run)
+            result['skipped'] = 1
+            self._count(boards_skipped=1)
+            return result
+
+        head_id = state['head_id'] if state else None
+        if state is None or (state['complete'] and full_due):
+            state = {**(state or {}), 'complete': False, 'bookmark': None,
+                     'pass_started_at': begin_pinterest_full_pass(user_id, scope)}
+        new_head = None
+
+        # New pins (the feed is newest first) down to the newest one already mirrored
+        if head_id:
+            bookmark = None
+            caught_up = False
+            for _ in range(self.max_pages):
+                pins, bookmark = self._fetch_page(user_id, board_id, bookmark)
+                rows = []
+                for pin in pins:
+                    if str(pin.get('id')) == head_id:
+                        caught_up = True
+                        break
+                    rows.append(_pin_row(pin))
+                if new_head is None and pins:
+                    new_head = str(pins[0].get('id'))
+                result['written'] += upsert_mirrored_pins(user_id, board_id, rows)
+                if caught_up or bookmark is None:
+                    caught_up = True
+                    break
+
+            if not caught_up:
+                # More new pins than max_pages: the ones between the last page
+                # fetched and the old head are still missing, so the head must
+                # not move past them. A new full pass covers the gap (and its
+                # first page becomes the head).
+                logger.info(f"Board {board_id} of user {user_id} gained over {self.max_pages} page(s) "
+                            f"of pins; starting a full pass")
+                new_head = None
+                state = {**state, 'complete': False, 'bookmark': None,
+                         'pass_started_at': begin_pinterest_full_pass(user_id, scope)}
+
+        # Continue the full pass from where the last run stopped
+        complete = state['complete']
+        if not complete:
+            bookmark = state['bookmark']
+            for page in range(self.max_pages):
+                pins, bookmark = self._fetch_page(user_id, board_id, bookmark)
+                if new_head is None and pins and state['bookmark'] is None and page == 0:
+                    new_head = str(pins[0].get('id'))
+                result['written'] += upsert_mirrored_pins(user_id, board_id, [_pin_row(pin) for pin in pins])
+                if bookmark is None:
+                    complete = True
+                    result['removed'] = delete_unseen_mirrored_pins(user_id, board_id, state['pass_started_at'])
+                    break
+                save_pinterest_sync_state(user_id, scope, bookmark=bookmark)
+
+        save_pinterest_sync_state(
+            user_id, scope,
+            head_id=new_head or head_id,
+            bookmark=None if complete else bookmark,
+            complete=complete,
+            pin_count=board.get('pin_count'),
+            last_error=None
+        )
+        self._count(pins_written=result['written'], pins_removed=result['removed'])
+        return result
+
+    def refresh_in_background(self, user_id: str):
+        """Start a sync for user_id unless this worker already runs one; returns its future"""
+        with self._lock:
+            future = self._in_flight.get(user_id)
+            if future is None:
+                future = self._executor.submit(self._run, user_id)
+                self._in_flight[user_id] = future
+            return future
+
+    def _run(self, user_id: str) -> Dict:
+        try:
+            return self.sync_user(user_id)
+        finally:
+            with self._lock:
+                self._in_flight.pop(user_id, None)
+
+    def _freshness(self, user_id: str, state: Optional[Dict]) -> Dict:
+        synced_at = state.get('last_synced_at') if state else None
+        age = state.get('age_seconds') if state else None
+        with self._lock:
+            syncing = user_id in self._in_flight
+        return {
+            'synced_at': synced_at.isoformat() if synced_at else None,
+            'age_seconds': round(age, 1) if age is not None else None,
+            'stale': age is None or age >= self.ttl,
+            'syncing': syncing or bool(state and state.get('sync_started_at')),
+            'last_error': state.get('last_error') if state else None
+        }
+
+    def _user_state(self, user_id: str) -> Dict:
+        """
+        Sync state, mirroring the boards first if nothing was ever synced and
+        starting a background refresh if stale
+
+        Raises:
+            MirrorNotReady: If nothing is mirrored yet and another worker is
+                running the user's first sync
+        """
+        states = get_pinterest_sync_state(user_id)
+        user_state = states.get('user')
+        if user_state is None or user_state['last_synced_at'] is None:
+            # Nothing to serve yet: mirror the board list now, pins in the background
+            if self.sync_user(user_id, boards_only=True)['status'] == 'in_progress':
+                raise MirrorNotReady(f"Pinterest boards for user {user_id} are still being synced")
+            self.refresh_in_background(user_id)
+            states = get_pinterest_sync_state(user_id)
+        elif user_state['age_seconds'] >= self.ttl:
+            self.refresh_in_background(user_id)
+        return states
+
+    def boards(self, user_id: str) -> Dict:
+        """
+        A user's boards from the mirror
+
+        Returns:
+            dict: boards (as PinterestService.get_boards() returns them) and
+            mirror (synced_at, age_seconds, stale, syncing, last_error)
+        """
+        states = self._user_state(user_id)
+        return {
+            'boards': [_board(row) for row in get_mirrored_boards(user_id)],
+            'mirror': self._freshness(user_id, states.get('user'))
+        }
+
+    def pins(self, user_id: str, board_id: str, limit: int = 100, offset: int = 0) -> Optional[Dict]:
+        """
+        A page of a board's pins from the mirror
+
+        Returns:
+            dict: pins, complete (False until a pass over the board has
+            paged through all of it) and mirror freshness; None if the board
+            is not mirrored
+        """
+        states = self._user_state(user_id)
+        if not any(row['board_id'] == board_id for row in get_mirrored_boards(user_id)):
+            return None
+        board_state = states.get(f'board:{board_id}')
+        rows = get_mirrored_pins(user_id, board_id, limit=limit, offset=offset)
+        return {
+            'pins': [row['data'] for row in rows],
+            'complete': bool(board_state and board_state['complete']),
+            'mirror': self._freshness(user_id, states.get('user'))
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self._counters,
+                'in_flight': len(self._in_flight),
+                'ttl_seconds': self.ttl
+            }
+
+
+# Singleton instance
+_board_sync = None
+_board_sync_lock = threading.Lock()
+
+
+def get_board_sync() -> BoardSync:
+    """Get or create this worker's board sync"""
+    global _board_sync
+    with _board_sync_lock:
+        if _board_sync is None:
+            _board_sync = BoardSync()
+        return _board_sync
+
+
+def main(user_ids: List[str]) -> int:
+    sync = get_board_sync()
+    failures = 0
+    for user_id in user_ids or list_pinterest_user_ids():
+        try:
+            logger.info(f"{user_id}: {sync.sync_user(user_id)}")
+        except Exception:
+            failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    sys.exit(main(sys.argv[1:]))
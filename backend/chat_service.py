@@ -0,0 +1,344 @@
+"""
+Chat service
+Runs /api/chat turns through a LangGraph graph, keeping per-user conversation
+state in a bounded (LRU) in-memory checkpointer with optional write-through
+to Postgres, and streams model tokens as they are generated
+"""
+
+import os
+import threading
+import time
+import logging
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    messages_from_dict,
+    messages_to_dict
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+from db import get_chat_conversation, get_chat_conversation_version, save_chat_conversation
+
+logger = logging.getLogger(__name__)
+
+# "fake" (local echo model, no API calls) or a model name for langchain's
+# init_chat_model, e.g. "gpt-4o-mini" with CHAT_MODEL_PROVIDER=openai
+CHAT_MODEL = os.getenv('CHAT_MODEL', 'fake')
+CHAT_MODEL_PROVIDER = os.getenv('CHAT_MODEL_PROVIDER', '')
+# Seconds the fake model waits before each token (to simulate generation)
+CHAT_FAKE_TOKEN_DELAY = float(os.getenv('CHAT_FAKE_TOKEN_DELAY', 0))
+# Messages kept per conversation; older ones are dropped from the state
+CHAT_MAX_HISTORY = int(os.getenv('CHAT_MAX_HISTORY', 40))
+# Conversations kept in memory per worker; the least recently used are evicted
+CHAT_CACHE_MAX_CONVERSATIONS = int(os.getenv('CHAT_CACHE_MAX_CONVERSATIONS', 1000))
+# Checkpoints kept per conversation (at least 2, the current step and its parent)
+CHAT_CHECKPOINTS_PER_CONVERSATION = int(os.getenv('CHAT_CHECKPOINTS_PER_CONVERSATION', 3))
+# Write conversations through to Postgres (chat_conversations) and reload them on a cache miss
+CHAT_PERSIST = os.getenv('CHAT_PERSIST', 'false').lower() in ('1', 'true', 'yes')
+
+# Per-user locks, striped so the lock table stays fixed-size
+_LOCK_STRIPES = 64
+
+
+class EchoChatModel(BaseChatModel):
+    """Local stand-in model that echoes the last message back, one word per token"""
+
+    token_delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return 'echo'
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        return f'Echo: {messages[-1].content}' if messages else 'Echo:'
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.token_delay:
+            time.sleep(self.token_delay * len(self._reply(messages).split(' ')))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        for i, word in enumerate(self._reply(messages).split(' ')):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            token = word if i == 0 else f' {word}'
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def _text(content) -> str:
+    """Text of a message's content (a string, or a list of content blocks for some providers)"""
+    if isinstance(content, str):
+        return content
+    return ''.join(block if isinstance(block, str) else block.get('text', '') for block in content)
+
+
+def load_chat_model(name: str = CHAT_MODEL, provider: str = CHAT_MODEL_PROVIDER) -> BaseChatModel:
+    """The fake echo model, or any chat model langchain's init_chat_model knows"""
+    if name == 'fake':
+        return EchoChatModel(token_delay=CHAT_FAKE_TOKEN_DELAY)
+
+    from langchain.chat_models import init_chat_model
+    return init_chat_model(name, model_provider=provider or None)
+
+
+class LRUCheckpointSaver(MemorySaver):
+    """
+    In-memory checkpointer bounded by conversation count and checkpoint depth
+
+    Each conversation is one LangGraph thread. Reading or writing a thread
+    marks it most recently used; once more than max_threads are held, the
+    least recently used thread is dropped wholesale. Within a thread only
+    the newest keep_checkpoints checkpoints (and the channel blobs they
+    reference) are kept, since /api/chat never time-travels.
+    """
+
+    def __init__(self, max_threads: int = CHAT_CACHE_MAX_CONVERSATIONS,
+                 keep_checkpoints: int = CHAT_CHECKPOINTS_PER_CONVERSATION,
+                 on_evict=None):
+        super().__init__()
+        self.max_threads = max_threads
+        self.keep_checkpoints = max(2, keep_checkpoints)
+        self.on_evict = on_evict
+        self._recency = OrderedDict()
+        self._lock = threading.RLock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def has_thread(self, thread_id: str) -> bool:
+        with self._lock:
+            return thread_id in self._recency
+
+    def get_tuple(self, config):
+        thread_id = config['configurable']['thread_id']
+        with self._lock:
+            result = super().get_tuple(config)
+            if result is None:
+                self._counters['misses'] += 1
+            else:
+                self._counters['hits'] += 1
+                self._recency.move_to_end(thread_id)
+            return result
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        with self._lock:
+            return iter(list(super().list(config, filter=filter, before=before, limit=limit)))
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config['configurable']['thread_id']
+        with self._lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            self._recency[thread_id] = True
+            self._recency.move_to_end(thread_id)
+            self._prune(thread_id, config['configurable'].get('checkpoint_ns', ''))
+            evicted = []
+            while len(self._recency) > self.max_threads:
+                oldest, _ = self._recency.popitem(last=False)
+                super().delete_thread(oldest)
+                self._counters['evictions'] += 1
+                evicted.append(oldest)
+
+        for oldest in evicted:
+            if self.on_evict:
+                self.on_evict(oldest)
+        return result
+
+    def put_writes(self, config, writes, task_id, task_path=''):
+        with self._lock:
+            return super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            super().delete_thread(thread_id)
+            self._recency.pop(thread_id, None)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str):
+        """Drop all but the newest checkpoints of a thread, with their writes and unreferenced blobs"""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_checkpoints:
+            return
+
+        # Checkpoint ids are time-ordered
+        ids = sorted(checkpoints)
+        for checkpoint_id in ids[:-self.keep_checkpoints]:
+            del checkpoints[checkpoint_id]
+        for key in [k for k in self.writes if k[0] == thread_id and k[1] == checkpoint_ns and k[2] not in checkpoints]:
+            del self.writes[key]
+
+        referenced = set()
+        for serialized, _, _ in checkpoints.values():
+            for channel, version in self.serde.loads_typed(serialized)['channel_versions'].items():
+                referenced.add((channel, version))
+        for key in [k for k in self.blobs if k[0] == thread_id and k[1] == checkpoint_ns
+                    and (k[2], k[3]) not in referenced]:
+            del self.blobs[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self._counters,
+                'conversations': len(self._recency),
+                'max_conversations': self.max_threads,
+                'checkpoints': sum(len(c) for ns in self.storage.values() for c in ns.values()),
+                'blobs': len(self.blobs)
+            }
+
+
+class ChatService:
+    """
+    Conversational turns over a single-node LangGraph graph
+
+    The graph state is the conversation's message list (trimmed to
+    max_history); the checkpointer keeps it between turns under the user's
+    id. With persistence on, every turn is written through to Postgres with
+    a version number, and a turn first reloads the conversation when this
+    worker doesn't hold it or holds an older version (another worker
+    answered in between).
+    """
+
+    def __init__(self, model: Optional[BaseChatModel] = None,
+                 checkpointer: Optional[LRUCheckpointSaver] = None,
+                 max_history: int = CHAT_MAX_HISTORY,
+                 persist: bool = CHAT_PERSIST):
+        self.model = model or load_chat_model()
+        self.max_history = max_history
+        self.persist = persist
+        self.checkpointer = checkpointer or LRUCheckpointSaver()
+        self.checkpointer.on_evict = self._forget_version
+        self._versions = {}
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        self._counters = {'turns': 0, 'streamed_turns': 0, 'loaded': 0, 'persist_errors': 0}
+        self.graph = self._build_graph()
+
+    def _build_graph(self):
+        def call_model(state: MessagesState):
+            messages = state['messages']
+            reply = self.model.invoke(messages[-self.max_history:])
+            # Keep the stored conversation bounded as well
+            overflow = len(messages) + 1 - self.max_history
+            removed = [RemoveMessage(id=m.id) for m in messages[:overflow]] if overflow > 0 else []
+            return {'messages': removed + [reply]}
+
+        graph = StateGraph(MessagesState)
+        graph.add_node('model', call_model)
+        graph.add_edge(START, 'model')
+        graph.add_edge('model', END)
+        return graph.compile(checkpointer=self.checkpointer)
+
+    def _config(self, user_id: str) -> Dict:
+        return {'configurable': {'thread_id': user_id}}
+
+    def _lock(self, user_id: str) -> threading.Lock:
+        return self._locks[zlib.crc32(user_id.encode('utf-8')) % _LOCK_STRIPES]
+
+    def _forget_version(self, user_id: str):
+        self._versions.pop(user_id, None)
+
+    def _load(self, user_id: str):
+        """Seed the checkpointer from Postgres if this worker's copy is missing or stale"""
+        if not self.persist:
+            return
+        try:
+            version = get_chat_conversation_version(user_id)
+            if version is None:
+                return
+            if self.checkpointer.has_thread(user_id) and self._versions.get(user_id) == version:
+                return
+
+            record = get_chat_conversation(user_id)
+            self.checkpointer.delete_thread(user_id)
+            self.graph.update_state(self._config(user_id),
+                                    {'messages': messages_from_dict(record['messages'])}, as_node='model')
+            self._versions[user_id] = record['version']
+            self._counters['loaded'] += 1
+        except Exception as e:
+            # Carry on with whatever this worker has cached
+            self._counters['persist_errors'] += 1
+            logger.error(f"Failed to load chat conversation for {user_id}: {str(e)}")
+
+    def _save(self, user_id: str):
+        if not self.persist:
+            return
+        try:
+            messages = self.graph.get_state(self._config(user_id)).values.get('messages', [])
+            self._versions[user_id] = save_chat_conversation(user_id, messages_to_dict(messages))
+        except Exception as e:
+            self._counters['persist_errors'] += 1
+            logger.error(f"Failed to save chat conversation for {user_id}: {str(e)}")
+
+    def reply(self, user_id: str, message: str) -> str:
+        """
+        Run one turn and return the model's full reply
+
+        Args:
+            user_id: Conversation key
+            message: The user's message
+
+        Returns:
+            str: The reply text
+        """
+        with self._lock(user_id):
+            self._load(user_id)
+            state = self.graph.invoke({'messages': [HumanMessage(content=message)]}, self._config(user_id))
+            self._save(user_id)
+            self._counters['turns'] += 1
+        return _text(state['messages'][-1].content)
+
+    def stream(self, user_id: str, message: str) -> Iterator[str]:
+        """
+        Run one turn, yielding reply tokens as the model produces them
+
+        Args:
+            user_id: Conversation key
+            message: The user's message
+
+        Yields:
+            str: Reply text fragments, in order
+        """
+        with self._lock(user_id):
+            self._load(user_id)
+            for chunk, metadata in self.graph.stream({'messages': [HumanMessage(content=message)]},
+                                                     self._config(user_id), stream_mode='messages'):
+                token = _text(chunk.content) if metadata.get('langgraph_node') == 'model' else ''
+                if token:
+                    yield token
+            self._save(user_id)
+            self._counters['turns'] += 1
+            self._counters['streamed_turns'] += 1
+
+    def history(self, user_id: str) -> List[BaseMessage]:
+        """The conversation as this worker currently holds it"""
+        return self.graph.get_state(self._config(user_id)).values.get('messages', [])
+
+    def stats(self) -> Dict:
+        return {
+            **self._counters,
+            'model': self.model._llm_type,
+            'persist': self.persist,
+            'cache': self.checkpointer.stats()
+        }
+
+
+# Singleton instance
+_chat_service = None
+_chat_service_lock = threading.Lock()
+
+
+def get_chat_service() -> ChatService:
+    """Get or create the chat service"""
+    global _chat_service
+    with _chat_service_lock:
+        if _chat_service is None:
+            _chat_service = ChatService()
+        return _chat_service
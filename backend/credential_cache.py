@@ -0,0 +1,198 @@
+"""
+Pinterest credential cache
+Read-through cache for credential lookups: a per-request memo on flask.g in
+front of a short-TTL per-worker cache, invalidated on every write and, across
+workers and instances, through Postgres LISTEN/NOTIFY
+"""
+
+import os
+import select
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import psycopg2
+from psycopg2 import extensions, sql
+from flask import g, has_app_context
+
+logger = logging.getLogger(__name__)
+
+# Seconds a lookup is served from the worker cache (0 disables it; the
+# per-request memo still applies)
+CREDENTIAL_CACHE_TTL = float(os.getenv('CREDENTIAL_CACHE_TTL', 30))
+# Users kept in the worker cache; the least recently used are dropped
+CREDENTIAL_CACHE_MAX = int(os.getenv('CREDENTIAL_CACHE_MAX', 10000))
+# Postgres channel that credential writes are announced on (payload: user_id)
+CREDENTIAL_NOTIFY_CHANNEL = os.getenv('CREDENTIAL_NOTIFY_CHANNEL', 'pinterest_credentials')
+# Listen for other workers' writes; without it entries live out their TTL
+CREDENTIAL_CACHE_LISTEN = os.getenv('CREDENTIAL_CACHE_LISTEN', 'true').lower() in ('1', 'true', 'yes')
+
+# Marks "no credentials" entries, which are cached too
+_MISSING = object()
+
+
+class CredentialCache:
+    """
+    Per-worker credential cache keyed by user_id
+
+    Lookups hit the request memo, then the TTL cache, then the loader.
+    Loads record the invalidation generation they started under and are not
+    cached if an invalidation arrived meanwhile, so a slow read can't put
+    back a row that was just replaced. The listener thread clears the whole
+    cache whenever it (re)connects, since notifications sent while it was
+    away are lost.
+    """
+
+    def __init__(self, ttl: float = CREDENTIAL_CACHE_TTL, max_entries: int = CREDENTIAL_CACHE_MAX,
+                 channel: str = CREDENTIAL_NOTIFY_CHANNEL, listen: bool = CREDENTIAL_CACHE_LISTEN):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.channel = channel
+        self.listen = listen
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_connected = False
+        self._counters = {'memo_hits': 0, 'hits': 0, 'misses': 0, 'invalidations': 0, 'notifications': 0}
+
+    def _memo(self) -> Optional[Dict]:
+        if not has_app_context():
+            return None
+        if '_pinterest_credentials' not in g:
+            g._pinterest_credentials = {}
+        return g._pinterest_credentials
+
+    def get(self, user_id: str, loader: Callable) -> Optional[Dict]:
+        """
+        Credentials for user_id, loading them with loader(user_id) on a miss
+
+        Returns:
+            dict: A copy of the credentials row, or None if there is none
+        """
+        self._start_listener()
+        memo = self._memo()
+        if memo is not None and user_id in memo:
+            with self._lock:
+                self._counters['memo_hits'] += 1
+            return _copy(memo[user_id])
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self._counters['hits'] += 1
+                value = entry[0]
+            else:
+                self._counters['misses'] += 1
+                value = None
+            generation = self._generation
+
+        if value is None:
+            row = loader(user_id)
+            value = row if row is not None else _MISSING
+            if self.ttl > 0:
+                with self._lock:
+                    if self._generation == generation:
+                        self._entries[user_id] = (value, time.monotonic() + self.ttl)
+                        self._entries.move_to_end(user_id)
+                        while len(self._entries) > self.max_entries:
+                            self._entries.popitem(last=False)
+
+        if memo is not None:
+            memo[user_id] = value
+        return _copy(value)
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Drop one user's entry (or everything when user_id is None)"""
+        with self._lock:
+            self._generation += 1
+            self._counters['invalidations'] += 1
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+        memo = self._memo()
+        if memo is not None:
+            if user_id is None:
+                memo.clear()
+            else:
+                memo.pop(user_id, None)
+
+    def _start_listener(self):
+        if self._listener is not None or not self.listen or self.ttl <= 0 or not os.getenv('DATABASE_URL'):
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(target=self._listen, name='credential-listen', daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(sql.SQL('LISTEN {}').format(sql.Identifier(self.channel)))
+                self._listener_connected = True
+                # Writes made while we weren't listening went unannounced
+                self.invalidate()
+                backoff = 1
+
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        with self._lock:
+                            self._counters['notifications'] += 1
+                        self.invalidate(notify.payload or None)
+            except Exception as e:
+                logger.warning(f"Credential cache listener disconnected: {str(e)}")
+            finally:
+                self._listener_connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+            self.invalidate()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self._counters,
+                'entries': len(self._entries),
+                'ttl_seconds': self.ttl,
+                'listener_connected': self._listener_connected
+            }
+
+
+def _copy(value) -> Optional[Dict]:
+    # Callers get their own dict so they can't modify the cached row
+    return None if value is _MISSING else dict(value)
+
+
+# Singleton instance
+_credential_cache = None
+_credential_cache_lock = threading.Lock()
+
+
+def get_credential_cache() -> CredentialCache:
+    """Get or create this worker's credential cache"""
+    global _credential_cache
+    with _credential_cache_lock:
+        if _credential_cache is None:
+            _credential_cache = CredentialCache()
+        return _credential_cache
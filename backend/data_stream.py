@@ -0,0 +1,357 @@
+"""
+Streaming JSON ingestion
+Parses NDJSON or a top-level JSON array incrementally from a request stream
+and feeds the items one at a time to a pluggable handler, so memory stays
+bounded by the largest single item rather than the payload
+"""
+
+import codecs
+import json
+import os
+import re
+import time
+import logging
+from typing import Callable, Dict, Iterator, Optional
+
+from event_buffer import get_event_buffer
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the request stream per step
+DATA_STREAM_CHUNK_SIZE = int(os.getenv('DATA_STREAM_CHUNK_SIZE', 64 * 1024))
+# Largest single item (NDJSON line or array element) accepted
+DATA_STREAM_MAX_ITEM_BYTES = int(os.getenv('DATA_STREAM_MAX_ITEM_BYTES', 16 * 1024 * 1024))
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_JSON_ARRAY = 'json_array'
+
+_WHITESPACE = re.compile(r'[ \t\r\n]*')
+# Used to find where an element ends: text up to the next bracket (skipping
+# complete strings), the rest of a string, and the end of a number/literal
+_NON_BRACKETS = re.compile(r'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*', re.S)
+_STRING_SPECIAL = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[ \t\r\n,\]]')
+
+
+class StreamFormatError(ValueError):
+    """The body is not NDJSON or a JSON array, or an item is malformed or too large"""
+
+
+class _CountingReader:
+    """Wraps a binary stream and counts the bytes read from it"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, size: int) -> bytes:
+        chunk = self.stream.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def _text_chunks(stream, chunk_size: int) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        chunk = stream.read(chunk_size)
+        try:
+            if not chunk:
+                tail = decoder.decode(b'', final=True)
+                if tail:
+                    yield tail
+                return
+            text = decoder.decode(chunk)
+        except UnicodeDecodeError as e:
+            raise StreamFormatError(f'Body is not valid UTF-8: {str(e)}')
+        yield text
+
+
+def iter_ndjson(stream, chunk_size: int = DATA_STREAM_CHUNK_SIZE,
+                max_item_bytes: int = DATA_STREAM_MAX_ITEM_BYTES,
+                loads: Callable = json.loads) -> Iterator:
+    """Yield one parsed value per non-empty line of an NDJSON stream"""
+    buffer = bytearray()
+    # Bytes of buffer already searched for a newline (a long line spanning
+    # many chunks is only scanned once)
+    scanned = 0
+    line_number = 0
+
+    def parse(line):
+        try:
+            return loads(line)
+        except ValueError as e:
+            raise StreamFormatError(f'Invalid JSON on line {line_number}: {str(e)}')
+
+    while True:
+        chunk = stream.read(chunk_size)
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b'\n', scanned)
+            if end < 0:
+                break
+            line = bytes(buffer[start:end])
+            start = scanned = end + 1
+            line_number += 1
+            if line.strip():
+                yield parse(line)
+
+        # The rest is incomplete until the next newline (or EOF)
+        del buffer[:start]
+        scanned = len(buffer)
+        if len(buffer) > max_item_bytes:
+            raise StreamFormatError(f'Line {line_number + 1} exceeds {max_item_bytes} bytes')
+
+        if not chunk:
+            if buffer.strip():
+                line_number += 1
+                yield parse(bytes(buffer))
+            return
+
+
+def iter_json_array(stream, chunk_size: int = DATA_STREAM_CHUNK_SIZE,
+                    max_item_bytes: int = DATA_STREAM_MAX_ITEM_BYTES) -> Iterator:
+    """
+    Yield the elements of a top-level JSON array one at a time
+
+    Element boundaries are found by scanning each chunk once, carrying
+    bracket depth and string/escape state across chunks, so every element
+    is decoded exactly once however many chunks it spans.
+    """
+    decoder = json.JSONDecoder()
+    chunks = _text_chunks(stream, chunk_size)
+    buffer = ''
+    pos = 0
+    eof = False
+    index = 0
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            return
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    def read_element() -> str:
+        """Consume the element starting at buffer[pos] and return its text"""
+        nonlocal buffer, pos
+        pieces = []
+        size = 0
+        depth = 0
+        escape = False
+        # Numbers and literals have no closing character: they end at a separator
+        scalar = buffer[pos] not in '{["'
+        in_string = buffer[pos] == '"'
+        i = pos + 1 if in_string else pos
+        while True:
+            end = None
+            while end is None and i < len(buffer):
+                if escape:
+                    escape = False
+                    i += 1
+                elif in_string:
+                    match = _STRING_SPECIAL.search(buffer, i)
+                    if match is None:
+                        i = len(buffer)
+                        break
+                    i = match.end()
+                    if match.group() == '\\':
+                        escape = True
+                    else:
+                        in_string = False
+                        if depth == 0:
+                            end = i
+                elif scalar:
+                    match = _SCALAR_END.search(buffer, i)
+                    if match is None:
+                        i = len(buffer)
+                        break
+                    end = match.start()
+                else:
+                    i = _NON_BRACKETS.match(buffer, i).end()
+                    if i == len(buffer):
+                        break
+                    char = buffer[i]
+                    i += 1
+                    if char == '"':
+                        # A string that continues into the next chunk
+                        in_string = True
+                    elif char in '[{':
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            end = i
+
+            if end is not None:
+                pieces.append(buffer[pos:end])
+                pos = end
+                return ''.join(pieces)
+
+            pieces.append(buffer[pos:])
+            size += len(buffer) - pos
+            if size > max_item_bytes:
+                raise StreamFormatError(f'Element {index} exceeds {max_item_bytes} bytes')
+            chunk = next(chunks, None)
+            buffer, pos, i = chunk or '', 0, 0
+            if chunk is None:
+                # A scalar may end at EOF; anything else is left for the decoder to reject
+                return ''.join(pieces)
+
+    skip_whitespace()
+    if pos >= len(buffer) or buffer[pos] != '[':
+        raise StreamFormatError('Expected a JSON array')
+    pos += 1
+
+    expect_comma = False
+    while True:
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise StreamFormatError('Unexpected end of input inside the array')
+
+        if buffer[pos] == ']':
+            pos += 1
+            skip_whitespace()
+            if pos < len(buffer):
+                raise StreamFormatError('Unexpected data after the array')
+            return
+
+        if expect_comma:
+            if buffer[pos] != ',':
+                raise StreamFormatError(f'Expected "," after element {index - 1}')
+            pos += 1
+            skip_whitespace()
+            if pos >= len(buffer):
+                raise StreamFormatError('Unexpected end of input inside the array')
+
+        text = read_element()
+        if len(text) > max_item_bytes:
+            raise StreamFormatError(f'Element {index} exceeds {max_item_bytes} bytes')
+        try:
+            item, end = decoder.raw_decode(text)
+            if end != len(text):
+                raise ValueError(f'Extra data at char {end}')
+        except ValueError as e:
+            raise StreamFormatError(f'Invalid JSON in element {index}: {str(e)}')
+
+        yield item
+        index += 1
+        expect_comma = True
+
+
+def detect_format(mimetype: str) -> Optional[str]:
+    """Pick the parser from the Content-Type (NDJSON) or default to a JSON array"""
+    if mimetype in ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines'):
+        return FORMAT_NDJSON
+    if mimetype in ('application/json', ''):
+        return FORMAT_JSON_ARRAY
+    return None
+
+
+# Pluggable per-item handlers: name -> factory returning an object with
+# handle(item) and result()
+ITEM_HANDLERS: Dict[str, Callable] = {}
+
+
+def register_item_handler(name: str):
+    """Class decorator adding a handler to ITEM_HANDLERS under name"""
+    def register(factory):
+        ITEM_HANDLERS[name] = factory
+        return factory
+    return register
+
+
+@register_item_handler('count')
+class CountHandler:
+    """Counts items by JSON type"""
+
+    def __init__(self, **options):
+        self.types = {}
+
+    def handle(self, item):
+        kind = type(item).__name__
+        self.types[kind] = self.types.get(kind, 0) + 1
+
+    def result(self) -> Dict:
+        return {'item_types': self.types}
+
+
+@register_item_handler('events')
+class EventsHandler:
+    """Feeds {"event_type": ..., "data": ...} items into the /api/events buffer"""
+
+    def __init__(self, **options):
+        self.buffer = get_event_buffer()
+        self.pending = []
+        self.skipped = 0
+
+    def handle(self, item):
+        if not isinstance(item, dict) or not item.get('event_type'):
+            self.skipped += 1
+            return
+        payload = item['data'] if 'data' in item else {k: v for k, v in item.items() if k != 'event_type'}
+        self.pending.append((str(item['event_type']), payload if isinstance(payload, dict) else {'value': payload}))
+        if len(self.pending) >= 500:
+            self.buffer.add_many(self.pending)
+            self.pending = []
+
+    def result(self) -> Dict:
+        self.buffer.add_many(self.pending)
+        self.pending = []
+        return {'skipped': self.skipped}
+
+
+def process_stream(stream, data_format: str, handler_name: str = 'count',
+                   loads: Callable = json.loads, **handler_options) -> Dict:
+    """
+    Parse a stream item by item and run each item through a handler
+
+    Args:
+        stream: Binary file-like object (e.g. request.stream)
+        data_format: FORMAT_NDJSON or FORMAT_JSON_ARRAY
+        handler_name: Key of ITEM_HANDLERS
+        loads: JSON decoder used for NDJSON lines
+        handler_options: Passed to the handler factory
+
+    Returns:
+        dict: Item count, bytes read, elapsed time, throughput and the
+        handler's own result
+
+    Raises:
+        StreamFormatError: On malformed input
+        KeyError: On an unknown handler name
+    """
+    handler = ITEM_HANDLERS[handler_name](**handler_options)
+    reader = _CountingReader(stream)
+    if data_format == FORMAT_NDJSON:
+        items = iter_ndjson(reader, loads=loads)
+    else:
+        items = iter_json_array(reader)
+
+    start = time.perf_counter()
+    count = 0
+    for item in items:
+        handler.handle(item)
+        count += 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        'format': data_format,
+        'handler': handler_name,
+        'processed_items': count,
+        'bytes': reader.bytes_read,
+        'seconds': round(elapsed, 4),
+        'items_per_second': round(count / elapsed) if elapsed else None,
+        'mb_per_second': round(reader.bytes_read / elapsed / 1e6, 2) if elapsed else None,
+        **handler.result()
+    }
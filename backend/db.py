@@ -1,16 +1,27 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor, Json, execute_values
 import os
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import logging
 
+from db_pool import ConnectionPool
+from credential_cache import CREDENTIAL_NOTIFY_CHANNEL, get_credential_cache
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Per-worker connection pool, created on first use
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
 
 def get_db_connection():
-    """Get a connection to the PostgreSQL database"""
+    """Open a new, unpooled connection to the PostgreSQL database (prefer db_connection())"""
     database_url = os.getenv('DATABASE_URL')
 
     if not database_url:
@@ -24,145 +35,955 @@ def get_db_connection():
         raise
 
 
-def init_db():
-    """Initialize the database with required tables"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def get_db_pool():
+    """Get or create this worker's connection pool"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A pool inherited across fork() shares sockets with the parent; start a fresh one
+        if _pool is None or _pool_pid != os.getpid():
+            database_url = os.getenv('DATABASE_URL')
+            if not database_url:
+                raise ValueError("DATABASE_URL environment variable is not set")
+            _pool = ConnectionPool(database_url, cursor_factory=RealDictCursor)
+            _pool_pid = os.getpid()
+        return _pool
 
-    try:
-        # Create pinterest_users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS pinterest_users (
-                id SERIAL PRIMARY KEY,
-                user_id VARCHAR(255) UNIQUE NOT NULL,
-                pinterest_username VARCHAR(255) NOT NULL,
-                pinterest_email VARCHAR(255) NOT NULL,
-                pinterest_password TEXT NOT NULL,
-                last_pinterest_login TIMESTAMP,
-                pinterest_cookies_valid BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
 
-        # Create index on user_id for faster lookups
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_pinterest_users_user_id
-            ON pinterest_users(user_id)
-        """)
+@contextmanager
+def db_connection():
+    """Check out a pooled connection for the duration of a with block"""
+    with get_db_pool().connection() as conn:
+        yield conn
 
-        conn.commit()
-        logger.info("Database tables created successfully")
 
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Failed to initialize database: {str(e)}")
-        raise
-    finally:
-        cursor.close()
-        conn.close()
+def db_pool_stats():
+    """Connection pool metrics for /api/metrics (without creating the pool)"""
+    if _pool is None or _pool_pid != os.getpid():
+        return {'initialized': False}
+    return {'initialized': True, **_pool.stats()}
+
+
+def _notify_credentials_changed(cursor, user_id):
+    """Announce a credential write to every worker's cache (delivered on commit)"""
+    cursor.execute("SELECT pg_notify(%s, %s)", (CREDENTIAL_NOTIFY_CHANNEL, user_id))
+
+
+def init_db():
+    """Initialize the database with required tables"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            # Create pinterest_users table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS pinterest_users (
+                    id SERIAL PRIMARY KEY,
+                    user_id VARCHAR(255) UNIQUE NOT NULL,
+                    pinterest_username VARCHAR(255) NOT NULL,
+                    pinterest_email VARCHAR(255) NOT NULL,
+                    pinterest_password TEXT NOT NULL,
+                    last_pinterest_login TIMESTAMP,
+                    pinterest_cookies_valid BOOLEAN DEFAULT FALSE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Create index on user_id for faster lookups
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_pinterest_users_user_id
+                ON pinterest_users(user_id)
+            """)
+
+            # Create edit_jobs table for asynchronous image edits
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS edit_jobs (
+                    id VARCHAR(36) PRIMARY KEY,
+                    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                    params JSONB NOT NULL DEFAULT '{}',
+                    original_filepath TEXT,
+                    result JSONB,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    completed_at TIMESTAMP
+                )
+            """)
+
+            # Unfinished jobs, scanned by the stale job reaper in edit_jobs.py
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_edit_jobs_unfinished
+                ON edit_jobs(updated_at) WHERE status IN ('queued', 'running')
+            """)
+
+            # Create client_events table for /api/events analytics
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS client_events (
+                    id BIGSERIAL PRIMARY KEY,
+                    event_type VARCHAR(255) NOT NULL,
+                    payload JSONB NOT NULL DEFAULT '{}',
+                    received_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_client_events_type_received
+                ON client_events(event_type, received_at)
+            """)
+
+            # Create pinterest_boards / pinterest_pins mirror tables, kept up
+            # to date by board_sync.py
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS pinterest_boards (
+                    user_id VARCHAR(255) NOT NULL,
+                    board_id VARCHAR(64) NOT NULL,
+                    name TEXT,
+                    description TEXT,
+                    pin_count INTEGER,
+                    url TEXT,
+                    image_thumbnail_url TEXT,
+                    privacy VARCHAR(32),
+                    synced_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, board_id)
+                )
+            """)
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS pinterest_pins (
+                    user_id VARCHAR(255) NOT NULL,
+                    board_id VARCHAR(64) NOT NULL,
+                    pin_id VARCHAR(64) NOT NULL,
+                    data JSONB NOT NULL DEFAULT '{}',
+                    pin_created_at TIMESTAMP,
+                    first_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    synced_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, board_id, pin_id),
+                    FOREIGN KEY (user_id, board_id)
+                        REFERENCES pinterest_boards (user_id, board_id) ON DELETE CASCADE
+                )
+            """)
+
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_pinterest_pins_board_created
+                ON pinterest_pins(user_id, board_id, pin_created_at DESC)
+            """)
+
+            # Sync progress per user ("user" scope) and per board ("board:<id>")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS pinterest_sync_state (
+                    user_id VARCHAR(255) NOT NULL,
+                    scope VARCHAR(128) NOT NULL,
+                    head_id VARCHAR(64),
+                    bookmark TEXT,
+                    complete BOOLEAN NOT NULL DEFAULT FALSE,
+                    pin_count INTEGER,
+                    pass_started_at TIMESTAMP,
+                    last_synced_at TIMESTAMP,
+                    sync_started_at TIMESTAMP,
+                    last_error TEXT,
+                    PRIMARY KEY (user_id, scope)
+                )
+            """)
+
+            # Create chat_conversations table for persisted /api/chat history
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS chat_conversations (
+                    user_id VARCHAR(255) PRIMARY KEY,
+                    messages JSONB NOT NULL DEFAULT '[]',
+                    version INTEGER NOT NULL DEFAULT 1,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            conn.commit()
+            logger.info("Database tables created successfully")
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to initialize database: {str(e)}")
+            raise
+        finally:
+            cursor.close()
 
 
 def save_pinterest_credentials(user_id, pinterest_username, pinterest_email, pinterest_password):
     """Save or update Pinterest credentials for a user"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                INSERT INTO pinterest_users
+                    (user_id, pinterest_username, pinterest_email, pinterest_password, updated_at)
+                VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id)
+                DO UPDATE SET
+                    pinterest_username = EXCLUDED.pinterest_username,
+                    pinterest_email = EXCLUDED.pinterest_email,
+                    pinterest_password = EXCLUDED.pinterest_password,
+                    updated_at = CURRENT_TIMESTAMP
+                RETURNING *
+            """, (user_id, pinterest_username, pinterest_email, pinterest_password))
+
+            result = cursor.fetchone()
+            _notify_credentials_changed(cursor, user_id)
+            conn.commit()
+            get_credential_cache().invalidate(user_id)
+            return dict(result) if result else None
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to save Pinterest credentials: {str(e)}")
+            raise
+        finally:
+            cursor.close()
 
-    try:
-        cursor.execute("""
-            INSERT INTO pinterest_users
-                (user_id, pinterest_username, pinterest_email, pinterest_password, updated_at)
-            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
-            ON CONFLICT (user_id)
-            DO UPDATE SET
-                pinterest_username = EXCLUDED.pinterest_username,
-                pinterest_email = EXCLUDED.pinterest_email,
-                pinterest_password = EXCLUDED.pinterest_password,
-                updated_at = CURRENT_TIMESTAMP
-            RETURNING *
-        """, (user_id, pinterest_username, pinterest_email, pinterest_password))
-
-        result = cursor.fetchone()
-        conn.commit()
-        return dict(result) if result else None
 
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Failed to save Pinterest credentials: {str(e)}")
-        raise
-    finally:
-        cursor.close()
-        conn.close()
+def get_pinterest_credentials(user_id):
+    """Get Pinterest credentials for a user (served from the credential cache when possible)"""
+    return get_credential_cache().get(user_id, _select_pinterest_credentials)
 
 
-def get_pinterest_credentials(user_id):
-    """Get Pinterest credentials for a user"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def _select_pinterest_credentials(user_id):
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    try:
-        cursor.execute("""
-            SELECT * FROM pinterest_users WHERE user_id = %s
-        """, (user_id,))
+        try:
+            cursor.execute("""
+                SELECT * FROM pinterest_users WHERE user_id = %s
+            """, (user_id,))
 
-        result = cursor.fetchone()
-        return dict(result) if result else None
+            result = cursor.fetchone()
+            return dict(result) if result else None
 
-    except Exception as e:
-        logger.error(f"Failed to get Pinterest credentials: {str(e)}")
-        raise
-    finally:
-        cursor.close()
-        conn.close()
+        except Exception as e:
+            logger.error(f"Failed to get Pinterest credentials: {str(e)}")
+            raise
+        finally:
+            cursor.close()
 
 
 def update_pinterest_login_status(user_id, cookies_valid):
     """Update the last login time and cookie validity status"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        cursor.execute("""
-            UPDATE pinterest_users
-            SET last_pinterest_login = CURRENT_TIMESTAMP,
-                pinterest_cookies_valid = %s,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE user_id = %s
-            RETURNING *
-        """, (cookies_valid, user_id))
-
-        result = cursor.fetchone()
-        conn.commit()
-        return dict(result) if result else None
-
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Failed to update login status: {str(e)}")
-        raise
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                UPDATE pinterest_users
+                SET last_pinterest_login = CURRENT_TIMESTAMP,
+                    pinterest_cookies_valid = %s,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = %s
+                RETURNING *
+            """, (cookies_valid, user_id))
+
+            result = cursor.fetchone()
+            _notify_credentials_changed(cursor, user_id)
+            conn.commit()
+            get_credential_cache().invalidate(user_id)
+            return dict(result) if result else None
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to update login status: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def update_pinterest_login_statuses(updates, touch_interval):
+    """
+    Apply several login status updates in one statement
+
+    A row is only written when cookies_valid changed or last_pinterest_login
+    (set from the database clock) is older than touch_interval, so repeated
+    identical checks do not rewrite the row.
+
+    Args:
+        updates: List of (user_id, cookies_valid) tuples, at most one per user
+        touch_interval: Seconds before an unchanged status is written again
+
+    Returns:
+        int: Number of rows updated
+    """
+    if not updates:
+        return 0
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            rows = execute_values(cursor, """
+                UPDATE pinterest_users AS u
+                SET last_pinterest_login = CURRENT_TIMESTAMP,
+                    pinterest_cookies_valid = v.cookies_valid,
+                    updated_at = CURRENT_TIMESTAMP
+                FROM (VALUES %s) AS v (user_id, cookies_valid, touch_interval)
+                WHERE u.user_id = v.user_id
+                  AND (u.pinterest_cookies_valid IS DISTINCT FROM v.cookies_valid
+                       OR u.last_pinterest_login IS NULL
+                       OR u.last_pinterest_login < CURRENT_TIMESTAMP - v.touch_interval * interval '1 second')
+                RETURNING u.user_id
+            """, [(user_id, valid, touch_interval) for user_id, valid in updates],
+                template='(%s, %s::boolean, %s::float8)', page_size=len(updates), fetch=True)
+
+            user_ids = [row['user_id'] for row in rows]
+            if user_ids:
+                cursor.execute("""
+                    SELECT pg_notify(%s, user_id) FROM unnest(%s::text[]) AS user_id
+                """, (CREDENTIAL_NOTIFY_CHANNEL, user_ids))
+            conn.commit()
+
+            cache = get_credential_cache()
+            for user_id in user_ids:
+                cache.invalidate(user_id)
+            return len(user_ids)
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to update login status for {len(updates)} user(s): {str(e)}")
+            raise
+        finally:
+            cursor.close()
 
 
 def delete_pinterest_credentials(user_id):
     """Delete Pinterest credentials for a user"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        cursor.execute("""
-            DELETE FROM pinterest_users WHERE user_id = %s
-            RETURNING user_id
-        """, (user_id,))
-
-        result = cursor.fetchone()
-        conn.commit()
-        return result is not None
-
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Failed to delete Pinterest credentials: {str(e)}")
-        raise
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                DELETE FROM pinterest_users WHERE user_id = %s
+                RETURNING user_id
+            """, (user_id,))
+
+            result = cursor.fetchone()
+            _notify_credentials_changed(cursor, user_id)
+            conn.commit()
+            get_credential_cache().invalidate(user_id)
+            return result is not None
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to delete Pinterest credentials: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def create_edit_job(job_id, params, original_filepath):
+    """Record a newly submitted image edit job"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                INSERT INTO edit_jobs (id, status, params, original_filepath)
+                VALUES (%s, 'queued', %s, %s)
+                RETURNING *
+            """, (job_id, Json(params), original_filepath))
+
+            result = cursor.fetchone()
+            conn.commit()
+            return dict(result) if result else None
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to create edit job: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def update_edit_job(job_id, status, result=None, error=None):
+    """
+    Update the status (and result or error) of an image edit job
+
+    Finished jobs (succeeded or failed, e.g. by the stale job reaper) are
+    left as they are; None is returned for them.
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                UPDATE edit_jobs
+                SET status = %s,
+                    result = COALESCE(%s, result),
+                    error = COALESCE(%s, error),
+                    updated_at = CURRENT_TIMESTAMP,
+                    completed_at = CASE WHEN %s IN ('succeeded', 'failed')
+                                        THEN CURRENT_TIMESTAMP ELSE completed_at END
+                WHERE id = %s AND status IN ('queued', 'running')
+                RETURNING *
+            """, (status, Json(result) if result is not None else None, error, status, job_id))
+
+            row = cursor.fetchone()
+            conn.commit()
+            return dict(row) if row else None
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to update edit job {job_id}: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def touch_edit_jobs(job_ids):
+    """Heartbeat: mark unfinished jobs as still owned by a live worker"""
+    if not job_ids:
+        return 0
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                UPDATE edit_jobs
+                SET updated_at = CURRENT_TIMESTAMP
+                WHERE id = ANY(%s) AND status IN ('queued', 'running')
+            """, (list(job_ids),))
+
+            touched = cursor.rowcount
+            conn.commit()
+            return touched
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to heartbeat {len(job_ids)} edit job(s): {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def fail_stale_edit_jobs(stale_seconds, error):
+    """
+    Fail unfinished jobs whose worker stopped heartbeating
+
+    Returns:
+        list: Ids of the jobs marked failed
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                UPDATE edit_jobs
+                SET status = 'failed',
+                    error = %s,
+                    updated_at = CURRENT_TIMESTAMP,
+                    completed_at = CURRENT_TIMESTAMP
+                WHERE status IN ('queued', 'running')
+                  AND updated_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                RETURNING id
+            """, (error, stale_seconds))
+
+            reaped = [row['id'] for row in cursor.fetchall()]
+            conn.commit()
+            return reaped
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to reap stale edit jobs: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def get_edit_job(job_id):
+    """Get an image edit job by id"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT * FROM edit_jobs WHERE id = %s
+            """, (job_id,))
+
+            result = cursor.fetchone()
+            return dict(result) if result else None
+
+        except Exception as e:
+            logger.error(f"Failed to get edit job {job_id}: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def insert_client_events(events):
+    """
+    Bulk insert analytics events in one round trip
+
+    Args:
+        events: List of (event_type, payload dict, received_at datetime) tuples
+
+    Returns:
+        int: Number of rows inserted
+    """
+    if not events:
+        return 0
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            execute_values(cursor, """
+                INSERT INTO client_events (event_type, payload, received_at)
+                VALUES %s
+            """, [(event_type, Json(payload), received_at) for event_type, payload, received_at in events],
+                page_size=len(events))
+
+            conn.commit()
+            return len(events)
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to insert {len(events)} client event(s): {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def get_chat_conversation_version(user_id):
+    """Get the version of a user's stored chat conversation (None if there is none)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT version FROM chat_conversations WHERE user_id = %s
+            """, (user_id,))
+
+            result = cursor.fetchone()
+            return result['version'] if result else None
+
+        except Exception as e:
+            logger.error(f"Failed to get chat conversation version: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def get_chat_conversation(user_id):
+    """Get a user's stored chat conversation (messages and version)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT * FROM chat_conversations WHERE user_id = %s
+            """, (user_id,))
+
+            result = cursor.fetchone()
+            return dict(result) if result else None
+
+        except Exception as e:
+            logger.error(f"Failed to get chat conversation: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def save_chat_conversation(user_id, messages):
+    """
+    Save a user's chat conversation, bumping its version
+
+    Args:
+        user_id: App user id
+        messages: JSON-serializable message dicts (langchain messages_to_dict)
+
+    Returns:
+        int: The new version
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                INSERT INTO chat_conversations (user_id, messages, version, updated_at)
+                VALUES (%s, %s, 1, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id)
+                DO UPDATE SET
+                    messages = EXCLUDED.messages,
+                    version = chat_conversations.version + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                RETURNING version
+            """, (user_id, Json(messages)))
+
+            result = cursor.fetchone()
+            conn.commit()
+            return result['version']
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to save chat conversation: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def list_pinterest_user_ids():
+    """Get the ids of all users with stored Pinterest credentials"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT user_id FROM pinterest_users ORDER BY user_id
+            """)
+
+            return [row['user_id'] for row in cursor.fetchall()]
+
+        except Exception as e:
+            logger.error(f"Failed to list Pinterest users: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def get_mirrored_boards(user_id):
+    """Get a user's boards from the local mirror"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT board_id, name, description, pin_count, url, image_thumbnail_url, privacy, synced_at
+                FROM pinterest_boards
+                WHERE user_id = %s
+                ORDER BY name, board_id
+            """, (user_id,))
+
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logger.error(f"Failed to get mirrored boards: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def get_mirrored_pins(user_id, board_id, limit=100, offset=0):
+    """Get a page of a board's pins from the local mirror, newest first"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT pin_id, data, pin_created_at, synced_at
+                FROM pinterest_pins
+                WHERE user_id = %s AND board_id = %s
+                ORDER BY pin_created_at DESC NULLS LAST, first_seen_at DESC, pin_id
+                LIMIT %s OFFSET %s
+            """, (user_id, board_id, limit, offset))
+
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logger.error(f"Failed to get mirrored pins for board {board_id}: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def replace_mirrored_boards(user_id, boards):
+    """
+    Make the mirror hold exactly these boards for a user
+
+    Upserts every board and deletes (with their pins) the ones that are gone.
+
+    Args:
+        user_id: App user id
+        boards: Board dicts as returned by PinterestService.get_boards()
+
+    Returns:
+        int: Number of boards removed from the mirror
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            if boards:
+                execute_values(cursor, """
+                    INSERT INTO pinterest_boards
+                        (user_id, board_id, name, description, pin_count, url, image_thumbnail_url, privacy, synced_at)
+                    VALUES %s
+                    ON CONFLICT (user_id, board_id)
+                    DO UPDATE SET
+                        name = EXCLUDED.name,
+                        description = EXCLUDED.description,
+                        pin_count = EXCLUDED.pin_count,
+                        url = EXCLUDED.url,
+                        image_thumbnail_url = EXCLUDED.image_thumbnail_url,
+                        privacy = EXCLUDED.privacy,
+                        synced_at = EXCLUDED.synced_at
+                """, [(user_id, str(board['id']), board.get('name'), board.get('description'), board.get('pin_count'),
+                       board.get('url'), board.get('image_thumbnail_url'), board.get('privacy'))
+                      for board in boards],
+                    template='(%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)', page_size=len(boards))
+
+            cursor.execute("""
+                DELETE FROM pinterest_boards
+                WHERE user_id = %s AND NOT (board_id = ANY(%s))
+            """, (user_id, [str(board['id']) for board in boards]))
+            removed = cursor.rowcount
+
+            cursor.execute("""
+                DELETE FROM pinterest_sync_state
+                WHERE user_id = %s AND scope LIKE 'board:%%' AND NOT (scope = ANY(%s))
+            """, (user_id, [f"board:{board['id']}" for board in boards]))
+
+            conn.commit()
+            return removed
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to update mirrored boards: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def upsert_mirrored_pins(user_id, board_id, pins):
+    """
+    Insert or refresh pins of one board in the mirror
+
+    Args:
+        user_id: App user id
+        board_id: Pinterest board id
+        pins: List of (pin_id, pin dict, pin created_at datetime or None) tuples
+
+    Returns:
+        int: Number of pins written
+    """
+    if not pins:
+        return 0
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            execute_values(cursor, """
+                INSERT INTO pinterest_pins (user_id, board_id, pin_id, data, pin_created_at, synced_at)
+                VALUES %s
+                ON CONFLICT (user_id, board_id, pin_id)
+                DO UPDATE SET
+                    data = EXCLUDED.data,
+                    pin_created_at = EXCLUDED.pin_created_at,
+                    synced_at = EXCLUDED.synced_at
+            """, [(user_id, board_id, pin_id, Json(data), created_at) for pin_id, data, created_at in pins],
+                template='(%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)', page_size=len(pins))
+
+            conn.commit()
+            return len(pins)
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to upsert {len(pins)} mirrored pin(s) for board {board_id}: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def delete_unseen_mirrored_pins(user_id, board_id, seen_since):
+    """Delete a board's pins not seen by a full sync pass that started at seen_since"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                DELETE FROM pinterest_pins
+                WHERE user_id = %s AND board_id = %s AND synced_at < %s
+            """, (user_id, board_id, seen_since))
+
+            removed = cursor.rowcount
+            conn.commit()
+            return removed
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to delete unseen pins for board {board_id}: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def clear_pinterest_mirror(user_id):
+    """Delete a user's mirrored boards, pins and sync progress"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                DELETE FROM pinterest_boards WHERE user_id = %s
+            """, (user_id,))
+            cursor.execute("""
+                DELETE FROM pinterest_sync_state WHERE user_id = %s
+            """, (user_id,))
+
+            conn.commit()
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to clear Pinterest mirror: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def get_pinterest_sync_state(user_id):
+    """Get a user's sync progress rows keyed by scope ("user", "board:<id>")"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT *,
+                       EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - last_synced_at))::float AS age_seconds,
+                       EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - pass_started_at))::float AS pass_age_seconds
+                FROM pinterest_sync_state WHERE user_id = %s
+            """, (user_id,))
+
+            return {row['scope']: dict(row) for row in cursor.fetchall()}
+
+        except Exception as e:
+            logger.error(f"Failed to get Pinterest sync state: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def save_pinterest_sync_state(user_id, scope, **fields):
+    """
+    Create or update one sync progress row
+
+    Args:
+        user_id: App user id
+        scope: "user" or "board:<board_id>"
+        fields: Columns to set (head_id, bookmark, complete, pin_count, last_error)
+    """
+    allowed = {'head_id', 'bookmark', 'complete', 'pin_count', 'last_error'}
+    unknown = set(fields) - allowed
+    if unknown:
+        raise ValueError(f"Unknown sync state field(s): {', '.join(sorted(unknown))}")
+
+    columns = list(fields)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            query = sql.SQL("""
+                INSERT INTO pinterest_sync_state (user_id, scope{columns})
+                VALUES (%s, %s{placeholders})
+                ON CONFLICT (user_id, scope)
+                DO {action}
+            """).format(
+                columns=sql.SQL('').join(sql.SQL(', ') + sql.Identifier(c) for c in columns),
+                placeholders=sql.SQL(', %s' * len(columns)),
+                action=sql.SQL('UPDATE SET ') + sql.SQL(', ').join(
+                    sql.SQL('{0} = EXCLUDED.{0}').format(sql.Identifier(c)) for c in columns
+                ) if columns else sql.SQL('NOTHING')
+            )
+            cursor.execute(query, [user_id, scope] + [fields[c] for c in columns])
+            conn.commit()
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to save Pinterest sync state ({scope}): {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def begin_pinterest_full_pass(user_id, scope):
+    """
+    Restart a scope's full pass from the first page
+
+    Returns:
+        datetime: When the pass started (database clock), for delete_unseen_mirrored_pins
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                INSERT INTO pinterest_sync_state (user_id, scope, complete, bookmark, pass_started_at)
+                VALUES (%s, %s, FALSE, NULL, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id, scope)
+                DO UPDATE SET
+                    complete = FALSE,
+                    bookmark = NULL,
+                    pass_started_at = CURRENT_TIMESTAMP
+                RETURNING pass_started_at
+            """, (user_id, scope))
+
+            result = cursor.fetchone()
+            conn.commit()
+            return result['pass_started_at']
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to begin Pinterest full pass ({scope}): {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def claim_pinterest_sync(user_id, lease_seconds):
+    """
+    Claim the right to sync a user's mirror (across all workers)
+
+    Returns:
+        bool: True if claimed; False if another sync holds an unexpired lease
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                INSERT INTO pinterest_sync_state (user_id, scope, sync_started_at)
+                VALUES (%s, 'user', CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id, scope)
+                DO UPDATE SET sync_started_at = CURRENT_TIMESTAMP
+                WHERE pinterest_sync_state.sync_started_at IS NULL
+                   OR pinterest_sync_state.sync_started_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                RETURNING user_id
+            """, (user_id, lease_seconds))
+
+            claimed = cursor.fetchone() is not None
+            conn.commit()
+            return claimed
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to claim Pinterest sync: {str(e)}")
+            raise
+        finally:
+            cursor.close()
+
+
+def finish_pinterest_sync(user_id, error=None):
+    """Release the sync lease, recording success time or the error"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                UPDATE pinterest_sync_state
+                SET sync_started_at = NULL,
+                    last_synced_at = CASE WHEN %s IS NULL THEN CURRENT_TIMESTAMP ELSE last_synced_at END,
+                    last_error = %s
+                WHERE user_id = %s AND scope = 'user'
+            """, (error, error, user_id))
+
+            conn.commit()
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Failed to finish Pinterest sync: {str(e)}")
+            raise
+        finally:
+            cursor.close()
@@ -0,0 +1,147 @@
+"""
+Async database access
+asyncpg counterpart of the Pinterest credential functions in db.py, for code
+running on an event loop. Same names, arguments and return values (rows as
+dicts); db.py stays the API for the synchronous request path.
+"""
+
+import asyncio
+import os
+import logging
+from typing import Dict, Optional
+
+import asyncpg
+from dotenv import load_dotenv
+
+from credential_cache import CREDENTIAL_NOTIFY_CHANNEL, get_credential_cache
+from db_pool import DB_POOL_MIN, DB_POOL_MAX_LIFETIME, DB_POOL_ACQUIRE_TIMEOUT
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on connections per event loop (opened on top of db.py's DB_POOL_MAX)
+DB_ASYNC_POOL_MAX = int(os.getenv('DB_ASYNC_POOL_MAX', 2))
+
+# One pool per event loop (asyncpg connections are bound to the loop that opened them)
+_pools = {}
+
+
+async def get_db_pool() -> asyncpg.Pool:
+    """Get or create the connection pool for the running event loop"""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        database_url = os.getenv('DATABASE_URL')
+        if not database_url:
+            raise ValueError("DATABASE_URL environment variable is not set")
+        try:
+            pool = await asyncpg.create_pool(
+                database_url,
+                min_size=min(DB_POOL_MIN, DB_ASYNC_POOL_MAX),
+                max_size=DB_ASYNC_POOL_MAX,
+                max_inactive_connection_lifetime=DB_POOL_MAX_LIFETIME
+            )
+        except Exception as e:
+            logger.error(f"Failed to connect to database: {str(e)}")
+            raise
+        _pools[loop] = pool
+    return pool
+
+
+async def close_db_pool():
+    """Close the running event loop's pool (call before the loop shuts down)"""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+def _row(record) -> Optional[Dict]:
+    return dict(record) if record is not None else None
+
+
+async def save_pinterest_credentials(user_id, pinterest_username, pinterest_email, pinterest_password):
+    """Save or update Pinterest credentials for a user"""
+    pool = await get_db_pool()
+    try:
+        async with pool.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT) as conn:
+            async with conn.transaction():
+                result = await conn.fetchrow("""
+                    INSERT INTO pinterest_users
+                        (user_id, pinterest_username, pinterest_email, pinterest_password, updated_at)
+                    VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)
+                    ON CONFLICT (user_id)
+                    DO UPDATE SET
+                        pinterest_username = EXCLUDED.pinterest_username,
+                        pinterest_email = EXCLUDED.pinterest_email,
+                        pinterest_password = EXCLUDED.pinterest_password,
+                        updated_at = CURRENT_TIMESTAMP
+                    RETURNING *
+                """, user_id, pinterest_username, pinterest_email, pinterest_password)
+                await conn.execute("SELECT pg_notify($1, $2)", CREDENTIAL_NOTIFY_CHANNEL, user_id)
+
+        get_credential_cache().invalidate(user_id)
+        return _row(result)
+
+    except Exception as e:
+        logger.error(f"Failed to save Pinterest credentials: {str(e)}")
+        raise
+
+
+async def get_pinterest_credentials(user_id):
+    """Get Pinterest credentials for a user"""
+    pool = await get_db_pool()
+    try:
+        async with pool.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT) as conn:
+            result = await conn.fetchrow("""
+                SELECT * FROM pinterest_users WHERE user_id = $1
+            """, user_id)
+        return _row(result)
+
+    except Exception as e:
+        logger.error(f"Failed to get Pinterest credentials: {str(e)}")
+        raise
+
+
+async def update_pinterest_login_status(user_id, cookies_valid):
+    """Update the last login time and cookie validity status"""
+    pool = await get_db_pool()
+    try:
+        async with pool.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT) as conn:
+            async with conn.transaction():
+                result = await conn.fetchrow("""
+                    UPDATE pinterest_users
+                    SET last_pinterest_login = CURRENT_TIMESTAMP,
+                        pinterest_cookies_valid = $1,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE user_id = $2
+                    RETURNING *
+                """, cookies_valid, user_id)
+                await conn.execute("SELECT pg_notify($1, $2)", CREDENTIAL_NOTIFY_CHANNEL, user_id)
+
+        get_credential_cache().invalidate(user_id)
+        return _row(result)
+
+    except Exception as e:
+        logger.error(f"Failed to update login status: {str(e)}")
+        raise
+
+
+async def delete_pinterest_credentials(user_id):
+    """Delete Pinterest credentials for a user"""
+    pool = await get_db_pool()
+    try:
+        async with pool.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT) as conn:
+            async with conn.transaction():
+                result = await conn.fetchrow("""
+                    DELETE FROM pinterest_users WHERE user_id = $1
+                    RETURNING user_id
+                """, user_id)
+                await conn.execute("SELECT pg_notify($1, $2)", CREDENTIAL_NOTIFY_CHANNEL, user_id)
+
+        get_credential_cache().invalidate(user_id)
+        return result is not None
+
+    except Exception as e:
+        logger.error(f"Failed to delete Pinterest credentials: {str(e)}")
+        raise
@@ -0,0 +1,301 @@
+"""
+PostgreSQL connection pool
+Thread-safe pool of psycopg2 connections with a minimum and maximum size,
+a liveness check for connections that sat idle, recycling after a maximum
+lifetime and acquisition-time metrics
+"""
+
+import os
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+import psycopg2
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+# Connections opened up front and kept through idle periods
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+# Upper bound on open connections per worker (checked out + idle). A sync
+# worker serves one request at a time, so this only needs room for it plus
+# the background flushers; the instance total is workers x (this + 1 for the
+# credential LISTEN connection), which must stay under the database's limit
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 3))
+# Connections older than this are closed and replaced (managed Postgres and
+# proxies drop long-lived connections)
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))
+# Connections idle for longer than this are pinged before being handed out
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30))
+# Seconds to wait for a free connection when the pool is at its maximum
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', 10))
+
+# Recent acquisition times kept for the percentiles in stats()
+_ACQUIRE_SAMPLES = 1000
+
+
+def _percentile_ms(sorted_seconds, fraction: float):
+    if not sorted_seconds:
+        return None
+    index = min(len(sorted_seconds) - 1, int(len(sorted_seconds) * fraction))
+    return round(sorted_seconds[index] * 1000, 3)
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the acquire timeout"""
+
+
+class _PooledConnection:
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn, created_at: float):
+        self.conn = conn
+        self.created_at = created_at
+        self.last_used = created_at
+
+
+class ConnectionPool:
+    """
+    Per-worker pool of database connections
+
+    Idle connections are reused most-recently-used first, so the warmest
+    connections are kept busy and surplus ones age out. A connection is
+    closed instead of reused once it is older than max_lifetime, when it
+    fails the liveness check or when the caller reports it broken. New
+    connections are opened outside the pool lock, so a slow handshake never
+    blocks callers that could take an idle connection.
+    """
+
+    def __init__(self, dsn: str, minconn: int = DB_POOL_MIN, maxconn: int = DB_POOL_MAX,
+                 max_lifetime: float = DB_POOL_MAX_LIFETIME,
+                 health_check_interval: float = DB_POOL_HEALTH_CHECK_INTERVAL,
+                 acquire_timeout: float = DB_POOL_ACQUIRE_TIMEOUT,
+                 connect: Callable = psycopg2.connect, **connect_kwargs):
+        self.dsn = dsn
+        self.minconn = max(0, min(minconn, maxconn))
+        self.maxconn = max(1, maxconn)
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self._connect = connect
+        self._connect_kwargs = connect_kwargs
+        self._idle = deque()
+        self._in_use = {}
+        self._opening = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._acquire_times = deque(maxlen=_ACQUIRE_SAMPLES)
+        self._counters = {
+            'acquired': 0, 'waited': 0, 'timeouts': 0, 'opened': 0, 'closed': 0,
+            'recycled': 0, 'health_check_failures': 0, 'discarded': 0
+        }
+        self._fill()
+
+    def _size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _open(self) -> _PooledConnection:
+        conn = self._connect(self.dsn, **self._connect_kwargs)
+        with self._cond:
+            self._counters['opened'] += 1
+        return _PooledConnection(conn, time.monotonic())
+
+    def _close(self, pooled: _PooledConnection):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._counters['closed'] += 1
+
+    def _fill(self):
+        """Open connections until the pool holds minconn"""
+        while True:
+            with self._cond:
+                if self._closed or self._size() >= self.minconn:
+                    return
+                self._opening += 1
+            try:
+                pooled = self._open()
+            except Exception as e:
+                logger.error(f"Failed to open pooled database connection: {str(e)}")
+                with self._cond:
+                    self._opening -= 1
+                return
+            with self._cond:
+                self._opening -= 1
+                self._idle.append(pooled)
+                self._cond.notify()
+
+    def _expired(self, pooled: _PooledConnection, now: float) -> bool:
+        return self.max_lifetime > 0 and now - pooled.created_at >= self.max_lifetime
+
+    def _alive(self, pooled: _PooledConnection) -> bool:
+        if pooled.conn.closed:
+            return False
+        try:
+            with pooled.conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            pooled.conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self, timeout: float = None):
+        """
+        Check out a connection
+
+        Args:
+            timeout: Seconds to wait when the pool is exhausted (defaults to acquire_timeout)
+
+        Returns:
+            A psycopg2 connection; give it back with putconn()
+
+        Raises:
+            PoolTimeout: If no connection became available in time
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        while True:
+            pooled = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout('Connection pool is closed')
+                    if self._idle or self._size() < self.maxconn:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeout(f'No database connection available within {timeout:g}s '
+                                          f'({self.maxconn} in use)')
+                    waited = True
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    pooled = self._idle.pop()
+                    # Counted as checked out while it is being checked
+                    self._in_use[id(pooled.conn)] = pooled
+                else:
+                    self._opening += 1
+
+            if pooled is None:
+                try:
+                    pooled = self._open()
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        if pooled is not None:
+                            self._in_use[id(pooled.conn)] = pooled
+                        self._cond.notify()
+            else:
+                now = time.monotonic()
+                failure = None
+                if self._expired(pooled, now):
+                    failure = 'recycled'
+                elif now - pooled.last_used >= self.health_check_interval and not self._alive(pooled):
+                    failure = 'health_check_failures'
+                if failure:
+                    self._close(pooled)
+                    with self._cond:
+                        self._in_use.pop(id(pooled.conn), None)
+                        self._counters[failure] += 1
+                        self._cond.notify()
+                    continue
+
+            with self._cond:
+                self._counters['acquired'] += 1
+                if waited:
+                    self._counters['waited'] += 1
+                self._acquire_times.append(time.monotonic() - start)
+            return pooled.conn
+
+    def putconn(self, conn, discard: bool = False):
+        """
+        Return a connection to the pool
+
+        Args:
+            conn: Connection from getconn()
+            discard: Close it instead of reusing it (e.g. after a connection error)
+        """
+        with self._cond:
+            pooled = self._in_use.pop(id(conn), None)
+        if pooled is None:
+            logger.warning("Returned a connection that is not checked out from this pool")
+            return
+
+        if not discard and not conn.closed and not self._expired(pooled, time.monotonic()):
+            try:
+                # Never hand out a connection in the middle of a transaction
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        if discard:
+            self._close(pooled)
+            with self._cond:
+                self._counters['discarded'] += 1
+                self._cond.notify()
+            self._fill()
+            return
+
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            if self._closed:
+                discard = True
+            else:
+                self._idle.append(pooled)
+                self._cond.notify()
+        if discard:
+            self._close(pooled)
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """
+        Check out a connection for the duration of a with block
+
+        The connection is discarded instead of reused if the block fails
+        with a connection-level error (or leaves it closed).
+        """
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, discard=broken or bool(conn.closed))
+
+    def close(self):
+        """Close idle connections; checked-out ones are closed when returned"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._cond.notify_all()
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            times = sorted(self._acquire_times)
+            return {
+                **self._counters,
+                'size': self._size(),
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'min': self.minconn,
+                'max': self.maxconn,
+                'acquire_ms_p50': _percentile_ms(times, 0.5),
+                'acquire_ms_p95': _percentile_ms(times, 0.95),
+                'acquire_ms_max': _percentile_ms(times, 1.0)
+            }
@@ -0,0 +1,206 @@
+"""
+Asynchronous image edit jobs
+Runs fal.ai edits on a background executor so request workers return
+immediately; job state lives in Postgres so any worker can answer a poll.
+Each worker heartbeats the jobs it owns, and jobs whose worker died (restart,
+timeout kill, deploy) are failed by whichever worker notices first.
+"""
+
+import os
+import threading
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from admission import AdmissionRejected
+from blob_store import get_blob_store
+from db import create_edit_job, update_edit_job, get_edit_job, touch_edit_jobs, fail_stale_edit_jobs
+from fal_service import get_fal_service
+
+logger = logging.getLogger(__name__)
+
+# Concurrent background edits per gunicorn worker
+EDIT_JOB_WORKERS = int(os.getenv('EDIT_JOB_WORKERS', 4))
+# Jobs a worker accepts (queued + running) before answering 503
+EDIT_JOB_MAX_QUEUED = int(os.getenv('EDIT_JOB_MAX_QUEUED', 32))
+# Seconds between heartbeats of a worker's unfinished jobs
+EDIT_JOB_HEARTBEAT_INTERVAL = float(os.getenv('EDIT_JOB_HEARTBEAT_INTERVAL', 30))
+# Unfinished jobs without a heartbeat for this long are marked failed
+EDIT_JOB_STALE_SECONDS = float(os.getenv('EDIT_JOB_STALE_SECONDS', 180))
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+_executor = ThreadPoolExecutor(max_workers=EDIT_JOB_WORKERS, thread_name_prefix='edit-job')
+
+# Unfinished jobs owned by this worker
+_active = set()
+_active_lock = threading.Lock()
+_heartbeat_thread = None
+_counters = {'submitted': 0, 'rejected': 0, 'reaped': 0}
+
+
+def submit_edit_job(edit_kwargs: Dict, params: Dict, original_filepath: Optional[str] = None,
+                    blob_hold: Optional[str] = None) -> str:
+    """
+    Queue an image edit to run in the background
+
+    Args:
+        edit_kwargs: Keyword arguments for FalImageService.edit_image
+        params: JSON-serializable request parameters to record with the job
+        original_filepath: Where the uploaded original was saved
+        blob_hold: Upload store hold on the job's images, released when the job ends
+
+    Returns:
+        str: Job id to poll with get_job()
+
+    Raises:
+        AdmissionRejected: (503) If this worker already has
+            EDIT_JOB_MAX_QUEUED unfinished jobs
+    """
+    job_id = str(uuid.uuid4())
+    with _active_lock:
+        full = len(_active) >= EDIT_JOB_MAX_QUEUED
+        if full:
+            _counters['rejected'] += 1
+        else:
+            _active.add(job_id)
+            _counters['submitted'] += 1
+    if full:
+        if blob_hold:
+            get_blob_store().release(blob_hold)
+        raise AdmissionRejected(
+            f"Edit job queue is full ({EDIT_JOB_MAX_QUEUED} jobs), try again later",
+            status_code=503,
+            retry_after=max(1, round(EDIT_JOB_HEARTBEAT_INTERVAL))
+        )
+
+    try:
+        create_edit_job(job_id, params, original_filepath)
+        _executor.submit(_run_edit_job, job_id, edit_kwargs, blob_hold)
+    except Exception:
+        with _active_lock:
+            _active.discard(job_id)
+        raise
+    _start_heartbeat()
+
+    logger.info(f"Edit job {job_id} queued")
+    return job_id
+
+
+def _run_edit_job(job_id: str, edit_kwargs: Dict, blob_hold: Optional[str] = None):
+    """Run one edit job and record its outcome"""
+    try:
+        _edit(job_id, edit_kwargs)
+    finally:
+        with _active_lock:
+            _active.discard(job_id)
+        if blob_hold:
+            try:
+                get_blob_store().release(blob_hold)
+            except Exception as e:
+                logger.error(f"Failed to release upload hold of edit job {job_id}: {str(e)}")
+
+
+def _edit(job_id: str, edit_kwargs: Dict):
+    try:
+        update_edit_job(job_id, JOB_RUNNING)
+        result = get_fal_service().edit_image(**edit_kwargs)
+    except Exception as e:
+        logger.error(f"Edit job {job_id} failed: {str(e)}")
+        try:
+            update_edit_job(job_id, JOB_FAILED, error=str(e))
+        except Exception as db_error:
+            logger.error(f"Failed to record failure of edit job {job_id}: {str(db_error)}")
+        return
+
+    try:
+        update_edit_job(job_id, JOB_SUCCEEDED, result=result)
+        logger.info(f"Edit job {job_id} succeeded")
+    except Exception as e:
+        logger.error(f"Failed to record result of edit job {job_id}: {str(e)}")
+
+
+def heartbeat() -> int:
+    """Refresh this worker's unfinished jobs and fail other workers' abandoned ones; returns the number failed"""
+    with _active_lock:
+        active = list(_active)
+    touch_edit_jobs(active)
+
+    reaped = fail_stale_edit_jobs(
+        EDIT_JOB_STALE_SECONDS,
+        f"Job abandoned: no heartbeat for {EDIT_JOB_STALE_SECONDS:g}s (worker restarted or was stopped)"
+    )
+    if reaped:
+        with _active_lock:
+            _counters['reaped'] += len(reaped)
+        logger.warning(f"Marked {len(reaped)} abandoned edit job(s) as failed: {', '.join(reaped)}")
+    return len(reaped)
+
+
+def _heartbeat_loop():
+    stop = threading.Event()
+    while not stop.wait(EDIT_JOB_HEARTBEAT_INTERVAL):
+        try:
+            heartbeat()
+        except Exception as e:
+            logger.error(f"Edit job heartbeat failed: {str(e)}")
+
+
+def _start_heartbeat():
+    global _heartbeat_thread
+    if _heartbeat_thread is not None:
+        return
+    with _active_lock:
+        if _heartbeat_thread is not None:
+            return
+        _heartbeat_thread = threading.Thread(target=_heartbeat_loop, name='edit-job-heartbeat', daemon=True)
+        _heartbeat_thread.start()
+
+
+def job_stats() -> Dict:
+    """Per-worker job counters for /api/metrics"""
+    with _active_lock:
+        return {
+            **_counters,
+            'active': len(_active),
+            'max_queued': EDIT_JOB_MAX_QUEUED
+        }
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    """
+    Get the public view of an edit job
+
+    Returns:
+        dict: Job id, status, timestamps and (once finished) result or error,
+        or None if the job does not exist
+    """
+    # Pollers keep the reaper running, so jobs abandoned by a dead worker reach a terminal state
+    _start_heartbeat()
+    job = get_edit_job(job_id)
+    if not job:
+        return None
+
+    view = {
+        'job_id': job['id'],
+        'job_status': job['status'],
+        'prompt': job['params'].get('prompt'),
+        'original_filepath': job['original_filepath'],
+        'created_at': job['created_at'].isoformat() if job['created_at'] else None,
+        'updated_at': job['updated_at'].isoformat() if job['updated_at'] else None,
+        'completed_at': job['completed_at'].isoformat() if job['completed_at'] else None
+    }
+
+    if job['status'] == JOB_SUCCEEDED:
+        edited_images = (job['result'] or {}).get('images', [])
+        view['edited_image_url'] = edited_images[0]['url'] if edited_images else None
+        view['edited_images'] = edited_images
+        view['seed'] = (job['result'] or {}).get('seed')
+    elif job['status'] == JOB_FAILED:
+        view['error'] = job['error']
+
+    return view
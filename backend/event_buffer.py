@@ -0,0 +1,164 @@
+"""
+Buffered event ingestion
+Collects /api/events payloads in memory and writes them to Postgres in bulk,
+once enough events are buffered or enough time has passed, and on shutdown
+"""
+
+import atexit
+import os
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Tuple
+
+from db import insert_client_events
+
+logger = logging.getLogger(__name__)
+
+# Flush when this many events are buffered...
+EVENT_FLUSH_SIZE = int(os.getenv('EVENT_FLUSH_SIZE', 500))
+# ...or this many seconds after the oldest unflushed event arrived
+EVENT_FLUSH_INTERVAL = float(os.getenv('EVENT_FLUSH_INTERVAL', 5))
+# Events kept while the database is unreachable; the oldest are dropped beyond this
+EVENT_BUFFER_MAX = int(os.getenv('EVENT_BUFFER_MAX', 50000))
+
+
+class EventBuffer:
+    """
+    Per-worker buffer of analytics events flushed by a background thread
+
+    add() only appends under a lock; the flusher thread swaps the buffer out
+    and writes it with a single multi-row INSERT. Failed flushes put the
+    events back (bounded by max_buffered) and are retried on the next tick.
+    """
+
+    def __init__(self, flush_size: int = EVENT_FLUSH_SIZE,
+                 flush_interval: float = EVENT_FLUSH_INTERVAL,
+                 max_buffered: int = EVENT_BUFFER_MAX,
+                 writer=insert_client_events):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.writer = writer
+        self._events = []
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+        self._retry_at = 0.0
+        self._counters = {'received': 0, 'flushed': 0, 'flushes': 0, 'failed_flushes': 0, 'dropped': 0}
+
+    def add(self, event_type: str, payload: Dict):
+        """Buffer a single event"""
+        self.add_many([(event_type, payload)])
+
+    def add_many(self, events: Iterable[Tuple[str, Dict]]):
+        """Buffer several events at once (one lock acquisition, one wake-up)"""
+        received_at = datetime.utcnow()
+        with self._cond:
+            before = len(self._events)
+            self._events.extend((event_type, payload, received_at) for event_type, payload in events)
+            self._counters['received'] += len(self._events) - before
+            self._trim()
+            if self._oldest is None and self._events:
+                self._oldest = time.monotonic()
+            if len(self._events) >= self.flush_size:
+                self._cond.notify()
+
+        self._start()
+
+    def _trim(self):
+        overflow = len(self._events) - self.max_buffered
+        if overflow > 0:
+            del self._events[:overflow]
+            self._counters['dropped'] += overflow
+            logger.warning(f"Event buffer full, dropped {overflow} oldest event(s)")
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of events written"""
+        with self._flush_lock:
+            with self._cond:
+                events, self._events = self._events, []
+                self._oldest = None
+            if not events:
+                return 0
+
+            written = 0
+            try:
+                while written < len(events):
+                    batch = events[written:written + self.flush_size]
+                    self.writer(batch)
+                    written += len(batch)
+                    with self._cond:
+                        self._counters['flushed'] += len(batch)
+                        self._counters['flushes'] += 1
+            except Exception as e:
+                logger.error(f"Failed to flush {len(events) - written} event(s): {str(e)}")
+                with self._cond:
+                    self._counters['failed_flushes'] += 1
+                    # Keep the unwritten tail for the next attempt, ahead of newer events
+                    self._events[:0] = events[written:]
+                    self._trim()
+                    self._oldest = self._oldest or time.monotonic()
+                    # Back off instead of hammering an unavailable database
+                    self._retry_at = time.monotonic() + self.flush_interval
+            return written
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = time.monotonic()
+                    due = self._oldest is not None and now - self._oldest >= self.flush_interval
+                    if (due or len(self._events) >= self.flush_size) and now >= self._retry_at:
+                        break
+                    deadline = self._oldest + self.flush_interval if self._oldest is not None else now + self.flush_interval
+                    self._cond.wait(timeout=max(deadline, self._retry_at) - now)
+                stopped = self._stopped
+            self.flush()
+            if stopped:
+                return
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='event-flush', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Stop the flusher thread after a final flush (called at worker shutdown)"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                **self._counters,
+                'buffered': len(self._events),
+                'flush_size': self.flush_size,
+                'flush_interval_seconds': self.flush_interval
+            }
+
+
+# Singleton instance
+_event_buffer = None
+_event_buffer_lock = threading.Lock()
+
+
+def get_event_buffer() -> EventBuffer:
+    """Get or create this worker's event buffer"""
+    global _event_buffer
+    with _event_buffer_lock:
+        if _event_buffer is None:
+            _event_buffer = EventBuffer()
+        return _event_buffer
@@ -5,44 +5,234 @@ Handles image uploads and AI-powered image editing using fal.ai
 
 import os
 import fal_client
+from fal_client.client import MULTIPART_THRESHOLD
+import hashlib
+import json
+import mimetypes
 import tempfile
+import time
 import logging
-from typing import Dict, Optional, Union
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from admission import AdmissionController, get_admission_controller
+from resilience import FAL_HEDGE_ENABLED, DeadlineExceeded, ResiliencePolicy
+from sqlite_cache import SqliteTTLCache
 
 logger = logging.getLogger(__name__)
 
+# Content-addressed cache of image SHA-256 digest -> fal storage URL
+# (set FAL_URL_CACHE_TTL=0 to disable)
+URL_CACHE_TTL = float(os.getenv('FAL_URL_CACHE_TTL', 24 * 3600))
+URL_CACHE_MAX_ENTRIES = int(os.getenv('FAL_URL_CACHE_MAX_ENTRIES', 10000))
+
+# Memoized edit results for requests with an explicit seed
+# (set FAL_RESULT_CACHE_TTL=0 to disable)
+RESULT_CACHE_TTL = float(os.getenv('FAL_RESULT_CACHE_TTL', 24 * 3600))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('FAL_RESULT_CACHE_MAX_ENTRIES', 10000))
+
+EDIT_MODEL = "fal-ai/alpha-image-232/edit-image"
+
+# How upload_image_from_bytes sends data to fal storage
+UPLOAD_MODE_MEMORY = 'memory'
+UPLOAD_MODE_TEMPFILE = 'tempfile'
+
+# (offset, signature, content type) checked against the start of the image
+_IMAGE_SIGNATURES = (
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'BM', 'image/bmp'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+)
+
+# ISO base media "ftyp" brands used by HEIF/AVIF images
+_FTYP_BRANDS = {
+    b'avif': 'image/avif',
+    b'avis': 'image/avif',
+    b'heic': 'image/heic',
+    b'heix': 'image/heic',
+    b'heim': 'image/heic',
+    b'heis': 'image/heic',
+    b'mif1': 'image/heif',
+    b'msf1': 'image/heif',
+}
+
+
+def detect_image_content_type(image_data: Union[bytes, bytearray, memoryview], filename: str = "") -> str:
+    """
+    Detect an image's content type from its magic bytes
+
+    Args:
+        image_data: Raw image bytes (only the first few bytes are inspected)
+        filename: Used as a fallback when the signature is not recognised
+
+    Returns:
+        str: MIME type, e.g. "image/png"
+    """
+    header = bytes(image_data[:16])
+
+    for offset, signature, content_type in _IMAGE_SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            return content_type
+
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+
+    if header[4:8] == b'ftyp' and header[8:12] in _FTYP_BRANDS:
+        return _FTYP_BRANDS[header[8:12]]
+
+    guessed, _ = mimetypes.guess_type(filename)
+    return guessed or 'application/octet-stream'
+
+
+def image_sha256(image_data: Union[bytes, bytearray, memoryview, os.PathLike], chunk_size: int = 1024 * 1024) -> str:
+    """
+    SHA-256 hex digest of image bytes or of an image file on disk
+
+    Args:
+        image_data: Raw image bytes or a file path
+        chunk_size: Read size when hashing a file
+
+    Returns:
+        str: Hex digest
+    """
+    if not isinstance(image_data, os.PathLike):
+        return hashlib.sha256(image_data).hexdigest()
+
+    digest = hashlib.sha256()
+    with open(image_data, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def edit_result_key(
+    image_digest: str,
+    prompt: str,
+    seed: int,
+    image_size: str,
+    output_format: str,
+    enable_prompt_expansion: bool
+) -> str:
+    """
+    Cache key for a seeded edit: the image digest plus normalized arguments
+
+    Returns:
+        str: SHA-256 hex digest of the canonical argument set
+    """
+    canonical = json.dumps({
+        'model': EDIT_MODEL,
+        'image': image_digest,
+        'prompt': prompt,
+        'seed': int(seed),
+        'image_size': str(image_size).lower(),
+        'output_format': str(output_format).lower(),
+        'enable_prompt_expansion': bool(enable_prompt_expansion)
+    }, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
 
 class FalImageService:
     """Service for interacting with fal.ai image editing API"""
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        upload_mode: Optional[str] = None,
+        url_cache: Optional[SqliteTTLCache] = None,
+        result_cache: Optional[SqliteTTLCache] = None,
+        admission: Optional[AdmissionController] = None,
+        upload_policy: Optional[ResiliencePolicy] = None,
+        edit_policy: Optional[ResiliencePolicy] = None
+    ):
         """
         Initialize the FAL service
 
         Args:
             api_key: FAL API key (if not provided, will use FAL_API_KEY env var)
+            upload_mode: "memory" (default) or "tempfile" (if not provided,
+                will use FAL_UPLOAD_MODE env var)
+            url_cache: Cache of image digest -> fal storage URL (if not
+                provided, one is created from the FAL_URL_CACHE_* env vars)
+            result_cache: Cache of seeded edit results (if not provided, one
+                is created from the FAL_RESULT_CACHE_* env vars)
+            admission: Rate/concurrency limiter for edits (if not provided,
+                the shared one configured by the ADMISSION_* env vars)
+            upload_policy: Retry/circuit breaker policy for uploads (if not
+                provided, one is created from the FAL_RETRY_* and
+                FAL_BREAKER_* env vars)
+            edit_policy: Retry/circuit breaker/hedging policy for edit
+                submissions (likewise, plus FAL_HEDGE_*)
         """
         self.api_key = api_key or os.getenv('FAL_API_KEY')
         if not self.api_key:
             raise ValueError("FAL_API_KEY not found in environment variables")
 
+        self.upload_mode = upload_mode or os.getenv('FAL_UPLOAD_MODE', UPLOAD_MODE_MEMORY)
+        if self.upload_mode not in (UPLOAD_MODE_MEMORY, UPLOAD_MODE_TEMPFILE):
+            raise ValueError(f"Invalid FAL upload mode: {self.upload_mode}")
+
+        if url_cache is None and URL_CACHE_TTL > 0:
+            url_cache = SqliteTTLCache('fal_url_cache', URL_CACHE_TTL, URL_CACHE_MAX_ENTRIES)
+        self.url_cache = url_cache
+
+        if result_cache is None and RESULT_CACHE_TTL > 0:
+            result_cache = SqliteTTLCache('fal_result_cache', RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES)
+        self.result_cache = result_cache
+
+        self.admission = admission if admission is not None else get_admission_controller()
+
+        self.upload_policy = upload_policy or ResiliencePolicy('upload')
+        self.edit_policy = edit_policy or ResiliencePolicy('edit', hedge=FAL_HEDGE_ENABLED)
+
         # Set the FAL_KEY for fal_client
         os.environ['FAL_KEY'] = self.api_key
         logger.info("FAL Image Service initialized")
 
-    def upload_image_from_bytes(self, image_data: bytes, filename: str = "image.jpg") -> str:
+    def upload_image_from_bytes(
+        self,
+        image_data: Union[bytes, bytearray, memoryview],
+        filename: str = "image.jpg"
+    ) -> str:
         """
         Upload image data to fal.ai storage
 
+        The bytes are sent straight from memory with a content type sniffed
+        from their magic bytes. A temporary file is only used when
+        FAL_UPLOAD_MODE=tempfile or the payload is large enough to need
+        fal's multipart upload.
+
         Args:
-            image_data: Raw image bytes
-            filename: Original filename (for extension detection)
+            image_data: Raw image bytes (or a memoryview over them)
+            filename: Original filename (sent as the file name, and used for
+                the content type if the magic bytes are not recognised)
 
         Returns:
             str: URL of the uploaded image
         """
-        logger.info(f"Uploading image: {filename} ({len(image_data)} bytes)")
+        size = len(image_data) if not isinstance(image_data, memoryview) else image_data.nbytes
+        logger.info(f"Uploading image: {filename} ({size} bytes)")
+
+        if self.upload_mode == UPLOAD_MODE_TEMPFILE or size > MULTIPART_THRESHOLD:
+            return self._upload_via_tempfile(image_data, filename)
+
+        content_type = detect_image_content_type(image_data, filename)
+        if not isinstance(image_data, bytes):
+            # httpx only accepts bytes bodies
+            image_data = bytes(image_data)
+
+        url = self.upload_policy.call(
+            lambda: fal_client.upload(image_data, content_type, file_name=os.path.basename(filename))
+        )
+        logger.info(f"Image uploaded successfully: {url}")
+        return url
 
+    def _upload_via_tempfile(self, image_data: Union[bytes, bytearray, memoryview], filename: str) -> str:
+        """Fallback upload path that goes through a temporary file"""
         # Create a temporary file to upload
         with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as tmp_file:
             tmp_file.write(image_data)
@@ -50,7 +240,7 @@ class FalImageService:
 
         try:
             # Upload using fal_client
-            url = fal_client.upload_file(tmp_path)
+            url = self.upload_policy.call(lambda: fal_client.upload_file(tmp_path))
             logger.info(f"Image uploaded successfully: {url}")
             return url
         finally:
@@ -58,71 +248,315 @@ class FalImageService:
             if os.path.exists(tmp_path):
                 os.remove(tmp_path)
 
+    def upload_image_from_path(self, image_path: Union[str, os.PathLike]) -> str:
+        """
+        Upload an image file that is already on disk to fal.ai storage
+
+        The file is handed to fal_client.upload_file rather than read here.
+        That takes the content type from the file name, so a file whose name
+        does not match its magic bytes (e.g. extensionless blob store paths)
+        is uploaded through a temporary symlink with the right extension.
+
+        Args:
+            image_path: Path to the image file
+
+        Returns:
+            str: URL of the uploaded image
+        """
+        image_path = os.fspath(image_path)
+        size = os.path.getsize(image_path)
+        logger.info(f"Uploading image file: {image_path} ({size} bytes)")
+
+        with open(image_path, 'rb') as f:
+            content_type = detect_image_content_type(f.read(16), image_path)
+        extension = mimetypes.guess_extension(content_type)
+
+        if extension is None or mimetypes.guess_type(image_path)[0] == content_type:
+            url = self.upload_policy.call(lambda: fal_client.upload_file(image_path))
+        else:
+            with tempfile.TemporaryDirectory() as link_dir:
+                link_path = os.path.join(link_dir, os.path.splitext(os.path.basename(image_path))[0] + extension)
+                os.symlink(os.path.abspath(image_path), link_path)
+                url = self.upload_policy.call(lambda: fal_client.upload_file(link_path))
+
+        logger.info(f"Image uploaded successfully: {url}")
+        return url
+
+    def upload_image_cached(
+        self,
+        image_data: Union[bytes, bytearray, memoryview, os.PathLike],
+        filename: str = "image.jpg",
+        image_digest: Optional[str] = None
+    ) -> str:
+        """
+        Upload image bytes or a file unless identical content was uploaded recently
+
+        Args:
+            image_data: Raw image bytes or a local file path
+            filename: Original filename (used if image_data is bytes)
+            image_digest: SHA-256 hex digest of the image, if already known
+
+        Returns:
+            str: URL of the uploaded image
+        """
+        if self.url_cache is not None:
+            image_digest = image_digest or image_sha256(image_data)
+            cached_url = self.url_cache.get(image_digest)
+            if cached_url:
+                logger.info(f"Reusing uploaded image {image_digest[:12]}: {cached_url}")
+                return cached_url
+
+        if isinstance(image_data, os.PathLike):
+            url = self.upload_image_from_path(image_data)
+        else:
+            url = self.upload_image_from_bytes(image_data, filename)
+
+        if self.url_cache is not None:
+            self.url_cache.set(image_digest, url)
+        return url
+
     def edit_image(
         self,
         prompt: str,
-        image_data: Union[bytes, str],
+        image_data: Union[bytes, bytearray, memoryview, str, os.PathLike],
         filename: str = "image.jpg",
         image_size: str = "auto",
         output_format: str = "png",
         enable_prompt_expansion: bool = False,
-        seed: Optional[int] = None
+        seed: Optional[int] = None,
+        image_digest: Optional[str] = None,
+        image_url: Optional[str] = None,
+        on_progress: Optional[Callable[[str, Dict], None]] = None,
+        user_id: Optional[str] = None,
+        admission_wait: Optional[float] = None
     ) -> Dict:
         """
         Edit an image using AI based on a text prompt
 
         Args:
             prompt: Text description of desired edits
-            image_data: Either raw image bytes or an image URL
+            image_data: Raw image bytes, a local file path (os.PathLike) or an image URL
             filename: Original filename (used if image_data is bytes)
             image_size: Size preset (auto, square_hd, landscape_16_9, etc.)
             output_format: Output format (jpeg, png, webp)
             enable_prompt_expansion: Whether to expand the prompt
             seed: Random seed for reproducibility
+            image_digest: SHA-256 hex digest of the image, if already known
+                (skips re-hashing for the upload and result caches)
+            image_url: fal storage URL image_data was already uploaded to
+                (skips the upload)
+            on_progress: Called with (event, data) as the edit advances:
+                ("queued", {"position"}), ("progress", {"message", "timestamp"})
+                and ("completed", {"metrics"})
+            user_id: Caller to rate-limit (no per-user limit if omitted)
+            admission_wait: Longest wait for admission in seconds (defaults
+                to ADMISSION_MAX_WAIT)
 
         Returns:
             dict: Result containing edited images and metadata
+
+        Raises:
+            AdmissionRejected: If the edit is rate-limited or fal capacity is
+                saturated for longer than admission_wait
+            CircuitOpenError: If fal has been failing and calls are being
+                short-circuited
         """
         logger.info(f"Editing image with prompt: '{prompt}'")
 
-        # Determine if we have bytes or a URL
-        if isinstance(image_data, bytes):
-            image_url = self.upload_image_from_bytes(image_data, filename)
-        elif isinstance(image_data, str) and image_data.startswith(('http://', 'https://')):
-            image_url = image_data
-            logger.info(f"Using provided image URL: {image_url}")
-        else:
-            raise ValueError("image_data must be either bytes or a valid HTTP(S) URL")
-
-        # Build arguments
-        arguments = {
-            'prompt': prompt,
-            'image_urls': [image_url],
-            'image_size': image_size,
-            'output_format': output_format,
-            'enable_prompt_expansion': enable_prompt_expansion
-        }
+        is_local_image = isinstance(image_data, (bytes, bytearray, memoryview, os.PathLike))
+
+        # A seeded edit of the same image with the same arguments is reproducible
+        result_key = None
+        if seed is not None and is_local_image and self.result_cache is not None:
+            image_digest = image_digest or image_sha256(image_data)
+            result_key = edit_result_key(
+                image_digest, prompt, seed, image_size, output_format, enable_prompt_expansion
+            )
+            cached_result = self.result_cache.get(result_key)
+            if cached_result:
+                logger.info(f"Returning memoized edit result for image {image_digest[:12]} (seed {seed})")
+                return json.loads(cached_result)
+
+        # Fail fast while fal is down rather than queueing for admission
+        self.edit_policy.check()
+
+        # Memoized results above are free, everything below counts against the limits
+        admission = self.admission.admit(user_id, admission_wait) if self.admission else nullcontext()
+        with admission:
+            # Determine if we have bytes or a URL
+            if image_url:
+                logger.info(f"Using already uploaded image: {image_url}")
+            elif is_local_image:
+                image_url = self.upload_image_cached(image_data, filename, image_digest)
+            elif isinstance(image_data, str) and image_data.startswith(('http://', 'https://')):
+                image_url = image_data
+                logger.info(f"Using provided image URL: {image_url}")
+            else:
+                raise ValueError("image_data must be bytes, a file path or a valid HTTP(S) URL")
+
+            # Build arguments
+            arguments = {
+                'prompt': prompt,
+                'image_urls': [image_url],
+                'image_size': image_size,
+                'output_format': output_format,
+                'enable_prompt_expansion': enable_prompt_expansion
+            }
+
+            if seed is not None:
+                arguments['seed'] = seed
+
+            logger.info(f"Submitting edit request to {EDIT_MODEL}")
+
+            try:
+                # Subscribe and wait for result (retried, and hedged when enabled)
+                result = self._subscribe(arguments, on_progress)
+
+                logger.info(f"Edit completed successfully. Generated {len(result.get('images', []))} image(s)")
+
+                if result_key is not None:
+                    self.result_cache.set(result_key, json.dumps(result))
+                return result
+
+            except Exception as e:
+                logger.error(f"Failed to edit image: {str(e)}")
+                raise
+
+    def _subscribe(self, arguments: Dict, on_progress: Optional[Callable[[str, Dict], None]]) -> Dict:
+        """
+        Submit an edit and wait for it under the edit resilience policy
+
+        A retry after a transient error resumes polling the request that was
+        already submitted rather than paying for a new one; only a request
+        that completed with an error is submitted again. Polling stops at
+        the policy's deadline. A hedge is a separate submission and takes an
+        admission slot of its own (no hedge is sent when none is free).
+        """
+        deadline = self.edit_policy.deadline()
+        submitted = []
+
+        def submission(on_queue_update):
+            state = {'request_id': None}
 
-        if seed is not None:
-            arguments['seed'] = seed
+            def attempt():
+                if state['request_id'] is None:
+                    handle = fal_client.submit(EDIT_MODEL, arguments=arguments)
+                    state['request_id'] = handle.request_id
+                    submitted.append(handle.request_id)
+                else:
+                    logger.info(f"Resuming fal request {state['request_id']}")
+                    handle = fal_client.sync_client.get_handle(EDIT_MODEL, state['request_id'])
 
-        logger.info(f"Submitting edit request to fal-ai/alpha-image-232/edit-image")
+                completed = False
+                try:
+                    for update in handle.iter_events(with_logs=True):
+                        on_queue_update(update)
+                        if isinstance(update, fal_client.Completed):
+                            completed = True
+                        elif deadline is not None and time.monotonic() >= deadline:
+                            raise DeadlineExceeded(self.edit_policy.name, self.edit_policy.deadline_seconds)
+                    result = handle.get()
+                except Exception:
+                    if completed:
+                        # The request itself failed, a retry has to submit it again
+                        state['request_id'] = None
+                    raise
+                return handle.request_id, result
 
+            return attempt
+
+        hedge_slot = (lambda: self.admission.slot(max_wait=0)) if self.admission else None
+        winner = None
         try:
-            # Subscribe and wait for result
-            result = fal_client.subscribe(
-                "fal-ai/alpha-image-232/edit-image",
-                arguments=arguments,
-                with_logs=True,
-                on_queue_update=self._log_queue_update,
+            # Only the primary submission reports progress to the caller
+            winner, result = self.edit_policy.call(
+                submission(self._queue_update_handler(on_progress)),
+                hedge_fn=submission(self._log_queue_update),
+                deadline=deadline,
+                hedge_slot=hedge_slot
             )
-
-            logger.info(f"Edit completed successfully. Generated {len(result.get('images', []))} image(s)")
             return result
+        finally:
+            for request_id in submitted:
+                if request_id != winner:
+                    # Losing hedge, or the edit gave up: stop paying for it
+                    try:
+                        fal_client.cancel(EDIT_MODEL, request_id)
+                    except Exception as e:
+                        logger.debug(f"Could not cancel fal request {request_id}: {str(e)}")
+
+    def edit_batch(
+        self,
+        edits: List[Dict],
+        max_concurrency: int = 4
+    ) -> Iterator[Tuple[int, Optional[Dict], Optional[Exception]]]:
+        """
+        Run several edits concurrently, uploading each distinct image once
+
+        Args:
+            edits: List of edit_image keyword arguments
+            max_concurrency: Maximum number of uploads/edits in flight
+
+        Yields:
+            tuple: (index into edits, result or None, exception or None) in
+            completion order
+
+        Closing the generator early (or an error escaping it) cancels the
+        uploads and edits that have not started yet.
+        """
+        executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='fal-batch')
+        try:
+            # Upload every distinct local image once, before any edit starts
+            edits = [dict(edit) for edit in edits]
+            uploads = {}
+            for edit in edits:
+                image_data = edit['image_data']
+                if isinstance(image_data, (bytes, bytearray, memoryview, os.PathLike)):
+                    edit['image_digest'] = edit.get('image_digest') or image_sha256(image_data)
+                    if edit['image_digest'] not in uploads:
+                        uploads[edit['image_digest']] = executor.submit(
+                            self.upload_image_cached,
+                            image_data,
+                            edit.get('filename', 'image.jpg'),
+                            edit['image_digest']
+                        )
+
+            logger.info(f"Batch of {len(edits)} edit(s) over {len(uploads)} distinct uploaded image(s)")
 
-        except Exception as e:
-            logger.error(f"Failed to edit image: {str(e)}")
-            raise
+            futures = {}
+            for index, edit in enumerate(edits):
+                upload = uploads.get(edit.get('image_digest'))
+                if upload is not None:
+                    try:
+                        edit['image_url'] = upload.result()
+                    except Exception as e:
+                        logger.error(f"Batch upload for edit {index} failed: {str(e)}")
+                        yield index, None, e
+                        continue
+                futures[executor.submit(self.edit_image, **edit)] = index
+
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+        finally:
+            # Nothing is pending after a full run; otherwise drop what hasn't started
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def cache_stats(self) -> Dict:
+        """Hit/miss counters for the upload URL and edit result caches"""
+        return {
+            'upload_url_cache': self.url_cache.stats() if self.url_cache else None,
+            'edit_result_cache': self.result_cache.stats() if self.result_cache else None
+        }
+
+    def resilience_stats(self) -> Dict:
+        """Circuit breaker state, retry/hedge counters and latency of this worker"""
+        return {
+            'upload': self.upload_policy.stats(),
+            'edit': self.edit_policy.stats()
+        }
 
     def _log_queue_update(self, update):
         """Log queue updates during processing"""
@@ -131,6 +565,41 @@ class FalImageService:
                 for log in update.logs:
                     logger.info(f"[FAL] {log['message']}")
 
+    def _queue_update_handler(self, on_progress: Optional[Callable[[str, Dict], None]]):
+        """
+        Build the on_queue_update hook for one edit
+
+        Always logs the update; when on_progress is given, also forwards queue
+        position, new log lines and completion as (event, data) pairs.
+        """
+        if on_progress is None:
+            return self._log_queue_update
+
+        # Status events may repeat log lines already forwarded
+        seen_logs = set()
+
+        def handle(update):
+            self._log_queue_update(update)
+            try:
+                if isinstance(update, fal_client.Queued):
+                    on_progress('queued', {'position': update.position})
+                elif isinstance(update, (fal_client.InProgress, fal_client.Completed)):
+                    for log in update.logs or []:
+                        key = (log.get('timestamp'), log.get('message'))
+                        if key not in seen_logs:
+                            seen_logs.add(key)
+                            on_progress('progress', {
+                                'message': log.get('message'),
+                                'timestamp': log.get('timestamp')
+                            })
+                    if isinstance(update, fal_client.Completed):
+                        on_progress('completed', {'metrics': update.metrics})
+            except Exception as e:
+                # A broken listener must not abort the edit itself
+                logger.warning(f"Progress listener failed: {str(e)}")
+
+        return handle
+
 
 # Singleton instance
 _fal_service = None
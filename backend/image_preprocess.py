@@ -0,0 +1,244 @@
+"""
+Pre-upload image normalization
+Downscales camera-sized images to what the requested fal.ai image_size preset
+actually needs, applies EXIF orientation, strips metadata and re-encodes
+before the image is uploaded
+"""
+
+import hashlib
+import os
+import logging
+from typing import Dict, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional, normalization is skipped without it
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# Output dimensions (width, height) of the fal.ai image_size presets
+PRESET_DIMENSIONS = {
+    'square_hd': (1024, 1024),
+    'square': (512, 512),
+    'portrait_4_3': (768, 1024),
+    'portrait_16_9': (576, 1024),
+    'landscape_4_3': (1024, 768),
+    'landscape_16_9': (1024, 576),
+}
+
+# Defaults, overridable per request
+NORMALIZE_ENABLED = os.getenv('IMAGE_NORMALIZE', 'true').lower() in ('1', 'true', 'yes', 'on')
+NORMALIZE_FORMAT = os.getenv('IMAGE_NORMALIZE_FORMAT', 'jpeg')
+NORMALIZE_QUALITY = int(os.getenv('IMAGE_NORMALIZE_QUALITY', 90))
+
+_FORMATS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'jpg': ('JPEG', '.jpg'),
+    'webp': ('WEBP', '.webp'),
+    'png': ('PNG', '.png'),
+}
+
+_EXIF_ORIENTATION = 0x0112
+
+# Image.info keys carrying XMP metadata (which can hold GPS coordinates too)
+_XMP_KEYS = ('xmp', 'XML:com.adobe.xmp')
+
+
+class NormalizedImage:
+    """Result of normalize_image: the file to upload and what was done to it"""
+
+    def __init__(self, filepath: str, size: int, sha256: str, changed: bool, details: Dict):
+        self.filepath = filepath
+        self.size = size
+        self.sha256 = sha256
+        self.changed = changed
+        self.details = details
+
+
+def _positive_int(value, name: str) -> int:
+    """value as a positive int (numeric strings accepted), else ValueError"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"{name} must be a positive integer, got {value!r}")
+    try:
+        number = int(value)
+    except (ValueError, OverflowError):
+        raise ValueError(f"{name} must be a positive integer, got {value!r}") from None
+    if number <= 0:
+        raise ValueError(f"{name} must be a positive integer, got {value!r}")
+    return number
+
+
+def target_dimensions(image_size, max_dimension: Optional[int] = None) -> Optional[Tuple[int, int]]:
+    """
+    Smallest (width, height) box the image has to cover for a given image_size
+
+    Args:
+        image_size: fal.ai preset name, or a {"width", "height"} dict
+        max_dimension: Explicit bound on the longest side (used for "auto")
+
+    Returns:
+        tuple: (width, height), or None if any size is acceptable
+
+    Raises:
+        ValueError: If a custom size or max_dimension is not a positive integer
+    """
+    if isinstance(image_size, dict):
+        return (_positive_int(image_size.get('width'), 'image_size.width'),
+                _positive_int(image_size.get('height'), 'image_size.height'))
+    if isinstance(image_size, str) and image_size in PRESET_DIMENSIONS:
+        return PRESET_DIMENSIONS[image_size]
+    if max_dimension:
+        size = _positive_int(max_dimension, 'max_dimension')
+        return size, size
+    return None
+
+
+def _cover_size(width: int, height: int, target: Tuple[int, int], contain: bool) -> Tuple[int, int]:
+    """Scale (width, height) down so it still covers target (or fits inside it)"""
+    scale_w = target[0] / width
+    scale_h = target[1] / height
+    scale = min(scale_w, scale_h) if contain else max(scale_w, scale_h)
+    if scale >= 1:
+        return width, height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def normalize_image(
+    filepath: str,
+    image_size='auto',
+    enabled: Optional[bool] = None,
+    output_format: Optional[str] = None,
+    quality: Optional[int] = None,
+    max_dimension: Optional[int] = None,
+    output_path: Optional[str] = None
+) -> NormalizedImage:
+    """
+    Prepare an uploaded image for fal.ai
+
+    The image is downscaled so it still covers the preset's output size (the
+    model resamples to that size anyway), rotated according to its EXIF
+    orientation, stripped of metadata and re-encoded. Images carrying EXIF
+    or XMP metadata are always rewritten without it, in their own format
+    when the pixels need no change. Images that need no resizing or
+    rotation and carry no metadata are left untouched, as is anything
+    Pillow cannot read.
+
+    Args:
+        filepath: Uploaded original
+        image_size: fal.ai image_size preset of the edit
+        enabled: Override for IMAGE_NORMALIZE
+        output_format: jpeg, webp or png (override for IMAGE_NORMALIZE_FORMAT)
+        quality: Encoder quality for jpeg/webp (override for IMAGE_NORMALIZE_QUALITY)
+        max_dimension: Bound on the longest side when image_size is "auto"
+            ("auto" images are otherwise only rotated)
+        output_path: Where to write the normalized image (defaults to
+            <original>.normalized.<ext>)
+
+    Returns:
+        NormalizedImage: The file to upload (the original when unchanged)
+    """
+    enabled = NORMALIZE_ENABLED if enabled is None else enabled
+    original_size = os.path.getsize(filepath)
+    # Checked even when normalization is off: a bad custom size is a client error either way
+    target = target_dimensions(image_size, max_dimension)
+
+    def unchanged(reason):
+        return NormalizedImage(filepath, original_size, None, False, {'skipped': reason})
+
+    if not enabled:
+        return unchanged('disabled')
+    if Image is None:
+        logger.warning("Pillow is not installed, skipping image normalization")
+        return unchanged('pillow_not_installed')
+
+    output_format = (output_format or NORMALIZE_FORMAT).lower()
+    if output_format not in _FORMATS:
+        raise ValueError(f"Unsupported normalize format: {output_format}")
+    quality = quality or NORMALIZE_QUALITY
+
+    try:
+        with Image.open(filepath) as image:
+            exif = image.getexif()
+            orientation = exif.get(_EXIF_ORIENTATION, 1)
+            has_metadata = bool(exif) or any(image.info.get(key) for key in _XMP_KEYS)
+            rotated = orientation in (5, 6, 7, 8)
+            width, height = (image.height, image.width) if rotated else (image.width, image.height)
+
+            new_size = (width, height)
+            if target is not None:
+                # An explicit max_dimension bounds the longest side, presets must stay covered
+                new_size = _cover_size(width, height, target, contain=target_dimensions(image_size) is None)
+
+            pixels_unchanged = new_size == (width, height) and orientation == 1
+            if pixels_unchanged and not has_metadata:
+                return unchanged('already_within_target')
+
+            source_format = image.format
+            if pixels_unchanged and source_format in ('JPEG', 'PNG', 'WEBP'):
+                # Only the metadata has to go: keep the format to avoid a lossy conversion
+                output_format = source_format.lower()
+
+            if source_format == 'JPEG' and not pixels_unchanged:
+                # Let libjpeg decode at a reduced scale instead of full resolution
+                draft_size = (new_size[1], new_size[0]) if rotated else new_size
+                image.draft('RGB', draft_size)
+
+            normalized = image if pixels_unchanged else ImageOps.exif_transpose(image)
+            if normalized.size != new_size:
+                normalized = normalized.resize(new_size, Image.LANCZOS, reducing_gap=3.0)
+
+            has_alpha = normalized.mode in ('RGBA', 'LA', 'PA') or 'transparency' in normalized.info
+            if output_format in ('jpeg', 'jpg') and has_alpha:
+                # JPEG would flatten transparency, keep it lossless instead
+                output_format = 'png'
+            pil_format, extension = _FORMATS[output_format]
+
+            if pil_format == 'JPEG' and normalized.mode != 'RGB':
+                normalized = normalized.convert('RGB')
+
+            save_kwargs = {'optimize': True}
+            if pil_format == 'JPEG' and pixels_unchanged and source_format == 'JPEG' and normalized is image:
+                # Reuse the original quantization tables so the rewrite stays close to lossless
+                save_kwargs['quality'] = 'keep'
+            elif pil_format in ('JPEG', 'WEBP'):
+                save_kwargs['quality'] = quality
+
+            normalized_path = output_path or f"{os.path.splitext(filepath)[0]}.normalized{extension}"
+            tmp_path = f"{normalized_path}.part"
+            # No exif= argument, so metadata (GPS, camera, orientation) is dropped
+            try:
+                normalized.save(tmp_path, pil_format, **save_kwargs)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not normalize {filepath}, uploading original: {str(e)}")
+        return unchanged('unreadable')
+
+    normalized_size = os.path.getsize(tmp_path)
+    if normalized_size >= original_size and orientation == 1 and not has_metadata:
+        # Re-encoding did not pay off
+        os.remove(tmp_path)
+        return unchanged('not_smaller')
+
+    os.replace(tmp_path, normalized_path)
+    digest = hashlib.sha256()
+    with open(normalized_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    details = {
+        'original_bytes': original_size,
+        'normalized_bytes': normalized_size,
+        'original_dimensions': [width, height],
+        'normalized_dimensions': list(new_size),
+        'format': output_format,
+        'orientation_applied': orientation != 1,
+        'metadata_stripped': has_metadata
+    }
+    logger.info(f"Normalized {filepath}: {width}x{height} -> {new_size[0]}x{new_size[1]}, "
+                f"{original_size} -> {normalized_size} bytes")
+    return NormalizedImage(normalized_path, normalized_size, digest.hexdigest(), True, details)
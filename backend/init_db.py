@@ -21,6 +21,12 @@ if __name__ == '__main__':
         logger.info("✓ Database initialized successfully!")
         logger.info("Tables created:")
         logger.info("  - pinterest_users")
+        logger.info("  - edit_jobs")
+        logger.info("  - client_events")
+        logger.info("  - pinterest_boards")
+        logger.info("  - pinterest_pins")
+        logger.info("  - pinterest_sync_state")
+        logger.info("  - chat_conversations")
     except Exception as e:
         logger.error(f"✗ Database initialization failed: {str(e)}")
         exit(1)
@@ -0,0 +1,134 @@
+"""
+Coalesced Pinterest login status writes
+Cookie checks run on every status and boards request; instead of an UPDATE
+and commit each time, results are recorded here and written per user in
+one periodic multi-row UPDATE that skips rows whose status is unchanged
+"""
+
+import atexit
+import os
+import threading
+import logging
+from typing import Dict
+
+from db import update_pinterest_login_statuses
+
+logger = logging.getLogger(__name__)
+
+# Seconds between flushes of pending status changes
+LOGIN_STATUS_FLUSH_INTERVAL = float(os.getenv('LOGIN_STATUS_FLUSH_INTERVAL', 5))
+# An unchanged result still refreshes last_pinterest_login once this many seconds have passed
+LOGIN_STATUS_TOUCH_INTERVAL = float(os.getenv('LOGIN_STATUS_TOUCH_INTERVAL', 300))
+
+
+class LoginStatusWriter:
+    """
+    Per-worker write-behind buffer for pinterest_users login status
+
+    record() only touches memory: a result replaces any pending result for
+    the user. The flusher thread writes all pending users with a single
+    UPDATE ... FROM (VALUES ...), which leaves rows alone when the status is
+    unchanged and was written within touch_interval (checked against the
+    database, so it holds across workers); failed flushes are put back
+    unless a newer result arrived meanwhile.
+    """
+
+    def __init__(self, flush_interval: float = LOGIN_STATUS_FLUSH_INTERVAL,
+                 touch_interval: float = LOGIN_STATUS_TOUCH_INTERVAL,
+                 writer=update_pinterest_login_statuses):
+        self.flush_interval = flush_interval
+        self.touch_interval = touch_interval
+        self.writer = writer
+        # user_id -> cookies_valid
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+        self._counters = {'recorded': 0, 'coalesced': 0, 'unchanged': 0, 'written': 0, 'flushes': 0, 'failed_flushes': 0}
+
+    def record(self, user_id: str, cookies_valid: bool):
+        """Note the outcome of a cookie check for user_id"""
+        with self._cond:
+            self._counters['recorded'] += 1
+            if user_id in self._pending:
+                self._counters['coalesced'] += 1
+            self._pending[user_id] = cookies_valid
+
+        self._start()
+
+    def flush(self) -> int:
+        """Write all pending results now; returns the number of rows changed"""
+        with self._flush_lock:
+            with self._cond:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            updates = list(pending.items())
+            try:
+                written = self.writer(updates, self.touch_interval)
+            except Exception as e:
+                logger.error(f"Failed to write login status for {len(updates)} user(s): {str(e)}")
+                with self._cond:
+                    self._counters['failed_flushes'] += 1
+                    for user_id, result in pending.items():
+                        self._pending.setdefault(user_id, result)
+                return 0
+
+            with self._cond:
+                self._counters['written'] += written
+                self._counters['unchanged'] += len(updates) - written
+                self._counters['flushes'] += 1
+            return written
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopped:
+                    self._cond.wait(timeout=self.flush_interval)
+                stopped = self._stopped
+            self.flush()
+            if stopped:
+                return
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='login-status-flush', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Stop the flusher thread after a final flush (called at worker shutdown)"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                **self._counters,
+                'pending': len(self._pending),
+                'flush_interval_seconds': self.flush_interval
+            }
+
+
+# Singleton instance
+_login_status_writer = None
+_login_status_writer_lock = threading.Lock()
+
+
+def get_login_status_writer() -> LoginStatusWriter:
+    """Get or create this worker's login status writer"""
+    global _login_status_writer
+    with _login_status_writer_lock:
+        if _login_status_writer is None:
+            _login_status_writer = LoginStatusWriter()
+        return _login_status_writer
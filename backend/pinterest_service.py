@@ -1,5 +1,9 @@
 import sys
 import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 import logging
 
@@ -9,12 +13,37 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'resources', 'py3-pin
 from py3pin.Pinterest import Pinterest
 from db import (
     get_pinterest_credentials,
-    save_pinterest_credentials,
-    update_pinterest_login_status
+    save_pinterest_credentials
 )
+from login_status import get_login_status_writer
 
 logger = logging.getLogger(__name__)
 
+# Live PinterestService instances kept per worker (one per user)
+PINTEREST_POOL_MAX = int(os.getenv('PINTEREST_POOL_MAX', 100))
+# Instances unused for this many seconds are dropped
+PINTEREST_POOL_IDLE_SECONDS = float(os.getenv('PINTEREST_POOL_IDLE_SECONDS', 600))
+# Seconds to wait for a user's instance that another request is using
+# before falling back to a temporary one
+PINTEREST_POOL_CHECKOUT_WAIT = float(os.getenv('PINTEREST_POOL_CHECKOUT_WAIT', 5))
+# Run Pinterest calls straight away and only re-authenticate when one is
+# rejected, instead of validating the cookies before every call
+PINTEREST_OPTIMISTIC_AUTH = os.getenv('PINTEREST_OPTIMISTIC_AUTH', 'true').lower() in ('1', 'true', 'yes')
+
+# HTTP statuses Pinterest answers with when the session cookies are no longer valid
+AUTH_FAILURE_STATUS_CODES = {401, 403}
+
+# py3pin keeps board feed paging state under this bookmark key, and stores
+# END_BOOKMARK once the last page has been returned
+FEED_BOOKMARK = 'board_feed'
+END_BOOKMARK = '-end-'
+
+
+def is_auth_failure(error):
+    """Whether a py3pin call failed because the session is not (or no longer) authenticated"""
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) in AUTH_FAILURE_STATUS_CODES
+
 
 class PinterestService:
     def __init__(self, user_id, pinterest_email=None, pinterest_password=None, pinterest_username=None):
@@ -48,6 +77,21 @@ class PinterestService:
             cred_root=self.cred_root
         )
 
+    def reset_pagination(self):
+        """Forget py3pin's paging bookmarks so listings start from the first page again"""
+        bookmark_manager = getattr(self.pinterest, 'bookmark_manager', None)
+        if bookmark_manager is not None:
+            self.pinterest.bookmark_manager = type(bookmark_manager)()
+
+    def close(self):
+        """Close the underlying HTTP session"""
+        http = getattr(self.pinterest, 'http', None)
+        if http is not None:
+            try:
+                http.close()
+            except Exception:
+                pass
+
     def check_cookies_valid(self):
         """
         Check if stored cookies are still valid by making a simple API call
@@ -58,11 +102,11 @@ class PinterestService:
         try:
             # Try to get user overview - if this works, cookies are valid
             self.pinterest.get_user_overview()
-            update_pinterest_login_status(self.user_id, True)
+            get_login_status_writer().record(self.user_id, True)
             return True
         except Exception as e:
             logger.warning(f"Cookie validation failed for user {self.user_id}: {str(e)}")
-            update_pinterest_login_status(self.user_id, False)
+            get_login_status_writer().record(self.user_id, False)
             return False
 
     def login(self):
@@ -75,12 +119,12 @@ class PinterestService:
         """
         try:
             self.pinterest.login()
-            update_pinterest_login_status(self.user_id, True)
+            get_login_status_writer().record(self.user_id, True)
             logger.info(f"Successfully logged in to Pinterest for user {self.user_id}")
             return True
         except Exception as e:
             logger.error(f"Pinterest login failed for user {self.user_id}: {str(e)}")
-            update_pinterest_login_status(self.user_id, False)
+            get_login_status_writer().record(self.user_id, False)
             return False
 
     def ensure_logged_in(self):
@@ -97,6 +141,40 @@ class PinterestService:
         logger.info(f"Cookies expired for user {self.user_id}, attempting re-login")
         return self.login()
 
+    def call_authenticated(self, operation):
+        """
+        Run a Pinterest operation with an authenticated session
+
+        In optimistic mode (PINTEREST_OPTIMISTIC_AUTH) the operation runs
+        first; only if Pinterest rejects it as unauthenticated does this log
+        in again and retry it once. Otherwise the cookies are checked up
+        front with ensure_logged_in().
+
+        Args:
+            operation: Callable making the Pinterest calls; it may run twice
+
+        Returns:
+            Whatever operation returns
+        """
+        if not PINTEREST_OPTIMISTIC_AUTH:
+            if not self.ensure_logged_in():
+                raise Exception("Failed to authenticate with Pinterest")
+            return operation()
+
+        try:
+            result = operation()
+        except Exception as e:
+            if not is_auth_failure(e):
+                raise
+            logger.info(f"Pinterest rejected the session for user {self.user_id}, attempting re-login")
+            get_login_status_writer().record(self.user_id, False)
+            if not self.login():
+                raise Exception("Failed to authenticate with Pinterest")
+            return operation()
+
+        get_login_status_writer().record(self.user_id, True)
+        return result
+
     def get_boards(self):
         """
         Get all Pinterest boards (mood boards) for the user
@@ -104,12 +182,13 @@ class PinterestService:
         Returns:
             list: List of boards with id, name, description, etc.
         """
-        try:
-            if not self.ensure_logged_in():
-                raise Exception("Failed to authenticate with Pinterest")
+        def fetch_boards():
+            self.reset_pagination()
+            return self.pinterest.boards_all()
 
+        try:
             # Get all boards for the user
-            boards = self.pinterest.boards_all()
+            boards = self.call_authenticated(fetch_boards)
 
             # Extract relevant information
             board_list = []
@@ -139,11 +218,9 @@ class PinterestService:
         Returns:
             list: List of pins with images, descriptions, etc.
         """
-        try:
-            if not self.ensure_logged_in():
-                raise Exception("Failed to authenticate with Pinterest")
-
+        def fetch_pins():
             pins = []
+            self.reset_pagination()
             pin_batch = self.pinterest.board_feed(board_id=board_id)
 
             while len(pin_batch) > 0:
@@ -151,10 +228,192 @@ class PinterestService:
                 pin_batch = self.pinterest.board_feed(board_id=board_id)
 
             return pins
+
+        try:
+            return self.call_authenticated(fetch_pins)
         except Exception as e:
             logger.error(f"Failed to get pins for board {board_id}: {str(e)}")
             raise
 
+    def fetch_board_page(self, board_id, bookmark=None):
+        """
+        Fetch one page of a board's pins, newest first
+
+        Args:
+            board_id: Pinterest board ID
+            bookmark: Where to continue from (None for the first page)
+
+        Returns:
+            tuple: (pins, bookmark for the next page, or None after the last page)
+        """
+        self.reset_pagination()
+        bookmark_manager = self.pinterest.bookmark_manager
+        if bookmark:
+            bookmark_manager.add_bookmark(primary=FEED_BOOKMARK, secondary=board_id, bookmark=bookmark)
+
+        pins = self.pinterest.board_feed(board_id=board_id)
+        next_bookmark = bookmark_manager.get_bookmark(primary=FEED_BOOKMARK, secondary=board_id)
+        if not pins or next_bookmark in (None, END_BOOKMARK):
+            next_bookmark = None
+        return pins, next_bookmark
+
+
+class _PooledService:
+    __slots__ = ('service', 'fingerprint', 'lock', 'last_used', 'retired')
+
+    def __init__(self):
+        self.service = None
+        self.fingerprint = None
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        # Removed from the pool; whoever holds the lock closes the service
+        self.retired = False
+
+
+class PinterestServicePool:
+    """
+    Per-worker pool of live PinterestService instances keyed by user
+
+    Reusing an instance keeps its HTTP session (keep-alive connections) and
+    cookies in memory instead of rebuilding them for every request. A
+    checkout holds the user's instance exclusively, since py3pin clients
+    keep paging state; a request that can't get it within checkout_wait
+    uses a temporary instance instead. Instances are rebuilt when the
+    stored credentials change, dropped after idle_seconds without use and,
+    beyond max_size, least recently used first.
+    """
+
+    def __init__(self, max_size: int = PINTEREST_POOL_MAX,
+                 idle_seconds: float = PINTEREST_POOL_IDLE_SECONDS,
+                 checkout_wait: float = PINTEREST_POOL_CHECKOUT_WAIT):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.checkout_wait = checkout_wait
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'created': 0, 'rebuilt': 0, 'temporary': 0, 'evicted': 0}
+
+    @contextmanager
+    def checkout(self, user_id):
+        """
+        Use the user's PinterestService for the duration of a with block
+
+        Raises:
+            ValueError: If the user has no stored Pinterest credentials
+        """
+        creds = get_pinterest_credentials(user_id)
+        if not creds:
+            raise ValueError(f"No Pinterest credentials found for user {user_id}")
+        fingerprint = (creds['pinterest_email'], creds['pinterest_username'], creds['pinterest_password'])
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = self._entries[user_id] = _PooledService()
+            self._entries.move_to_end(user_id)
+            evicted = self._evict()
+
+        for service in evicted:
+            service.close()
+
+        if not entry.lock.acquire(timeout=self.checkout_wait):
+            with self._lock:
+                self._counters['temporary'] += 1
+            service = self._build(user_id, creds)
+            try:
+                yield service
+            finally:
+                service.close()
+            return
+
+        try:
+            if entry.service is None or entry.fingerprint != fingerprint:
+                if entry.service is not None:
+                    entry.service.close()
+                entry.service = self._build(user_id, creds)
+                with self._lock:
+                    self._counters['rebuilt' if entry.fingerprint else 'created'] += 1
+                entry.fingerprint = fingerprint
+            else:
+                with self._lock:
+                    self._counters['hits'] += 1
+            yield entry.service
+        finally:
+            entry.last_used = time.monotonic()
+            if entry.retired:
+                self._close_entry(entry)
+            entry.lock.release()
+
+    def _build(self, user_id, creds):
+        return PinterestService(
+            user_id,
+            pinterest_email=creds['pinterest_email'],
+            pinterest_password=creds['pinterest_password'],
+            pinterest_username=creds['pinterest_username']
+        )
+
+    def _evict(self):
+        """Drop idle and surplus instances that are not checked out (pool lock held)"""
+        now = time.monotonic()
+        evicted = []
+        for user_id, entry in list(self._entries.items()):
+            idle = now - entry.last_used >= self.idle_seconds
+            surplus = len(self._entries) > self.max_size
+            if not (idle or surplus):
+                break
+            if entry.lock.locked():
+                continue
+            del self._entries[user_id]
+            entry.retired = True
+            self._counters['evicted'] += 1
+            if entry.service is not None:
+                evicted.append(entry.service)
+        return evicted
+
+    def discard(self, user_id):
+        """Drop a user's instance (e.g. after their credentials changed)"""
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            if entry is None:
+                return
+            entry.retired = True
+        # A checked-out instance is closed by its holder on release
+        if entry.lock.acquire(blocking=False):
+            try:
+                self._close_entry(entry)
+            finally:
+                entry.lock.release()
+
+    @staticmethod
+    def _close_entry(entry):
+        """Close a retired entry's service (entry lock held)"""
+        if entry.service is not None:
+            entry.service.close()
+            entry.service = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                'size': len(self._entries),
+                'in_use': sum(1 for entry in self._entries.values() if entry.lock.locked()),
+                'max_size': self.max_size
+            }
+
+
+# Singleton instance
+_service_pool = None
+_service_pool_lock = threading.Lock()
+
+
+def get_service_pool():
+    """Get or create this worker's PinterestService pool"""
+    global _service_pool
+    with _service_pool_lock:
+        if _service_pool is None:
+            _service_pool = PinterestServicePool()
+        return _service_pool
+
 
 def get_pinterest_status(user_id):
     """
@@ -174,11 +433,11 @@ def get_pinterest_status(user_id):
 
     # Check if cookies are valid
     try:
-        service = PinterestService(user_id)
-        if service.check_cookies_valid():
-            return 'connected'
-        else:
-            return 'expired'
+        with get_service_pool().checkout(user_id) as service:
+            if service.check_cookies_valid():
+                return 'connected'
+            else:
+                return 'expired'
     except Exception as e:
         logger.error(f"Error checking Pinterest status for user {user_id}: {str(e)}")
         return 'expired'
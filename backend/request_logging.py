@@ -0,0 +1,187 @@
+"""
+Structured request logging
+Captures each request as one compact JSON line with secrets redacted and large
+fields truncated (or hashed), samples per endpoint and writes the lines from a
+background thread so the request thread never does the I/O
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import queue
+import random
+import sys
+import logging
+import logging.handlers
+from datetime import datetime
+from typing import Dict, Optional
+
+from flask import request
+
+logger = logging.getLogger(__name__)
+
+# Byte budget per string field; longer values are cut (or hashed, see below)
+REQUEST_LOG_MAX_FIELD_BYTES = int(os.getenv('REQUEST_LOG_MAX_FIELD_BYTES', 1024))
+
+# "truncate" keeps the first REQUEST_LOG_MAX_FIELD_BYTES, "hash" keeps only size and SHA-256
+REQUEST_LOG_LARGE_FIELDS = os.getenv('REQUEST_LOG_LARGE_FIELDS', 'truncate')
+
+# Sampling rates per endpoint, e.g. "/api/upload=0.1,/api/webhook=0.5,default=1"
+REQUEST_LOG_SAMPLE_RATES = os.getenv('REQUEST_LOG_SAMPLE_RATES', 'default=1')
+
+# Field and header names (case-insensitive) whose values are never logged
+REQUEST_LOG_REDACT = os.getenv(
+    'REQUEST_LOG_REDACT',
+    'pinterest_password,password,authorization,cookie,set-cookie,x-api-key,api_key,token,access_token,secret'
+)
+
+# Lines waiting for the writer thread; beyond this new lines are dropped
+REQUEST_LOG_QUEUE_SIZE = int(os.getenv('REQUEST_LOG_QUEUE_SIZE', 10000))
+
+REDACTED = '[REDACTED]'
+
+_redact_keys = {key.strip().lower() for key in REQUEST_LOG_REDACT.split(',') if key.strip()}
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse "endpoint=rate,..." into a dict (the "default" key applies to the rest)"""
+    rates = {'default': 1.0}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        endpoint, rate = item.rsplit('=', 1)
+        try:
+            rates[endpoint.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            logger.warning(f"Ignoring invalid request log sample rate: {item!r}")
+    return rates
+
+
+_sample_rates = parse_sample_rates(REQUEST_LOG_SAMPLE_RATES)
+
+
+def sample_rate(endpoint_name: str) -> float:
+    """Fraction of requests to endpoint_name that get logged"""
+    return _sample_rates.get(endpoint_name, _sample_rates['default'])
+
+
+def _shorten(value: str) -> object:
+    encoded = value.encode('utf-8', errors='replace')
+    if len(encoded) <= REQUEST_LOG_MAX_FIELD_BYTES:
+        return value
+
+    if REQUEST_LOG_LARGE_FIELDS == 'hash':
+        return {'bytes': len(encoded), 'sha256': hashlib.sha256(encoded).hexdigest()}
+
+    prefix = encoded[:REQUEST_LOG_MAX_FIELD_BYTES].decode('utf-8', errors='ignore')
+    return f'{prefix}...[truncated, {len(encoded)} bytes]'
+
+
+def sanitize(value, key: Optional[str] = None):
+    """
+    Copy of value that is safe and small enough to log
+
+    Values under a redacted key are replaced, long strings are truncated or
+    hashed, and nested dicts/lists are handled recursively.
+    """
+    if key is not None and key.lower() in _redact_keys:
+        return REDACTED
+    if isinstance(value, dict):
+        return {k: sanitize(v, str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [sanitize(v) for v in value]
+    if isinstance(value, str):
+        return _shorten(value)
+    if isinstance(value, (bytes, bytearray)):
+        return {'bytes': len(value)}
+    return value
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves JSON serialization to the writer thread"""
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block a request on logging
+            pass
+
+
+class _JsonLineFormatter(logging.Formatter):
+    def format(self, record):
+        if isinstance(record.msg, dict):
+            return json.dumps(record.msg, separators=(',', ':'), default=str)
+        return super().format(record)
+
+
+# Dedicated logger so the lines can be routed independently of application logs
+request_logger = logging.getLogger('request_log')
+request_logger.propagate = False
+_listener = None
+
+
+def start_request_logging(stream=None):
+    """Attach the queue handler and start the writer thread (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(_JsonLineFormatter())
+
+    log_queue = queue.Queue(maxsize=REQUEST_LOG_QUEUE_SIZE)
+    request_logger.addHandler(_DeferredQueueHandler(log_queue))
+    request_logger.setLevel(logging.INFO)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(stop_request_logging)
+
+
+def stop_request_logging():
+    """Flush queued lines and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_request(endpoint_name, include_body=True):
+    """
+    Capture the current request and log it as one JSON line
+
+    Secrets are redacted and large fields truncated before anything is
+    logged. Only a sample of requests is written (REQUEST_LOG_SAMPLE_RATES);
+    the capture is returned either way.
+
+    Args:
+        endpoint_name: Endpoint the capture is logged (and sampled) under
+        include_body: Parse the body into the capture; pass False for
+            endpoints that stream the body themselves
+
+    Returns:
+        dict: The sanitized request capture
+    """
+    request_data = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'endpoint': endpoint_name,
+        'method': request.method,
+        'url': _shorten(request.url),
+        'headers': sanitize(dict(request.headers)),
+        'args': sanitize(request.args.to_dict()),
+        'json': sanitize(request.get_json(silent=True)) if include_body else None,
+        'form': sanitize(request.form.to_dict()) if include_body else {},
+        'remote_addr': request.remote_addr
+    }
+
+    rate = sample_rate(endpoint_name)
+    if rate >= 1 or random.random() < rate:
+        start_request_logging()
+        request_logger.info({**request_data, 'sample_rate': rate})
+
+    return request_data
@@ -0,0 +1,401 @@
+"""
+Resilience helpers for calls to fal.ai
+Retries transient failures with jittered exponential backoff within a total
+time budget, trips a circuit breaker after repeated failures and can hedge
+slow calls with a second attempt
+"""
+
+import math
+import os
+import random
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from typing import Callable, ContextManager, Dict, Optional
+
+import httpx
+from fal_client.client import FalClientHTTPError
+
+logger = logging.getLogger(__name__)
+
+# Retries of a whole upload/edit (fal_client already retries single HTTP requests)
+FAL_RETRY_MAX_ATTEMPTS = int(os.getenv('FAL_RETRY_MAX_ATTEMPTS', 3))
+FAL_RETRY_BASE_DELAY = float(os.getenv('FAL_RETRY_BASE_DELAY', 0.5))
+FAL_RETRY_MAX_DELAY = float(os.getenv('FAL_RETRY_MAX_DELAY', 8))
+# Total seconds one call may take across all attempts and backoff (0 disables);
+# keep it below gunicorn's --timeout minus the admission wait
+FAL_CALL_DEADLINE = float(os.getenv('FAL_CALL_DEADLINE', 90))
+
+# Consecutive transient failures that open the circuit, and how long it stays open
+FAL_BREAKER_FAILURE_THRESHOLD = int(os.getenv('FAL_BREAKER_FAILURE_THRESHOLD', 5))
+FAL_BREAKER_RESET_SECONDS = float(os.getenv('FAL_BREAKER_RESET_SECONDS', 30))
+
+# Hedging: after the given latency percentile of recent edits, submit a second copy
+FAL_HEDGE_ENABLED = os.getenv('FAL_HEDGE_ENABLED', 'false').lower() in ('1', 'true', 'yes', 'on')
+FAL_HEDGE_PERCENTILE = float(os.getenv('FAL_HEDGE_PERCENTILE', 95))
+FAL_HEDGE_MIN_SAMPLES = int(os.getenv('FAL_HEDGE_MIN_SAMPLES', 20))
+FAL_HEDGE_MIN_DELAY = float(os.getenv('FAL_HEDGE_MIN_DELAY', 5))
+FAL_HEDGE_WORKERS = int(os.getenv('FAL_HEDGE_WORKERS', 8))
+
+# HTTP statuses worth retrying: timeouts, throttling and server-side errors
+TRANSIENT_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling fal while the circuit breaker is open"""
+
+    status_code = 503
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f'fal.ai {name} is temporarily unavailable, please retry shortly')
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a call runs out of its total time budget"""
+
+    status_code = 504
+
+    def __init__(self, name: str, budget: float):
+        super().__init__(f'fal.ai {name} did not finish within {budget:g}s')
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether an error from fal_client is worth retrying"""
+    if isinstance(error, FalClientHTTPError):
+        return error.status_code in TRANSIENT_STATUS_CODES
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in TRANSIENT_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker
+
+    Opens after failure_threshold consecutive transient failures. While open,
+    calls are rejected for reset_seconds; then a single trial call is let
+    through (half-open), which closes the circuit on success or re-opens it.
+    """
+
+    def __init__(self, name: str,
+                 failure_threshold: int = FAL_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = FAL_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._times_opened = 0
+
+    def before_call(self):
+        """
+        Check the circuit before calling out
+
+        Raises:
+            CircuitOpenError: If the circuit is open (or a half-open trial is running)
+        """
+        with self._lock:
+            if self._state == CIRCUIT_CLOSED:
+                return
+
+            remaining = self._opened_at + self.reset_seconds - time.monotonic()
+            if self._state == CIRCUIT_OPEN and remaining <= 0:
+                self._state = CIRCUIT_HALF_OPEN
+
+            if self._state == CIRCUIT_HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                logger.info(f"Circuit {self.name} half-open, letting a trial call through")
+                return
+
+            raise CircuitOpenError(self.name, max(1, math.ceil(remaining)))
+
+    def check(self):
+        """Raise CircuitOpenError if the circuit is open, without claiming the half-open trial"""
+        with self._lock:
+            remaining = self._opened_at + self.reset_seconds - time.monotonic()
+            if self._state == CIRCUIT_OPEN and remaining > 0:
+                raise CircuitOpenError(self.name, max(1, math.ceil(remaining)))
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CIRCUIT_CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self._state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == CIRCUIT_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != CIRCUIT_OPEN:
+                    self._times_opened += 1
+                    logger.warning(f"Circuit {self.name} opened after {self._failures} failure(s)")
+                self._state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+
+    def record_ignored(self):
+        """The call failed for a non-transient reason: neither success nor failure"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_seconds': self.reset_seconds,
+                'times_opened': self._times_opened
+            }
+
+
+class LatencyTracker:
+    """Sliding window of recent call durations"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """p-th percentile of the window (nearest rank), or None if empty"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = max(1, math.ceil(p / 100 * len(samples)))
+        return samples[rank - 1]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+# Shared by all hedged calls in the process
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=FAL_HEDGE_WORKERS, thread_name_prefix='fal-hedge')
+        return _hedge_executor
+
+
+class ResiliencePolicy:
+    """
+    Retry + circuit breaker (+ optional hedging) around one kind of fal call
+
+    Usage:
+        result = policy.call(lambda: fal_client.upload_file(path))
+
+    Every call gets deadline_seconds in total: no attempt starts and no
+    backoff is slept once that budget would be exceeded.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int = FAL_RETRY_MAX_ATTEMPTS,
+        base_delay: float = FAL_RETRY_BASE_DELAY,
+        max_delay: float = FAL_RETRY_MAX_DELAY,
+        deadline_seconds: float = FAL_CALL_DEADLINE,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge: bool = False,
+        hedge_percentile: float = FAL_HEDGE_PERCENTILE,
+        hedge_min_samples: int = FAL_HEDGE_MIN_SAMPLES,
+        hedge_min_delay: float = FAL_HEDGE_MIN_DELAY
+    ):
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline_seconds = deadline_seconds
+        self.breaker = breaker or CircuitBreaker(name)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.latency = LatencyTracker()
+        self._counters_lock = threading.Lock()
+        self._counters = {'calls': 0, 'retries': 0, 'failures': 0, 'rejected': 0, 'deadline_exceeded': 0,
+                          'hedges': 0, 'hedges_skipped': 0, 'hedge_wins': 0}
+
+    def _count(self, counter: str):
+        with self._counters_lock:
+            self._counters[counter] += 1
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number attempt (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def check(self):
+        """Fail fast with CircuitOpenError while the circuit is open"""
+        try:
+            self.breaker.check()
+        except CircuitOpenError:
+            self._count('rejected')
+            raise
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a hedge is sent, or None while hedging is off or not warmed up"""
+        if not self.hedge or len(self.latency) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, self.latency.percentile(self.hedge_percentile))
+
+    def deadline(self) -> Optional[float]:
+        """time.monotonic() by which a call starting now must finish, or None without a budget"""
+        return time.monotonic() + self.deadline_seconds if self.deadline_seconds else None
+
+    def call(self, fn: Callable, hedge_fn: Optional[Callable] = None, deadline: Optional[float] = None,
+             hedge_slot: Optional[Callable[[], ContextManager]] = None):
+        """
+        Call fn, retrying transient failures
+
+        Args:
+            fn: The call to make (no arguments)
+            hedge_fn: Duplicate of fn to race against it once it is slower
+                than the hedge percentile (defaults to fn; only used when
+                hedging is enabled)
+            deadline: time.monotonic() by which the call must finish
+                (defaults to deadline_seconds from now); pass the same value
+                to fn if it can check it while waiting
+            hedge_slot: Returns a context manager the hedge runs under (e.g.
+                an admission slot); if entering it raises, no hedge is sent
+
+        Returns:
+            Whatever fn returns
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+            DeadlineExceeded: If the budget runs out before any attempt succeeds
+            Exception: The last error once retries are exhausted (or the
+                budget leaves no time for another attempt), or the first
+                non-transient one
+        """
+        self._count('calls')
+        deadline = self.deadline() if deadline is None else deadline
+        attempt = 1
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                self._count('deadline_exceeded')
+                raise DeadlineExceeded(self.name, self.deadline_seconds)
+
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self._count('rejected')
+                raise
+
+            started = time.monotonic()
+            try:
+                delay = self.hedge_delay()
+                if delay is None:
+                    result = fn()
+                else:
+                    result = self._call_hedged(fn, hedge_fn or fn, delay, deadline, hedge_slot)
+            except Exception as e:
+                if isinstance(e, DeadlineExceeded):
+                    self._count('deadline_exceeded')
+                if not is_transient(e):
+                    self.breaker.record_ignored()
+                    raise
+
+                self.breaker.record_failure()
+                self._count('failures')
+                if attempt >= self.max_attempts:
+                    raise
+
+                sleep = self.backoff(attempt)
+                if deadline is not None and time.monotonic() + sleep >= deadline:
+                    # No time left for another attempt
+                    self._count('deadline_exceeded')
+                    raise
+                logger.warning(f"fal.ai {self.name} failed ({str(e)}), retry {attempt} in {sleep:.2f}s")
+                self._count('retries')
+                time.sleep(sleep)
+                attempt += 1
+                continue
+
+            self.latency.record(time.monotonic() - started)
+            self.breaker.record_success()
+            return result
+
+    def _call_hedged(self, fn: Callable, hedge_fn: Callable, delay: float, deadline: Optional[float] = None,
+                     hedge_slot: Optional[Callable[[], ContextManager]] = None):
+        """Run fn; if it is still running after delay, race hedge_fn against it"""
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        executor = _get_hedge_executor()
+        primary = executor.submit(fn)
+        budget = remaining()
+        done, _ = wait([primary], timeout=delay if budget is None else min(delay, budget))
+        if done:
+            return primary.result()
+        if budget is not None and budget <= delay:
+            raise DeadlineExceeded(self.name, self.deadline_seconds)
+
+        pending = {primary}
+        hedge = None
+        slot = ExitStack()
+        try:
+            if hedge_slot is not None:
+                slot.enter_context(hedge_slot())
+        except Exception as e:
+            # The hedge would exceed the concurrency limit: keep waiting on the primary alone
+            logger.info(f"fal.ai {self.name} hedge skipped: {str(e)}")
+            self._count('hedges_skipped')
+        else:
+            logger.info(f"fal.ai {self.name} slower than p{self.hedge_percentile:g} ({delay:.1f}s), hedging")
+            self._count('hedges')
+            hedge = executor.submit(hedge_fn)
+            # Hold the slot for as long as the hedge runs
+            hedge.add_done_callback(lambda _: slot.close())
+            pending.add(hedge)
+
+        first_error = None
+        while pending:
+            done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(self.name, self.deadline_seconds)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count('hedge_wins')
+                    return future.result()
+                first_error = first_error or future.exception()
+        raise first_error
+
+    def stats(self) -> Dict:
+        with self._counters_lock:
+            counters = dict(self._counters)
+        p50 = self.latency.percentile(50)
+        p95 = self.latency.percentile(95)
+        return {
+            'circuit': self.breaker.stats(),
+            'counters': counters,
+            'max_attempts': self.max_attempts,
+            'deadline_seconds': self.deadline_seconds,
+            'latency_p50_seconds': round(p50, 3) if p50 is not None else None,
+            'latency_p95_seconds': round(p95, 3) if p95 is not None else None,
+            'hedging': self.hedge,
+            'hedge_delay_seconds': self.hedge_delay()
+        }
@@ -0,0 +1,175 @@
+"""
+SQLite-backed TTL/LRU cache
+A small key-value cache stored in a local SQLite file so every gunicorn worker
+on the instance shares the same entries
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the cache database files
+CACHE_DIR = os.getenv('CACHE_DIR', './cache')
+# Writes per worker between trims of expired and least recently used entries
+CACHE_TRIM_EVERY = int(os.getenv('CACHE_TRIM_EVERY', 100))
+# A hit refreshes an entry's LRU position only if it is older than this fraction of the TTL
+CACHE_TOUCH_FRACTION = float(os.getenv('CACHE_TOUCH_FRACTION', 0.1))
+
+
+def open_sqlite(path: str) -> sqlite3.Connection:
+    """Open a SQLite database in WAL mode, in autocommit mode, for one thread"""
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class SqliteTTLCache:
+    """
+    Key-value cache with per-entry TTL and size-bounded LRU eviction
+
+    Entries live in one table of a SQLite database in WAL mode, so concurrent
+    readers in other processes are never blocked by a writer. Reads stay
+    reads: a hit only writes when its last_used stamp is older than
+    CACHE_TOUCH_FRACTION of the TTL, hit/miss counters are kept per worker,
+    and expired and overflow entries are trimmed every CACHE_TRIM_EVERY
+    writes rather than on each one (so the table may briefly exceed
+    max_entries).
+    """
+
+    def __init__(self, name: str, ttl_seconds: float, max_entries: int, path: Optional[str] = None):
+        """
+        Args:
+            name: Cache name, used as the table name
+            ttl_seconds: How long an entry stays valid after it is written
+            max_entries: Least recently used entries are evicted beyond this
+            path: Database file (defaults to CACHE_DIR/<name>.sqlite3)
+        """
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.path = path or os.path.join(CACHE_DIR, f'{name}.sqlite3')
+        self.touch_after = ttl_seconds * CACHE_TOUCH_FRACTION
+        self._local = threading.local()
+        self._counters_lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._writes = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.name} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute(f"""
+                CREATE INDEX IF NOT EXISTS idx_{self.name}_last_used
+                ON {self.name}(last_used)
+            """)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection (sqlite3 connections are not thread-safe)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = open_sqlite(self.path)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for key, or None if missing or expired"""
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                f"SELECT value, expires_at, last_used FROM {self.name} WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or row[1] <= now:
+                # Expired rows are left to the next trim
+                self._count('misses')
+                return None
+
+            if now - row[2] > self.touch_after:
+                conn.execute(f"UPDATE {self.name} SET last_used = ? WHERE key = ?", (now, key))
+            self._count('hits')
+            return row[0]
+        except sqlite3.Error as e:
+            # A broken cache should never break the request path
+            logger.warning(f"Cache {self.name} read failed: {str(e)}")
+            return None
+
+    def set(self, key: str, value: str, ttl_seconds: Optional[float] = None):
+        """Store value under key and evict the least recently used overflow"""
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        try:
+            conn = self._connection()
+            conn.execute(f"""
+                INSERT INTO {self.name} (key, value, expires_at, last_used)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    value = excluded.value,
+                    expires_at = excluded.expires_at,
+                    last_used = excluded.last_used
+            """, (key, value, now + ttl, now))
+
+            with self._counters_lock:
+                self._writes += 1
+                trim = self._writes % max(1, CACHE_TRIM_EVERY) == 0
+            if trim:
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Cache {self.name} write failed: {str(e)}")
+
+    def delete(self, key: str):
+        """Drop a single entry"""
+        try:
+            self._connection().execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"Cache {self.name} delete failed: {str(e)}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drop expired entries, then all but the max_entries most recently used"""
+        conn.execute(f"DELETE FROM {self.name} WHERE expires_at <= ?", (now,))
+        evicted = conn.execute(f"""
+            DELETE FROM {self.name} WHERE key IN (
+                SELECT key FROM {self.name} ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,)).rowcount
+        if evicted > 0:
+            self._count('evictions', evicted)
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._counters_lock:
+            self._counters[counter] += amount
+
+    def stats(self) -> Dict:
+        """Entry count (shared) and this worker's hit/miss/eviction counters"""
+        try:
+            entries = self._connection().execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Cache {self.name} stats failed: {str(e)}")
+            return {'error': str(e)}
+
+        with self._counters_lock:
+            counters = dict(self._counters)
+
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': hits,
+            'misses': misses,
+            'evictions': counters.get('evictions', 0),
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None
+        }
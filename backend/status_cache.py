@@ -0,0 +1,179 @@
+"""
+Pinterest status cache
+Stale-while-revalidate cache in front of get_pinterest_status: fresh entries
+are served as is, stale ones are served immediately while one background
+check per user refreshes them, and credential changes invalidate them
+"""
+
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict
+
+from db import get_pinterest_credentials
+from pinterest_service import get_pinterest_status
+
+logger = logging.getLogger(__name__)
+
+# Seconds a checked status counts as fresh
+PINTEREST_STATUS_TTL = float(os.getenv('PINTEREST_STATUS_TTL', 60))
+# Seconds a stale status may still be served while it is revalidated;
+# older entries are checked synchronously
+PINTEREST_STATUS_STALE_TTL = float(os.getenv('PINTEREST_STATUS_STALE_TTL', 3600))
+# Users kept in the cache; the least recently used are dropped
+PINTEREST_STATUS_CACHE_MAX = int(os.getenv('PINTEREST_STATUS_CACHE_MAX', 10000))
+# Background threads revalidating stale entries
+PINTEREST_STATUS_REFRESH_WORKERS = int(os.getenv('PINTEREST_STATUS_REFRESH_WORKERS', 4))
+
+
+class _StatusEntry:
+    __slots__ = ('status', 'fingerprint', 'checked_at', 'checked_monotonic')
+
+    def __init__(self, status: str, fingerprint, checked_monotonic: float):
+        self.status = status
+        self.fingerprint = fingerprint
+        self.checked_at = datetime.utcnow()
+        self.checked_monotonic = checked_monotonic
+
+
+class StatusCache:
+    """
+    Per-worker cache of Pinterest connection status
+
+    Each entry remembers the credentials it was checked with; the
+    credential lookup is itself cached and invalidated across workers on
+    every write, so new credentials saved through any worker make the old
+    status a miss. Concurrent misses and refreshes for one user share a
+    single in-flight check.
+    """
+
+    def __init__(self, ttl: float = PINTEREST_STATUS_TTL, stale_ttl: float = PINTEREST_STATUS_STALE_TTL,
+                 max_entries: int = PINTEREST_STATUS_CACHE_MAX,
+                 refresh_workers: int = PINTEREST_STATUS_REFRESH_WORKERS,
+                 checker=get_pinterest_status):
+        self.ttl = ttl
+        self.stale_ttl = max(ttl, stale_ttl)
+        self.max_entries = max_entries
+        self.checker = checker
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._generation = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='status-refresh')
+        self._counters = {'fresh_hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0,
+                          'refresh_errors': 0, 'invalidations': 0}
+
+    def get(self, user_id: str) -> Dict:
+        """
+        The user's connection status
+
+        Returns:
+            dict: status ('connected', 'expired' or 'disconnected'),
+            checked_at (ISO time of the check), age_seconds and stale (True
+            when served while a refresh runs)
+        """
+        creds = get_pinterest_credentials(user_id)
+        if not creds:
+            self.invalidate(user_id)
+            return {'status': 'disconnected', 'checked_at': datetime.utcnow().isoformat(),
+                    'age_seconds': 0, 'stale': False}
+        fingerprint = (creds['pinterest_email'], creds['pinterest_username'], creds['pinterest_password'])
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.fingerprint != fingerprint:
+                entry = None
+            age = now - entry.checked_monotonic if entry is not None else None
+
+            if entry is not None and age < self.ttl:
+                self._counters['fresh_hits'] += 1
+                self._entries.move_to_end(user_id)
+                return self._result(entry, now, stale=False)
+
+            if entry is not None and age < self.stale_ttl:
+                self._counters['stale_hits'] += 1
+                self._entries.move_to_end(user_id)
+                self._refresh(user_id, fingerprint)
+                return self._result(entry, now, stale=True)
+
+            self._counters['misses'] += 1
+            future = self._refresh(user_id, fingerprint)
+
+        entry = future.result()
+        return self._result(entry, time.monotonic(), stale=False)
+
+    def _result(self, entry: _StatusEntry, now: float, stale: bool) -> Dict:
+        return {
+            'status': entry.status,
+            'checked_at': entry.checked_at.isoformat(),
+            'age_seconds': round(now - entry.checked_monotonic, 1),
+            'stale': stale
+        }
+
+    def _refresh(self, user_id: str, fingerprint):
+        """Start a check for user_id unless one is already running (lock held); returns its future"""
+        future = self._in_flight.get(user_id)
+        if future is None:
+            generation = self._generation.get(user_id, 0)
+            future = self._executor.submit(self._check, user_id, fingerprint, generation)
+            self._in_flight[user_id] = future
+        return future
+
+    def _check(self, user_id: str, fingerprint, generation: int) -> _StatusEntry:
+        try:
+            status = self.checker(user_id)
+            entry = _StatusEntry(status, fingerprint, time.monotonic())
+            with self._lock:
+                self._counters['refreshes'] += 1
+                # Don't store a result that an invalidation has overtaken
+                if self._generation.get(user_id, 0) == generation:
+                    self._entries[user_id] = entry
+                    self._entries.move_to_end(user_id)
+                    while len(self._entries) > self.max_entries:
+                        evicted, _ = self._entries.popitem(last=False)
+                        self._generation.pop(evicted, None)
+            return entry
+        except Exception as e:
+            with self._lock:
+                self._counters['refresh_errors'] += 1
+            logger.error(f"Failed to refresh Pinterest status for user {user_id}: {str(e)}")
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(user_id, None)
+
+    def invalidate(self, user_id: str):
+        """Forget a user's status (e.g. after their credentials changed)"""
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None or user_id in self._in_flight:
+                self._generation[user_id] = self._generation.get(user_id, 0) + 1
+                self._counters['invalidations'] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self._counters,
+                'entries': len(self._entries),
+                'in_flight': len(self._in_flight),
+                'ttl_seconds': self.ttl,
+                'stale_ttl_seconds': self.stale_ttl
+            }
+
+
+# Singleton instance
+_status_cache = None
+_status_cache_lock = threading.Lock()
+
+
+def get_status_cache() -> StatusCache:
+    """Get or create this worker's Pinterest status cache"""
+    global _status_cache
+    with _status_cache_lock:
+        if _status_cache is None:
+            _status_cache = StatusCache()
+        return _status_cache
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test script for the streaming JSON parsers in data_stream.py
+Feeds NDJSON and JSON array bodies through every chunk size from one byte
+up, so elements, strings and escapes split across chunk boundaries are
+covered; needs no server or database:
+    python test_data_stream.py
+"""
+
+import io
+import json
+import sys
+import time
+
+from data_stream import StreamFormatError, iter_json_array, iter_ndjson
+
+ITEMS = [
+    {'event_type': 'click', 'data': {'x': 1, 'tags': ['a', 'b']}},
+    'quote " and backslash \\ and bracket ] inside a string',
+    [[], {}, [1, [2, [3]]]],
+    -12.5e3,
+    0,
+    True,
+    None,
+    'é中\U0001f600'
+]
+
+CHUNK_SIZES = [1, 2, 3, 7, 64, 64 * 1024]
+
+
+def parse(parser, body, chunk_size, **options):
+    return list(parser(io.BytesIO(body), chunk_size=chunk_size, **options))
+
+
+def expect_error(parser, body, chunk_size=3, **options):
+    try:
+        parse(parser, body, chunk_size, **options)
+    except StreamFormatError as e:
+        return str(e)
+    raise AssertionError(f'{body[:40]!r} was accepted')
+
+
+def check_ndjson_items():
+    """NDJSON yields every non-empty line at any chunk size"""
+    body = '\n'.join(json.dumps(item) for item in ITEMS).encode('utf-8') + b'\n\n'
+    for chunk_size in CHUNK_SIZES:
+        assert parse(iter_ndjson, body, chunk_size) == ITEMS, chunk_size
+    # The last line needs no trailing newline
+    assert parse(iter_ndjson, b'1\r\n2', 2) == [1, 2]
+
+
+def check_array_items():
+    """A JSON array yields every element at any chunk size"""
+    for separators in [(',', ':'), (', \n\t', ' : ')]:
+        body = json.dumps(ITEMS, separators=separators, ensure_ascii=False).encode('utf-8')
+        for chunk_size in CHUNK_SIZES:
+            assert parse(iter_json_array, b' \n' + body + b' \n', chunk_size) == ITEMS, (separators, chunk_size)
+    assert parse(iter_json_array, b'[]', 1) == []
+    assert parse(iter_json_array, b'[1,23]', 1) == [1, 23]
+
+
+def check_malformed():
+    """Malformed bodies and items raise StreamFormatError"""
+    expect_error(iter_ndjson, b'{"a": 1}\n{"a": \n')
+    for body in [b'{"a": 1}', b'[1 2]', b'[1,]', b'[,1]', b'[1', b'["abc', b'[{"a": 1]', b'[1.5e]',
+                 b'[tru]', b'[1]x', b'[{"a": 1}}]']:
+        expect_error(iter_json_array, body)
+
+
+def check_invalid_utf8():
+    """Bytes that are not UTF-8 raise StreamFormatError, not UnicodeDecodeError"""
+    expect_error(iter_json_array, b'[\xff]')
+    expect_error(iter_json_array, b'["\xe9"]', chunk_size=64)
+    expect_error(iter_ndjson, b'"\xff"\n')
+
+
+def check_item_limit():
+    """Items larger than max_item_bytes are rejected"""
+    big = json.dumps({'data': 'x' * 1000}).encode('utf-8')
+    assert 'exceeds' in expect_error(iter_ndjson, big + b'\n', chunk_size=64, max_item_bytes=500)
+    assert 'exceeds' in expect_error(iter_json_array, b'[' + big + b']', chunk_size=64, max_item_bytes=500)
+    assert parse(iter_json_array, b'[' + big + b']', 64, max_item_bytes=2000) == [json.loads(big)]
+
+
+def check_large_element_is_linear():
+    """A multi-megabyte element is parsed in one pass, not re-decoded per chunk"""
+    element = {'rows': [{'id': i, 'name': f'row "{i}"\\'} for i in range(150000)]}
+    line = json.dumps(element).encode('utf-8')
+    for parser, body in [(iter_json_array, b'[' + line + b',' + line + b']'), (iter_ndjson, line + b'\n' + line)]:
+        started = time.monotonic()
+        assert parse(parser, body, 64 * 1024) == [element, element]
+        elapsed = time.monotonic() - started
+        assert elapsed < 5, f'{parser.__name__} took {elapsed:.1f}s for {len(body)} bytes'
+
+
+CHECKS = [check_ndjson_items, check_array_items, check_malformed, check_invalid_utf8, check_item_limit,
+          check_large_element_is_linear]
+
+
+if __name__ == "__main__":
+    failures = 0
+    for check in CHECKS:
+        try:
+            check()
+            print(f"   ✓ {check.__doc__}")
+        except Exception as e:
+            failures += 1
+            print(f"   ✗ {check.__doc__}: {type(e).__name__}: {e}")
+
+    print(f"\n{'✓ All checks passed' if not failures else f'✗ {failures} check(s) failed'}")
+    sys.exit(1 if failures else 0)
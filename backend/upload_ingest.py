@@ -0,0 +1,313 @@
+"""
+Streaming upload ingestion for /api/upload
+Decodes image bodies incrementally into the upload store so peak memory per
+upload is bounded by the chunk size rather than by the size of the image
+"""
+
+import base64
+import binascii
+import hashlib
+import logging
+import os
+from typing import Dict, Optional
+
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the request stream (or base64 characters decoded) per step
+CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 64 * 1024))
+
+# Largest decoded image we accept
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', 25 * 1024 * 1024))
+
+# Supported ingest modes, selected from the request Content-Type
+MODE_JSON = 'json'            # legacy {"image": "<base64>", ...} body
+MODE_MULTIPART = 'multipart'  # multipart/form-data with an "image" file field
+MODE_BINARY = 'binary'        # raw application/octet-stream or image/* body
+MODE_BASE64 = 'base64'        # raw base64 text body, optionally chunked
+
+BASE64_MIMETYPES = ('text/plain', 'application/base64')
+
+_WHITESPACE = b' \t\r\n'
+
+
+class UploadError(ValueError):
+    """Raised when an upload body cannot be ingested"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class IngestedUpload:
+    """An image body that has been written to the upload store"""
+
+    def __init__(self, upload_id: str, filepath: str, filename: str, size: int, sha256: str):
+        self.upload_id = upload_id
+        self.filepath = filepath
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+
+
+class Base64StreamDecoder:
+    """
+    Incrementally decode base64 text fed in arbitrarily sized chunks
+
+    Strips a leading data URL prefix (e.g. "data:image/jpeg;base64,") and
+    whitespace/line breaks, and only ever holds back the < 4 characters that
+    cannot be decoded yet.
+    """
+
+    def __init__(self):
+        self._pending = b''
+        self._prefix_checked = False
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Decode as much of the accumulated input as possible"""
+        data = self._pending + chunk.translate(None, _WHITESPACE)
+
+        if not self._prefix_checked:
+            if data.startswith(b'data:') or b'data:'.startswith(data):
+                comma = data.find(b',')
+                if comma == -1:
+                    # Prefix not complete yet, wait for more input
+                    self._pending = data
+                    return b''
+                data = data[comma + 1:]
+            self._prefix_checked = True
+
+        usable = len(data) - (len(data) % 4)
+        self._pending = data[usable:]
+        return self._decode(data[:usable])
+
+    def finish(self) -> bytes:
+        """Decode whatever is left once the input is exhausted"""
+        if not self._prefix_checked and self._pending.startswith(b'data:'):
+            raise UploadError('Invalid base64 image data')
+
+        data, self._pending = self._pending, b''
+        if len(data) % 4:
+            # Tolerate clients that drop the trailing padding
+            data += b'=' * (4 - len(data) % 4)
+        return self._decode(data)
+
+    @staticmethod
+    def _decode(data: bytes) -> bytes:
+        if not data:
+            return b''
+        try:
+            return base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise UploadError('Invalid base64 image data') from e
+
+
+class _FileSink:
+    """Write decoded chunks to a store temp file, hashing and size-checking as we go"""
+
+    def __init__(self, store, max_bytes: int):
+        self.store = store
+        self.tmp_path = store.temp_path()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = open(self.tmp_path, 'wb')
+
+    def write(self, chunk: bytes):
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadError(
+                f'Image exceeds the maximum upload size of {self.max_bytes} bytes',
+                status_code=413
+            )
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self, filename: str) -> IngestedUpload:
+        """Move the finished file into the store under its digest"""
+        self._file.close()
+        stored = self.store.put(self.tmp_path, self._hash.hexdigest(), self.size, filename)
+        return IngestedUpload(stored.upload_id, stored.filepath, filename, stored.size, stored.sha256)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def upload_mode(req) -> str:
+    """Pick the ingest mode for a request based on its Content-Type"""
+    mimetype = req.mimetype or ''
+
+    if req.is_json:
+        return MODE_JSON
+    if mimetype == 'multipart/form-data':
+        return MODE_MULTIPART
+    if mimetype == 'application/octet-stream' or mimetype.startswith('image/'):
+        return MODE_BINARY
+    if mimetype in BASE64_MIMETYPES:
+        return MODE_BASE64
+
+    raise UploadError(
+        f'Unsupported Content-Type "{mimetype}". Use application/json, multipart/form-data, '
+        'application/octet-stream or text/plain (base64).',
+        status_code=415
+    )
+
+
+def upload_params(req, mode: str) -> Dict:
+    """
+    Collect the edit parameters (prompt, filename, seed, ...) for a request
+
+    JSON bodies carry them alongside the image, multipart bodies as form
+    fields, and raw bodies as query string arguments.
+    """
+    if mode == MODE_JSON:
+        return req.get_json() or {}
+    if mode == MODE_MULTIPART:
+        params = req.form.to_dict()
+        params.update({k: v for k, v in req.args.items() if k not in params})
+        return params
+    return req.args.to_dict()
+
+
+def has_image(req, mode: str, params: Dict) -> bool:
+    """Check whether the request carries an image body at all"""
+    if mode == MODE_JSON:
+        return bool(params.get('image'))
+    if mode == MODE_MULTIPART:
+        return 'image' in req.files
+    # Chunked bodies have no Content-Length, an empty body is caught while streaming
+    return req.content_length != 0
+
+
+def resolve_filename(req, mode: str, params: Dict, default: str) -> str:
+    """Pick a safe filename to record for the upload"""
+    filename = params.get('filename')
+    if not filename and mode == MODE_MULTIPART:
+        filename = req.files['image'].filename
+    return secure_filename(filename or '') or default
+
+
+def save_upload(req, mode: str, params: Dict, store, filename: str,
+                chunk_size: Optional[int] = None,
+                max_bytes: Optional[int] = None) -> IngestedUpload:
+    """
+    Stream the image body of a request into the upload store
+
+    Args:
+        req: Flask request
+        mode: Ingest mode from upload_mode()
+        params: Parameters from upload_params()
+        store: BlobStore to write the image to
+        filename: Client filename to record (already sanitized)
+        chunk_size: Override for UPLOAD_CHUNK_SIZE
+        max_bytes: Override for MAX_UPLOAD_BYTES
+
+    Returns:
+        IngestedUpload: Upload id, blob path, size and SHA-256 digest
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+
+    sink = _FileSink(store, max_bytes)
+
+    try:
+        if mode == MODE_JSON:
+            _decode_base64_text(params['image'], sink, chunk_size)
+        elif mode == MODE_MULTIPART:
+            _copy_stream(req.files['image'].stream, sink, chunk_size)
+        elif mode == MODE_BINARY:
+            _copy_stream(req.stream, sink, chunk_size)
+        else:
+            _decode_base64_stream(req.stream, sink, chunk_size)
+
+        if sink.size == 0:
+            raise UploadError('No image data provided')
+
+        upload = sink.commit(filename)
+    except Exception:
+        sink.abort()
+        raise
+
+    logger.info(f"Streamed {mode} upload {upload.upload_id} to {upload.filepath} ({upload.size} bytes)")
+    return upload
+
+
+def save_base64_image(text: str, store, filename: str,
+                      chunk_size: Optional[int] = None,
+                      max_bytes: Optional[int] = None) -> IngestedUpload:
+    """
+    Decode a base64 image string (optionally a data URL) into the upload store
+
+    Used for images embedded in JSON bodies, e.g. the batch endpoint.
+
+    Returns:
+        IngestedUpload: Upload id, blob path, size and SHA-256 digest
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+
+    sink = _FileSink(store, max_bytes)
+
+    try:
+        _decode_base64_text(text, sink, chunk_size)
+        if sink.size == 0:
+            raise UploadError('No image data provided')
+        return sink.commit(filename)
+    except Exception:
+        sink.abort()
+        raise
+
+
+def _copy_stream(stream, sink: _FileSink, chunk_size: int):
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        sink.write(chunk)
+
+
+def _decode_base64_stream(stream, sink: _FileSink, chunk_size: int):
+    decoder = Base64StreamDecoder()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        sink.write(decoder.feed(chunk))
+    sink.write(decoder.finish())
+
+
+def _decode_base64_text(text, sink: _FileSink, chunk_size: int):
+    """Decode a base64 string already held in memory without copying it whole"""
+    if not isinstance(text, str):
+        raise UploadError('Invalid base64 image data')
+
+    decoder = Base64StreamDecoder()
+    for start in range(0, len(text), chunk_size):
+        try:
+            chunk = text[start:start + chunk_size].encode('ascii')
+        except UnicodeEncodeError as e:
+            raise UploadError('Invalid base64 image data') from e
+        sink.write(decoder.feed(chunk))
+    sink.write(decoder.finish())
+
+
+def coerce_bool(value) -> bool:
+    """Interpret form/query string booleans ("true", "1", "yes")"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def coerce_int(value) -> Optional[int]:
+    """Interpret form/query string integers, keeping None as None"""
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError) as e:
+        raise UploadError(f'Invalid integer value: {value}') from e
@@ -0,0 +1,223 @@
+"""
+Webhook capture log
+Keeps recent /api/webhook captures in a per-worker ring buffer and appends
+every capture to size-rotated segment files with a fixed-width offset index,
+so recent deliveries can be paged through by sequence number
+"""
+
+import fcntl
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Directory holding <first_seq>.log / <first_seq>.idx segment pairs
+WEBHOOK_LOG_DIR = os.getenv('WEBHOOK_LOG_DIR', 'webhook_log')
+# A new segment is started once the current one reaches this size
+WEBHOOK_SEGMENT_BYTES = int(os.getenv('WEBHOOK_SEGMENT_BYTES', 64 * 1024 * 1024))
+# Oldest segments beyond this count are deleted on rotation
+WEBHOOK_MAX_SEGMENTS = int(os.getenv('WEBHOOK_MAX_SEGMENTS', 16))
+# Captures kept in memory per worker
+WEBHOOK_RING_SIZE = int(os.getenv('WEBHOOK_RING_SIZE', 1000))
+
+# Index entry: (offset, length) of a record in the .log file; entry n is sequence first_seq + n
+_INDEX_ENTRY = struct.Struct('<QI')
+
+
+class WebhookLog:
+    """
+    Append-only capture log shared by all workers on the instance
+
+    Appends take an exclusive flock on the log directory, so sequence numbers
+    are contiguous across workers. Each record is one JSON line; the .idx
+    file next to it maps a sequence number to its byte range with one
+    fixed-width entry per record, so lookups are plain arithmetic on a
+    memory-mapped index.
+    """
+
+    def __init__(self, directory: str = WEBHOOK_LOG_DIR,
+                 segment_bytes: int = WEBHOOK_SEGMENT_BYTES,
+                 max_segments: int = WEBHOOK_MAX_SEGMENTS,
+                 ring_size: int = WEBHOOK_RING_SIZE):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self._ring = deque(maxlen=ring_size)
+        self._ring_lock = threading.Lock()
+        self._append_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _segments(self) -> List[int]:
+        """First sequence numbers of the existing segments, oldest first"""
+        return sorted(
+            int(os.path.basename(path)[:-4])
+            for path in glob.glob(os.path.join(self.directory, '*.idx'))
+        )
+
+    def _paths(self, first_seq: int):
+        base = os.path.join(self.directory, f'{first_seq:020d}')
+        return f'{base}.log', f'{base}.idx'
+
+    def _segment_count(self, first_seq: int) -> int:
+        try:
+            return os.path.getsize(self._paths(first_seq)[1]) // _INDEX_ENTRY.size
+        except FileNotFoundError:
+            return 0
+
+    def latest_seq(self) -> int:
+        """Sequence number of the newest capture (0 if there is none)"""
+        segments = self._segments()
+        if not segments:
+            return 0
+        return segments[-1] + self._segment_count(segments[-1]) - 1
+
+    def append(self, capture: Dict) -> int:
+        """
+        Record a capture
+
+        Args:
+            capture: JSON-serializable capture (as returned by log_request)
+
+        Returns:
+            int: Its sequence number
+        """
+        with self._append_lock, open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            segments = self._segments()
+            if segments:
+                first_seq = segments[-1]
+                seq = first_seq + self._segment_count(first_seq)
+                if os.path.getsize(self._paths(first_seq)[0]) >= self.segment_bytes:
+                    first_seq = seq
+                    segments.append(first_seq)
+                    self._drop_old_segments(segments)
+            else:
+                first_seq = seq = 1
+
+            record = json.dumps({'seq': seq, **capture}, separators=(',', ':'), default=str).encode('utf-8') + b'\n'
+            log_path, index_path = self._paths(first_seq)
+            with open(log_path, 'ab') as log_file:
+                offset = log_file.tell()
+                log_file.write(record)
+            # The index entry is written last, so readers never see a half-written record
+            with open(index_path, 'ab') as index_file:
+                index_file.write(_INDEX_ENTRY.pack(offset, len(record)))
+
+        with self._ring_lock:
+            self._ring.append((seq, {'seq': seq, **capture}))
+        return seq
+
+    def _drop_old_segments(self, segments: List[int]):
+        for first_seq in segments[:-self.max_segments]:
+            for path in self._paths(first_seq):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            logger.info(f"Dropped webhook log segment starting at {first_seq}")
+
+    def recent(self, since: Optional[int] = None, limit: int = 50) -> Dict:
+        """
+        Page through captures in sequence order
+
+        Args:
+            since: Return captures after this sequence number (omit for the
+                newest `limit` captures)
+            limit: Maximum number of captures
+
+        Returns:
+            dict: captures, next_since (pass back as since), oldest_seq and latest_seq
+        """
+        segments = self._segments()
+        latest = self.latest_seq()
+        oldest = segments[0] if segments else 1
+        if since is None:
+            since = max(0, latest - limit)
+        # Captures before the oldest segment have been rotated away
+        since = max(since, oldest - 1)
+        last = min(latest, since + limit)
+
+        captures = self._from_ring(since + 1, last)
+        source = 'memory'
+        if captures is None:
+            captures = self._from_segments(since + 1, last)
+            source = 'segments'
+
+        return {
+            'captures': captures,
+            'next_since': captures[-1]['seq'] if captures else since,
+            'oldest_seq': oldest,
+            'latest_seq': latest,
+            'source': source
+        }
+
+    def _from_ring(self, first: int, last: int) -> Optional[List[Dict]]:
+        """The range from this worker's ring buffer, or None unless it holds all of it"""
+        if first > last:
+            return []
+        with self._ring_lock:
+            entries = [capture for seq, capture in self._ring if first <= seq <= last]
+        # Other workers' captures are interleaved, so only a gap-free range will do
+        if len(entries) != last - first + 1:
+            return None
+        return entries
+
+    def _from_segments(self, first: int, last: int) -> List[Dict]:
+        captures = []
+        segments = self._segments()
+        for i, first_seq in enumerate(segments):
+            end_seq = segments[i + 1] - 1 if i + 1 < len(segments) else last
+            if end_seq < first or first_seq > last:
+                continue
+            captures.extend(self._read_segment(first_seq, max(first, first_seq), min(last, end_seq)))
+        return captures
+
+    def _read_segment(self, first_seq: int, first: int, last: int) -> List[Dict]:
+        log_path, index_path = self._paths(first_seq)
+        try:
+            with open(index_path, 'rb') as index_file, open(log_path, 'rb') as log_file:
+                count = os.fstat(index_file.fileno()).st_size // _INDEX_ENTRY.size
+                last = min(last, first_seq + count - 1)
+                if count == 0 or first > last:
+                    return []
+
+                with mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index, \
+                        mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+                    captures = []
+                    for seq in range(first, last + 1):
+                        offset, length = _INDEX_ENTRY.unpack_from(index, (seq - first_seq) * _INDEX_ENTRY.size)
+                        captures.append(json.loads(log[offset:offset + length]))
+                    return captures
+        except FileNotFoundError:
+            # Segment rotated away while we were reading
+            return []
+
+    def stats(self) -> Dict:
+        segments = self._segments()
+        return {
+            'segments': len(segments),
+            'bytes': sum(os.path.getsize(self._paths(s)[0]) for s in segments if os.path.exists(self._paths(s)[0])),
+            'oldest_seq': segments[0] if segments else None,
+            'latest_seq': self.latest_seq(),
+            'ring_entries': len(self._ring)
+        }
+
+
+# Singleton instance
+_webhook_log = None
+
+
+def get_webhook_log() -> WebhookLog:
+    """Get or create the webhook capture log"""
+    global _webhook_log
+    if _webhook_log is None:
+        _webhook_log = WebhookLog()
+    return _webhook_log